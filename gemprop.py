@@ -15,20 +15,21 @@ from tkinter.font import Font       # Fuentes para labels
 from tkinter import ttk             # Objeto TreeView
 from tkinter.messagebox import *    # Diálogos en pantalla
 from datetime import datetime       # Obtención de fecha y hora actual
-from sqlite3 import Error           # Gestión de errores accediendo a la base de datos
-import sqlite3                      # Objetos de manejo de la base de datos
 import os                           # Método path
 import re                           # Expresiones regulares para campos numéricos
-import json                         # Materiales asociados a un producto
 import sys                          # Obtener nombre de la base de datos por la línea de comandos
 import platform                     # Identifica al sistema operativo usado
 from PIL import ImageTk, Image      # Imagen de la bandera mostrada en la esquina inferior-derecha
+import gemprop_motor as motor       # Modelo y controlador de la aplicación, independientes de tkinter
+from gemprop_motor import registrar_evento
+from gemprop_lista_virtual import crear_lista_virtual, lista_sincronizar, lista_actualizar_registros, lista_eliminar_registros, lista_mostrar_registro
 
 ###############################################################################
 # Variables globales de la aplicación
 ###############################################################################
 
 nombre_base_de_datos = "gemprop.db"
+perfil_de_conexion = "predeterminado"      # Ver motor.PERFILES_DE_CONEXION
 nombre_sistema_operativo = ""
 
 # Objeto principal tkinter
@@ -42,13 +43,15 @@ diccionario_materiales = {
     "descripcion": StringVar(),
     "stock_actual": IntVar(),
     "stock_reposicion": IntVar(),
-    "demora_reposicion": IntVar()
+    "demora_reposicion": IntVar(),
+    "cantidad_reposicion": IntVar()
 }
 
 # Edición de campos - Productos
 diccionario_productos = {
     "id": IntVar(),
-    "descripcion": StringVar()
+    "descripcion": StringVar(),
+    "tiempo_confeccion": IntVar()
 }
 
 # Variables para definir formatos visuales específicos a cada sistema operativo usado
@@ -69,16 +72,29 @@ treeview_materiales = None
 treeview_productos = None
 treeview_materiales_por_producto = None
 
+# Listas virtuales asociadas a los treeview de materiales y productos
+lista_materiales = None
+lista_productos = None
+
 # Objetos Combobox
 combobox_materiales = None
 combobox_productos = None
+TAMAÑO_DE_BUSQUEDA = 20             # Coincidencias mostradas en la lista desplegable de los combobox de búsqueda
+ids_por_combobox = {}               # Combobox -> ids de los registros mostrados en su lista desplegable, en el mismo orden
+
+# Ids de los materiales asociados directamente al producto seleccionado (ver productos_mostrar_materiales_asociados)
+ids_materiales_asociados = set()
+TECLAS_DE_NAVEGACION = ("Up", "Down", "Left", "Right", "Return", "Escape", "Tab", "Shift_L", "Shift_R", "Control_L", "Control_R")
 
 # Objetos Entry
 entry_cantidad_de_material = IntVar()
+entry_cantidad_de_producto = IntVar(value=1)
+texto_disponibilidad_de_producto = StringVar()
 
 # Base de datos
 conexion_bd = None
-cursor_bd = None
+trabajador_bd = None                # Hilo que ejecuta en segundo plano las operaciones lentas sobre la base de datos
+INTERVALO_TRABAJADOR_BD = 50        # Milisegundos entre cada entrega de resultados del trabajador a la ventana
 
 ###############################################################################
 # 1) MODELO
@@ -105,12 +121,6 @@ def aplicar_ajustas_por_sistema_operativo(nombre_sistema_operativo):
     fuente_titulo_2 = Font(font=('Arial', tamaños_fuentes[1]), weight='bold')
     fuente_normal = Font(font=('Arial', tamaños_fuentes[2]))
 
-def registrar_evento(texto):
-    # Muestra un mensaje de información en la consola, anteponiendo la fecha y hora del mismo
-    fecha_actual = datetime.now()
-    fecha_formateada = ("{}/{:02}/{:02} {}:{:02}:{:02}".format(fecha_actual.year, fecha_actual.month, fecha_actual.day, fecha_actual.hour, fecha_actual.minute, fecha_actual.second))
-    print(f"[{fecha_formateada}] {texto}")
-
 def mostrar_mensaje(argumentos):
     # Muestra un alerta con el título y mensaje recibidos
     # Si argumentos tiene 1 solo elemento, se lo usa como mensaje a mostrar
@@ -127,80 +137,6 @@ def mostrar_mensaje(argumentos):
         
     showinfo(title=titulo, message=mensaje)
 
-def abrir_base_de_datos(nombre_base_de_datos):
-    try:
-        conexion_bd = sqlite3.connect(nombre_base_de_datos)
-        registrar_evento(f"Se abrió la base de datos [{nombre_base_de_datos}]")
-        return conexion_bd
-    except sqlite3.Error as err:
-        registrar_evento(f"No se puede abrir la base de datos [{nombre_base_de_datos}]")
-        ventana_principal.quit()
-
-def crear_tabla_de_materiales(conexion_bd):
-    # Crea la tabla de materiales. Si esta ya existe en la base de datos, informa que fue encontrada.
-    if ejecutar_sentencia_sql(conexion_bd, "CREATE TABLE materiales (id integer PRIMARY KEY, descripcion text, stock_actual integer, stock_reposicion integer, demora_reposicion integer)") is None:
-        registrar_evento("La tabla 'materiales' ya existe en la base de datos")
-    else:
-        registrar_evento("La tabla 'materiales' fue creada satisfactoriamente en la base de datos")
-
-def crear_tabla_de_productos(conexion_bd):
-    # Crea la tabla de productos. Si esta ya existe en la base de datos, informa que fue encontrada.
-    if ejecutar_sentencia_sql(conexion_bd, "CREATE TABLE productos (id integer PRIMARY KEY, descripcion text)") is None:
-        registrar_evento("La tabla 'productos' ya existe en la base de datos")
-    else:
-        registrar_evento("La tabla 'productos' fue creada satisfactoriamente en la base de datos")
-
-def crear_tabla_de_materiales_por_producto(conexion_bd):
-    # Crea la tabla de materiales asociados a un producto. Si esta ya existe en la base de datos, informa que fue encontrada.
-    if ejecutar_sentencia_sql(conexion_bd, "CREATE TABLE materiales_por_producto (id_material integer, id_producto integer, cantidad_de_unidades integer)") is None:
-        registrar_evento("La tabla 'materiales_por_producto' ya existe en la base de datos")
-    else:
-        registrar_evento("La tabla 'materiales_por_producto' fue creada satisfactoriamente en la base de datos")
-
-def materiales_insertar_registro_material(conexion_bd):
-
-    sql = "INSERT INTO materiales(descripcion, stock_actual, stock_reposicion, demora_reposicion) VALUES (?, ?, ?, ?)"
-    
-    # Se convierte el diccionario de materiales a una tupla
-    datos_material = (diccionario_materiales["descripcion"].get(),
-                        diccionario_materiales["stock_actual"].get(),
-                        diccionario_materiales["stock_reposicion"].get(),
-                        diccionario_materiales["demora_reposicion"].get()
-                        )
-    if ejecutar_sentencia_sql(conexion_bd, sql, datos_material) is None:
-        return False
-    
-    return True
-
-def materiales_actualizar_registro_material(conexion_bd, id_material):
-    # Actualiza el registro de la base de datos cuyo ID coincide con el argumento id_material
-    datos_material = (diccionario_materiales["descripcion"].get(),
-                        diccionario_materiales["stock_actual"].get(),
-                        diccionario_materiales["stock_reposicion"].get(),
-                        diccionario_materiales["demora_reposicion"].get(),
-                        id_material
-                        )
-    sql = "UPDATE materiales SET descripcion=?, stock_actual=?, stock_reposicion=?, demora_reposicion=? WHERE id=?"
-    if ejecutar_sentencia_sql(conexion_bd, sql, datos_material) is None:
-        return False
-    
-    registrar_evento(f"Se actualizó el material con id={str(id_material)}")
-    return True
-
-
-def materiales_buscar_material(conexion_bd, id_material):
-    # Obtiene el registro de la base de datos cuyo ID coincide con el argumento id_material
-    sql = "SELECT * FROM materiales WHERE id = ?"
-    argumentos = (str(id_material),)
-    return ejecutar_consulta_sql(conexion_bd, sql, argumentos)
-
-
-def materiales_recuperar_materiales(conexion_bd):
-    # Lee todos los registros de la tabla de materiales
-    sql = "SELECT * FROM materiales ORDER BY id ASC"
-    return ejecutar_consulta_sql(conexion_bd, sql)
-
-
 def click_en_material(event):
     global treeview_materiales, diccionario_materiales
     if len(treeview_materiales.selection()) == 0:
@@ -213,9 +149,10 @@ def click_en_material(event):
     diccionario_materiales["stock_actual"].set(int(campos[1]))
     diccionario_materiales["stock_reposicion"].set(int(campos[2]))
     diccionario_materiales["demora_reposicion"].set(int(campos[3]))
+    diccionario_materiales["cantidad_reposicion"].set(int(campos[4]))
 
 def click_en_producto(event):
-    global conexion_bd, treeview_productos, diccionario_productos
+    global treeview_productos, diccionario_productos
 
     if len(treeview_productos.selection()) == 0:
         # Se hizo doble click en un área del treeview donde no hay un producto
@@ -224,154 +161,155 @@ def click_en_producto(event):
     diccionario_productos["id"].set(int(treeview_productos.item(producto)['text']))
     campos = treeview_productos.item(producto)['values']
     diccionario_productos["descripcion"].set(campos[0])
+    diccionario_productos["tiempo_confeccion"].set(int(campos[1]))
 
-    productos_mostrar_materiales_asociados(conexion_bd)
+    productos_mostrar_materiales_asociados()
 
-def productos_insertar_registro_producto(conexion_bd):
+def productos_mostrar_materiales_asociados():
+    global diccionario_productos
 
-    sql = "INSERT INTO productos(descripcion) VALUES (?)"
-    datos = (diccionario_productos["descripcion"].get(), )
-    return ejecutar_sentencia_sql(conexion_bd, sql, datos)
+    # La lectura de los materiales y subproductos asociados al producto seleccionado se ejecuta en el trabajador de base de datos,
+    # y continúa en productos_materiales_asociados_leidos()
+    id_producto = diccionario_productos["id"].get()
+    en_segundo_plano(productos_leer_materiales_asociados, id_producto, al_terminar=lambda asociados: productos_materiales_asociados_leidos(id_producto, asociados), lectura=True)
+
+def productos_leer_materiales_asociados(conexion_bd, id_producto):
+    # Se ejecuta en el trabajador de base de datos. Retorna los materiales asociados al producto y sus subproductos, cada uno
+    # con los materiales que aporta al producto según su explosión memorizada, o None si hubo un error
+    registros = motor.productos_recuperar_materiales_asociados(conexion_bd, id_producto)
+    subproductos = motor.productos_recuperar_subproductos_asociados(conexion_bd, id_producto)
+    if registros is None or subproductos is None:
+        return None
 
-def productos_recuperar_productos(conexion_bd):
-    # Lee todos los registros de la tabla de productos
-    sql = "SELECT * FROM productos ORDER BY id ASC"
-    registros = ejecutar_consulta_sql(conexion_bd, sql)
-    if registros is not None:
-        registrar_evento("Se recuperaron todos los registros de la tabla 'productos'")
-    
-    return registros
+    return registros, [(id_subproducto, descripcion_subproducto, cantidad_subproducto, motor.explosion_recuperar_materiales(conexion_bd, id_subproducto) or [])
+                       for id_subproducto, descripcion_subproducto, cantidad_subproducto in subproductos]
 
-def productos_asociar_material_a_producto(conexion_bd, descripcion_material, cantidad_material):
-    global treeview_materiales_por_producto
+def productos_materiales_asociados_leidos(id_producto, asociados):
+    global diccionario_productos, ids_materiales_asociados
 
-    sql = "SELECT id FROM materiales WHERE descripcion = ?"     # Se obtiene el id único del material seleccionado
-    resultado = ejecutar_consulta_sql(conexion_bd, sql, (descripcion_material,))
-    if resultado is None:
-        return False
-    id_material = int(resultado[0][0])
+    # Si mientras se leían se seleccionó otro producto, el resultado se descarta (la lectura del nuevo producto ya está encolada)
+    if asociados is None or id_producto != diccionario_productos["id"].get():
+        return
+    registros, subproductos = asociados
 
-    sql = "INSERT INTO materiales_por_producto(id_material, id_producto, cantidad_de_unidades) VALUES (?, ?, ?)"
-    datos = (id_material, diccionario_productos["id"].get(), cantidad_material)
-    resultado = ejecutar_sentencia_sql(conexion_bd, sql, datos)
-    if resultado is None:
-        return False
+    # Actualizar el treeview de materiales por productop
+    treeview_materiales_por_producto.delete(*treeview_materiales_por_producto.get_children())   # Se eliminan todos los elementos del treeview antes de refrescarloo
+    for registro in registros:
+        treeview_materiales_por_producto.insert("", "end", text=str(registro[0]), values=(registro[1], registro[2]))        
+    ids_materiales_asociados = {registro[0] for registro in registros}
 
-    # Actualizar el treeview de materiales usados por el producto
-    productos_mostrar_materiales_asociados(conexion_bd)
+    # Cada subproducto se muestra como una fila desplegable con los materiales que aporta al producto (según su explosión memorizada)
+    for id_subproducto, descripcion_subproducto, cantidad_subproducto, materiales_subproducto in subproductos:
+        fila_subproducto = treeview_materiales_por_producto.insert("", "end", iid=f"subproducto_{id_subproducto}", text=str(id_subproducto), values=(f"[Producto] {descripcion_subproducto}", cantidad_subproducto))
+        for id_material, descripcion_material, unidades in materiales_subproducto:
+            treeview_materiales_por_producto.insert(fila_subproducto, "end", text=str(id_material), values=(descripcion_material, unidades * cantidad_subproducto))
 
-    return True
+    # Si cambió el BOM o el stock de un material, la cantidad fabricable de los productos afectados ya fue recalculada por el motor
+    refrescar_disponibilidad()
 
+def pedidos_recuperar_productos():
+    global combobox_productos
 
-def productos_desasociar_material_del_producto(conexion_bd, descripcion_material):
-    global treeview_materiales_por_producto, diccionario_productos
+    # Rehacer la lista desplegable de productos según el texto escrito en el combobox
+    combobox_buscar(combobox_productos, motor.productos_buscar_por_texto)
 
-    sql = "SELECT id FROM materiales WHERE descripcion = ?"     # Se obtiene el id único del material seleccionado
-    resultado = ejecutar_consulta_sql(conexion_bd, sql, (descripcion_material,))
-    if resultado is None:
+def materiales_agregar_registro(conexion_bd, descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion):
+    # Se ejecuta en el trabajador de base de datos. Retorna el registro del material agregado, False si ya
+    # existe un material con la misma descripción (case sensitive), o None si hubo un error
+    existe = motor.materiales_existe_descripcion(conexion_bd, descripcion)
+    if existe is None:
+        return None
+    if existe:
         return False
-    id_producto = diccionario_productos["id"].get()
-    id_material = int(resultado[0][0])
 
-    sql = "DELETE FROM materiales_por_producto WHERE id_material = ? AND id_producto = ?"
-    datos = (id_material, id_producto)
-    resultado = ejecutar_sentencia_sql(conexion_bd, sql, datos)
-    if resultado is None:
-        return False
+    if not motor.materiales_insertar_registro_material(conexion_bd, descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion):
+        return None
+    id_material = motor.materiales_buscar_id_por_descripcion(conexion_bd, descripcion)
+    if id_material is None:
+        return None
 
-    # Actualizar el treeview de materiales usados por el producto
-    productos_mostrar_materiales_asociados(conexion_bd)
+    registros = motor.materiales_buscar_material(conexion_bd, id_material)
+    if not registros:
+        return None
+    return registros[0]
 
-    return True
+def materiales_actualizar_registro(conexion_bd, id_material, descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion):
+    # Se ejecuta en el trabajador de base de datos. Retorna el registro actualizado del material, False si el material
+    # no existe, o None si hubo un error
+    registros = motor.materiales_buscar_material(conexion_bd, id_material)
+    if registros is None:
+        return None
+    if not registros:
+        return False
 
+    if not motor.materiales_actualizar_registro_material(conexion_bd, id_material, descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion):
+        return None
+    registros = motor.materiales_buscar_material(conexion_bd, id_material)
+    if not registros:
+        return None
+    return registros[0]
 
-def productos_mostrar_materiales_asociados(conexion_bd):
-    global diccionario_productos
+def materiales_eliminar_registro(conexion_bd, id_material):
+    # Se ejecuta en el trabajador de base de datos. Retorna True si se eliminó el material, False si está asociado a algún
+    # producto (se verifica nuevamente, por si se asoció después de confirmar), o None si hubo un error
+    productos_asociados = motor.materiales_contar_productos_asociados(conexion_bd, id_material)
+    if productos_asociados is None:
+        return None
+    if productos_asociados > 0:
+        return False
 
-    # Obtener la lista actualizada de materiales asociados al producto
-    sql = "SELECT materiales.id AS id_material, materiales.descripcion AS descripcion_material, materiales_por_producto.cantidad_de_unidades "\
-        "FROM materiales INNER JOIN materiales_por_producto "\
-        "ON materiales.id = materiales_por_producto.id_material "\
-        "WHERE materiales_por_producto.id_producto = ?"
-    datos = (diccionario_productos["id"].get(), )
-    registros = ejecutar_consulta_sql(conexion_bd, sql, datos)
+    if not motor.materiales_eliminar_registro_material(conexion_bd, id_material):
+        return None
+    return True
 
-    # Actualizar el treeview de materiales por productop
-    treeview_materiales_por_producto.delete(*treeview_materiales_por_producto.get_children())   # Se eliminan todos los elementos del treeview antes de refrescarloo
-    for registro in registros:
-        treeview_materiales_por_producto.insert("", "end", text=str(registro[0]), values=(registro[1], registro[2]))        
-    registrar_evento("Se recuperaron todos los registros de la tabla 'materiales_por_producto'")
+def productos_agregar_registro(conexion_bd, descripcion, tiempo_confeccion):
+    # Se ejecuta en el trabajador de base de datos. Retorna el registro del producto agregado, False si ya existe un
+    # producto con la misma descripción (case sensitive), o None si hubo un error
+    existe = motor.productos_existe_descripcion(conexion_bd, descripcion)
+    if existe is None:
+        return None
+    if existe:
+        return False
 
-def pedidos_recuperar_productos(conexion_bd):
-    global combobox_productos
+    if motor.productos_insertar_registro_producto(conexion_bd, descripcion, tiempo_confeccion) is None:
+        return None
+    id_producto = motor.productos_buscar_id_por_descripcion(conexion_bd, descripcion)
+    if id_producto is None:
+        return None
 
-    # Recuperar la lista de productos
-    tabla_de_productos = productos_recuperar_productos(conexion_bd)
-    productos = []
-    for registro_de_producto in tabla_de_productos:
-        productos.append(registro_de_producto[1])
-    combobox_productos['values'] = productos
+    registros = motor.productos_buscar_producto(conexion_bd, id_producto)
+    if not registros:
+        return None
+    return registros[0]
 
 def pedidos_actualizar_stock():
     if not askyesno("Actualizar Stock", "Confirma la actualización de stock de materiales?"):
         return False
-    
-    sql = "UPDATE materiales SET stock_actual = (stock_actual + 10) WHERE stock_actual < stock_reposicion"
-    materiales_actualizados = ejecutar_sentencia_sql(conexion_bd, sql)
-    if materiales_actualizados == 0:
+
+    # La reposición se ejecuta en segundo plano; si se confirma varias veces antes de que se ejecute, se aplica una sola vez
+    en_segundo_plano(motor.pedidos_actualizar_stock, al_terminar=pedidos_stock_actualizado, clave="pedidos_actualizar_stock")
+    return True
+
+def pedidos_stock_actualizado(reposicion):
+    # Recibe el resultado de la actualización de stock (recepción y emisión de órdenes de compra) ejecutada por el trabajador de base de datos
+    if reposicion is None:
+        mostrar_mensaje(["Actualización de Stock", "No se pudo actualizar el stock de materiales. Verifique que no haya un bloqueo de registros en la base de datos."])
+        return False
+    if reposicion["ordenes_recibidas"] == 0 and reposicion["ordenes_emitidas"] == 0:
         mostrar_mensaje(["Actualización de Stock", "Proceso finalizado. No se han encontrado materiales que requieran actualización de stock."])
         return True
 
-    # Actualizar el treeview con la lista de materiales del tab Gestión de Materiales
-    mostrar_lista_de_materiales(materiales_recuperar_materiales(conexion_bd))
+    # Actualizar el treeview con la lista de materiales del tab Gestión de Materiales, y la cantidad fabricable de los productos
+    if reposicion["ordenes_recibidas"] > 0:
+        en_segundo_plano(motor.materiales_recuperar_materiales, al_terminar=mostrar_lista_de_materiales, lectura=True)
+        refrescar_disponibilidad()
+        pedidos_mostrar_disponibilidad()
 
     # Mostrar mensaje de confirmación
-    mostrar_mensaje(["Actualización de Stock", f"Se ha actualizado el nivel de stock de {materiales_actualizados} material(es)."])
+    mostrar_mensaje(["Actualización de Stock", f"Se recibieron {reposicion['ordenes_recibidas']} orden(es) de compra con fecha de entrega cumplida.\n"
+                                               f"Se emitieron {reposicion['ordenes_emitidas']} orden(es) de compra de materiales por debajo de su nivel de reposición."])
     return True
 
-def ejecutar_consulta_sql(conexion_bd, consulta_sql, argumentos=None):
-    # IMPORTANTE: el argumento 'argumentos' es una tupla (aún si tiene un único argumento) con los valores a reemplazar en la consulta.
-    #             Si 'argumentos' == None (o no es provisto), entonces se ejecuta una consulta sin argumentos (ej. SELECT * from <tabla>)
-
-    # Esta función retorna un array conteniendo todos los registros recuperados de la consulta, o None si hubo un error en la consulta
-
-    try:
-        cursor = conexion_bd.cursor()
-        consulta = None
-        if argumentos is None:
-            consulta = cursor.execute(consulta_sql)
-        else:
-            consulta = cursor.execute(consulta_sql, argumentos)
-        registros = consulta.fetchall()
-        registrar_evento(f"Se ejecutó correctamente la siguiente consulta: {consulta_sql}")
-        return registros
-    except sqlite3.Error as err:
-        registrar_evento(f"Error ejecutando la siguiente consulta SQL: [{consulta_sql}]\nError: [{err.args[0]}]")
-    
-    return None
-
-def ejecutar_sentencia_sql(conexion_bd, sentencia_sql, argumentos=None):
-    # Esta función ejecuta cualquier sentencia SQL recibida que requiera un commit(), por ejemplo un INSERT, UPDATE o DELETE.
-    # Si 'argumentos' == None (o no es provisto) se intenta ejecutar solamente la sentencia SQL recibida, cuyos parámetros si los tiene debe enstar hardcodeados (por ejemplo DELETE FROM materiales WHERE id = 5)
-
-    try:
-        cursor = conexion_bd.cursor()
-        if argumentos is None:
-            cursor.execute(sentencia_sql)
-        else:
-            cursor.execute(sentencia_sql, argumentos)
-        conexion_bd.commit()
-
-        filas_afectadas = cursor.rowcount
-        registrar_evento(f"Se ejecutó la siguiente sentencia: [{sentencia_sql}].\nSe modificaron {filas_afectadas} fila(s).")
-        return filas_afectadas
-    except sqlite3.Error as err:
-        registrar_evento(f"Error ejecutando la siguiente sentencia SQL: [{sentencia_sql}]\nError: [{err.args[0]}]")
-    
-    return None
-
-
-
 ###############################################################################
 # 2) VISTA
 ###############################################################################
@@ -431,37 +369,80 @@ def crear_boton(objeto_padre, texto_boton=None, imagen_boton=None, posicion_x=-1
 
     return nuevo_boton
 
-def mostrar_lista_de_materiales(registros_tabla_de_materiales):
-    global treeview_materiales
+def formatear_fila_de_material(registro):
+    # Valores mostrados en el treeview de materiales para un registro de la tabla 'materiales'
+    return (registro[1], str(registro[2]), str(registro[3]), str(registro[4]), str(registro[5]))
 
-    for fila in treeview_materiales.get_children():
-        treeview_materiales.delete(fila)
+def formatear_fila_de_producto(registro):
+    # Valores mostrados en el treeview de productos para un registro de la tabla 'productos', con la cantidad fabricable
+    # si el registro la incluye (ver motor.disponibilidad_recuperar_productos); "-" si el producto no tiene materiales
+    if len(registro) < 4:
+        return (registro[1], str(registro[2]), "")
+    return (registro[1], str(registro[2]), "-" if registro[3] is None else str(registro[3]))
 
-    for registro in registros_tabla_de_materiales:
-        treeview_materiales.insert("", "end", 
-                                   text=str(registro[0]),
-                                   values=(
-                                   registro[1],
-                                   str(registro[2]),
-                                   str(registro[3]),
-                                   str(registro[4]))
-                                   )
+def mostrar_lista_de_materiales(registros_tabla_de_materiales):
+    global lista_materiales
 
-    
+    if registros_tabla_de_materiales is None:
+        return
+
+    # Se aplican solo las diferencias con la lista actual; el treeview muestra únicamente las filas visibles
+    lista_sincronizar(lista_materiales, registros_tabla_de_materiales)
 
 def mostrar_lista_de_productos(registros_tabla_de_productos):
-    global treeview_productos
+    global lista_productos
+
+    if registros_tabla_de_productos is None:
+        return
 
-    for fila in treeview_productos.get_children():
-        treeview_productos.delete(fila)
+    # Se aplican solo las diferencias con la lista actual; el treeview muestra únicamente las filas visibles
+    lista_sincronizar(lista_productos, registros_tabla_de_productos)
+
+def refrescar_disponibilidad():
+    # Vuelve a leer la cantidad fabricable de todos los productos; el motor la mantiene en memoria, por lo que la lectura
+    # no ejecuta consultas y solo se redibujan las filas cuya cantidad cambió
+    en_segundo_plano(motor.disponibilidad_recuperar_productos, al_terminar=mostrar_lista_de_productos, lectura=True)
+
+def pedidos_mostrar_disponibilidad(evento=None):
+    global combobox_productos, texto_disponibilidad_de_producto
+
+    # Muestra junto a la cantidad del pedido las unidades del producto seleccionado que pueden confeccionarse con el stock actual
+    id_producto = combobox_id_seleccionado(combobox_productos)
+    if id_producto is None:
+        texto_disponibilidad_de_producto.set("")
+        return
+    en_segundo_plano(motor.disponibilidad_de_productos, (id_producto,), al_terminar=lambda cantidades: pedidos_disponibilidad_leida(id_producto, cantidades), lectura=True)
+
+def pedidos_disponibilidad_leida(id_producto, cantidades):
+    global texto_disponibilidad_de_producto
+
+    if cantidades is None or id_producto not in cantidades:
+        texto_disponibilidad_de_producto.set("")
+    elif cantidades[id_producto] is None:
+        texto_disponibilidad_de_producto.set("El producto no tiene materiales asociados")
+    else:
+        texto_disponibilidad_de_producto.set(f"Pueden confeccionarse {cantidades[id_producto]} unidad(es) con el stock actual")
+
+def refrescar_materiales_en_segundo_plano(ids_materiales):
+    # Vuelve a leer solo los materiales indicados y actualiza sus filas en el treeview de materiales; la lectura la realiza el trabajador de base de datos
+    en_segundo_plano(motor.materiales_buscar_materiales, tuple(ids_materiales), al_terminar=lambda registros: lista_actualizar_registros(lista_materiales, registros or []), lectura=True)
+
+def en_segundo_plano(funcion, *argumentos, al_terminar=None, lectura=False, clave=None):
+    # Encola funcion(conexion_bd, *argumentos) en el trabajador de base de datos. 'al_terminar' recibe el resultado
+    # dentro del ciclo de eventos de tkinter (ver atender_trabajador_bd). Mientras haya trabajos pendientes se muestra el cursor de espera.
+    global trabajador_bd, ventana_principal
+
+    motor.trabajador_encolar(trabajador_bd, funcion, *argumentos, al_terminar=al_terminar, lectura=lectura, clave=clave)
+    ventana_principal.config(cursor="watch")
+
+def atender_trabajador_bd():
+    global trabajador_bd, ventana_principal
+
+    # Se reprograma antes de entregar los resultados, para seguir atendiendo al trabajador aunque un 'al_terminar' falle
+    ventana_principal.after(INTERVALO_TRABAJADOR_BD, atender_trabajador_bd)
+    if motor.trabajador_entregar_resultados(trabajador_bd) == 0:
+        ventana_principal.config(cursor="")
 
-    for registro in registros_tabla_de_productos:
-        treeview_productos.insert("", "end", 
-                                   text=str(registro[0]),
-                                   values=(
-                                   registro[1],)
-                                   )
-        
 def crear_ventana_principal(ventana_principal):
 
     global treeview_materiales
@@ -513,6 +494,7 @@ def crear_ventana_materiales(tabcontrol):
     crear_etiqueta(marco_materiales, "Stock Actual", posicion_x=10, posicion_y=40)
     crear_etiqueta(marco_materiales, "Nivel Reposición", posicion_x= 10, posicion_y=70)
     crear_etiqueta(marco_materiales, "Demora Reposición", posicion_x=10, posicion_y=100)
+    crear_etiqueta(marco_materiales, "Cantidad Reposición", posicion_x=270, posicion_y=70)
     crear_etiqueta(marco_materiales, "* Doble click para seleccionar el material", posicion_x=10, posicion_y=360).configure(font=Font(size=10))
 
     # Campos de texto
@@ -520,6 +502,7 @@ def crear_ventana_materiales(tabcontrol):
     crear_campo_de_texto(marco_materiales, variable_relacionada=diccionario_materiales["stock_actual"], posicion_x=150, posicion_y=40, ancho=5, acepta_solo_numeros=True)
     crear_campo_de_texto(marco_materiales, variable_relacionada=diccionario_materiales["stock_reposicion"], posicion_x=150, posicion_y=70, ancho=5, acepta_solo_numeros=True)
     crear_campo_de_texto(marco_materiales, variable_relacionada=diccionario_materiales["demora_reposicion"], posicion_x=150, posicion_y=100, ancho=5, acepta_solo_numeros=True)
+    crear_campo_de_texto(marco_materiales, variable_relacionada=diccionario_materiales["cantidad_reposicion"], posicion_x=420, posicion_y=70, ancho=5, acepta_solo_numeros=True)
 
     # Botones para administrar los campos de un material seleccionado o que se está dando de alta
     crear_boton(objeto_padre=marco_materiales, texto_boton="Limpiar", imagen_boton=None, posicion_x=700, posicion_y=10, ancho=ancho_boton_normal, alto=1, nombre_funcion=materiales_limpiar_campos, argumentos=None)
@@ -532,6 +515,7 @@ def crear_ventana_materiales(tabcontrol):
     crear_boton(objeto_padre=marco_materiales, texto_boton="?", imagen_boton=None, posicion_x=210, posicion_y=40, ancho=ancho_boton_ayuda, alto=1, nombre_funcion=mostrar_mensaje, argumentos=["Campo Stock Actual", "Cantidad de unidades en stock del material"])
     crear_boton(objeto_padre=marco_materiales, texto_boton="?", imagen_boton=None, posicion_x=210, posicion_y=70, ancho=ancho_boton_ayuda, alto=1, nombre_funcion=mostrar_mensaje, argumentos=["Campo Nivel Reposición", "Cuando el stock es menor o igual a esta cantidad, se realiza el pedido de reposición del material"])
     crear_boton(objeto_padre=marco_materiales, texto_boton="?", imagen_boton=None, posicion_x=210, posicion_y=100, ancho=ancho_boton_ayuda, alto=1, nombre_funcion=mostrar_mensaje, argumentos=["Campo Demora Reposición", "Número de días que debe esperarse para recibir el material una vez que se haya hecho el pedido de reposición"])
+    crear_boton(objeto_padre=marco_materiales, texto_boton="?", imagen_boton=None, posicion_x=480, posicion_y=70, ancho=ancho_boton_ayuda, alto=1, nombre_funcion=mostrar_mensaje, argumentos=["Campo Cantidad Reposición", "Cantidad de unidades que se solicitan al proveedor en cada orden de compra de reposición del material"])
     crear_boton(objeto_padre=marco_materiales, texto_boton="?", imagen_boton=None, posicion_x=780, posicion_y=10, ancho=ancho_boton_ayuda, alto=1, nombre_funcion=mostrar_mensaje, argumentos=["Limpiar Formulario", "Elimina todos los campos de alta / baja / modificación / consulta de materiales"])
     crear_boton(objeto_padre=marco_materiales, texto_boton="?", imagen_boton=None, posicion_x=780, posicion_y=40, ancho=ancho_boton_ayuda, alto=1, nombre_funcion=mostrar_mensaje, argumentos=["Agregar Material", "Crea un nuevo material en la base de datos. Todos los campos del formulario deben haberse completado para poder dar de alta un nuevo material"])
     crear_boton(objeto_padre=marco_materiales, texto_boton="?", imagen_boton=None, posicion_x=780, posicion_y=70, ancho=ancho_boton_ayuda, alto=1, nombre_funcion=mostrar_mensaje, argumentos=["Actualizar Material", "Actualiza en la base de datos la información del material mostrado en el formulario de materiales"])
@@ -539,17 +523,19 @@ def crear_ventana_materiales(tabcontrol):
   
     # TreeView de materiales
     treeview_materiales = ttk.Treeview(marco_materiales)
-    treeview_materiales["columns"] = ("col1", "col2", "col3", "col4")
+    treeview_materiales["columns"] = ("col1", "col2", "col3", "col4", "col5")
     treeview_materiales.heading("#0", text="ID")
     treeview_materiales.heading("col1", text="Descripción")
     treeview_materiales.heading("col2", text="Stock Actual")
     treeview_materiales.heading("col3", text="Nivel de Reposición")
     treeview_materiales.heading("col4", text="Demora Reposición (días)")
+    treeview_materiales.heading("col5", text="Cantidad Reposición")
     treeview_materiales.column("#0", width=40, minwidth=40, anchor=N)
-    treeview_materiales.column("col1", width=300, minwidth=300, anchor=W)
-    treeview_materiales.column("col2", width=150, minwidth=150, anchor=N)
-    treeview_materiales.column("col3", width=150, minwidth=150, anchor=N)
-    treeview_materiales.column("col4", width=150, minwidth=150, anchor=N)
+    treeview_materiales.column("col1", width=250, minwidth=250, anchor=W)
+    treeview_materiales.column("col2", width=130, minwidth=130, anchor=N)
+    treeview_materiales.column("col3", width=130, minwidth=130, anchor=N)
+    treeview_materiales.column("col4", width=130, minwidth=130, anchor=N)
+    treeview_materiales.column("col5", width=130, minwidth=130, anchor=N)
     treeview_materiales.pack()
     treeview_materiales.place(x=10, y=150, width=830)
     treeview_materiales.bind("<Double-1>", click_en_material)
@@ -558,10 +544,11 @@ def crear_ventana_materiales(tabcontrol):
     scrollbar_materiales = Scrollbar(marco_materiales)
     scrollbar_materiales.pack(side=RIGHT, fill=Y)
     scrollbar_materiales.place(x=840, y=150, height=210, width=10)
-    scrollbar_materiales.config(command=treeview_materiales.yview)
-    treeview_materiales.config(yscrollcommand=scrollbar_materiales.set)
 
-    return treeview_materiales
+    # La lista virtual controla el scrollbar y solo crea en el treeview las filas visibles
+    lista_materiales = crear_lista_virtual(treeview_materiales, scrollbar_materiales, formatear_fila_de_material, filas_visibles=9)
+
+    return treeview_materiales, lista_materiales
 
 def crear_ventana_productos(tabcontrol):
 
@@ -573,6 +560,7 @@ def crear_ventana_productos(tabcontrol):
     
     # Etiquetas
     crear_etiqueta(marco_productos, "Descripción", posicion_x=10, posicion_y=10)
+    crear_etiqueta(marco_productos, "Confección (días)", posicion_x=10, posicion_y=35)
     crear_etiqueta(marco_productos, "Productos", posicion_x=10, posicion_y=60)
     crear_etiqueta(marco_productos, "Materiales usados por el producto", posicion_x=400, posicion_y=60)
     crear_etiqueta(marco_productos, "Material", posicion_x=10, posicion_y=300)
@@ -581,6 +569,7 @@ def crear_ventana_productos(tabcontrol):
 
     # Campos de texto
     crear_campo_de_texto(marco_productos, variable_relacionada=diccionario_productos["descripcion"], posicion_x=85, posicion_y=10, ancho=30).configure(justify=LEFT, bg='blue')
+    crear_campo_de_texto(marco_productos, variable_relacionada=diccionario_productos["tiempo_confeccion"], posicion_x=150, posicion_y=35, ancho=5, acepta_solo_numeros=True)
     crear_campo_de_texto(marco_productos, variable_relacionada=entry_cantidad_de_material, posicion_x=80, posicion_y=325, ancho=5, acepta_solo_numeros=True).configure(justify=CENTER)
 
     # Botones para administrar los campos de un producto seleccionado o que se está dando de alta
@@ -592,6 +581,7 @@ def crear_ventana_productos(tabcontrol):
 
     # Botones de ayuda
     crear_boton(objeto_padre=marco_productos, texto_boton="?", imagen_boton=None, posicion_x=370, posicion_y=10, ancho=ancho_boton_ayuda, alto=1, nombre_funcion=mostrar_mensaje, argumentos=["Campo Descripción", "Información descriptiva sobre el producto"])
+    crear_boton(objeto_padre=marco_productos, texto_boton="?", imagen_boton=None, posicion_x=210, posicion_y=35, ancho=ancho_boton_ayuda, alto=1, nombre_funcion=mostrar_mensaje, argumentos=["Campo Confección", "Número de días necesarios para confeccionar el producto, a partir de disponer en el almacén de todos los materiales necesarios"])
     crear_boton(objeto_padre=marco_productos, texto_boton="?", imagen_boton=None, posicion_x=510, posicion_y=10, ancho=ancho_boton_ayuda, alto=1, nombre_funcion=mostrar_mensaje, argumentos=["Limpiar Descripción", "Elimina el texto Descripción del formulario (esto no elimina el producto de la base de datos)"])
     crear_boton(objeto_padre=marco_productos, texto_boton="?", imagen_boton=None, posicion_x=660, posicion_y=10, ancho=ancho_boton_ayuda, alto=1, nombre_funcion=mostrar_mensaje, argumentos=["Agregar Producto", "Crea un nuevo producto en la base de datos."])
     crear_boton(objeto_padre=marco_productos, texto_boton="?", imagen_boton=None, posicion_x=800, posicion_y=10, ancho=ancho_boton_ayuda, alto=1, nombre_funcion=mostrar_mensaje, argumentos=["Eliminar Producto", "Elimina un producto y sus relaciones a materiales usados."])
@@ -600,11 +590,15 @@ def crear_ventana_productos(tabcontrol):
 
     # TreeView de productos
     treeview_productos = ttk.Treeview(marco_productos)
-    treeview_productos["columns"] = ("col1")
+    treeview_productos["columns"] = ("col1", "col2", "col3")
     treeview_productos.heading("#0", text="ID")
     treeview_productos.heading("col1", text="Producto")
+    treeview_productos.heading("col2", text="Confección")
+    treeview_productos.heading("col3", text="Disponible")
     treeview_productos.column("#0", width=30, minwidth=30, anchor=N)
-    treeview_productos.column("col1", width=350, minwidth=250, anchor=W)
+    treeview_productos.column("col1", width=180, minwidth=150, anchor=W)
+    treeview_productos.column("col2", width=70, minwidth=70, anchor=N)
+    treeview_productos.column("col3", width=70, minwidth=70, anchor=N)
     treeview_productos.pack()
     treeview_productos.place(x=10, y=80, width=350, height=210)
     treeview_productos.bind("<Double-1>", click_en_producto)
@@ -624,8 +618,7 @@ def crear_ventana_productos(tabcontrol):
     scrollbar_productos = Scrollbar(marco_productos)
     scrollbar_productos.pack(side=RIGHT, fill=Y)
     scrollbar_productos.place(x=360, y=80, width=10, height=210)
-    scrollbar_productos.config(command=treeview_productos.yview)
-    treeview_productos.config(yscrollcommand=scrollbar_productos.set)
+    lista_productos = crear_lista_virtual(treeview_productos, scrollbar_productos, formatear_fila_de_producto, filas_visibles=9)
     
     scrollbar_materiales_por_producto = Scrollbar(marco_productos)
     scrollbar_materiales_por_producto.pack(side=RIGHT, fill=Y)
@@ -633,11 +626,12 @@ def crear_ventana_productos(tabcontrol):
     scrollbar_materiales_por_producto.config(command=treeview_materiales_por_producto.yview)
     treeview_materiales_por_producto.config(yscrollcommand=scrollbar_materiales_por_producto.set)
 
-    # Combobox de materiales
-    combobox_materiales = ttk.Combobox(marco_productos, state='readonly', width=23)
+    # Combobox de materiales, con búsqueda incremental por descripción
+    combobox_materiales = ttk.Combobox(marco_productos, width=23)
     combobox_materiales.place(x=80, y=295)
+    crear_busqueda_en_combobox(combobox_materiales, motor.materiales_buscar_por_texto)
   
-    return treeview_productos, treeview_materiales_por_producto, combobox_materiales
+    return treeview_productos, lista_productos, treeview_materiales_por_producto, combobox_materiales
 
 def crear_ventana_pedidos(tabcontrol):
 
@@ -647,19 +641,26 @@ def crear_ventana_pedidos(tabcontrol):
     # 3 - Sección Productos
     marco_pedidos = crear_marco_etiqueta(tab_pedidos, "Gestión de Pedidos", posicion_x=0, posicion_y=20, ancho=860, alto=400)
 
-    # Combobox de productos en venta
-    combobox_productos = ttk.Combobox(marco_pedidos, state='readonly', width=23)
+    # Combobox de productos en venta, con búsqueda incremental por descripción
+    combobox_productos = ttk.Combobox(marco_pedidos, width=23)
     combobox_productos.place(x=80, y=20)
+    crear_busqueda_en_combobox(combobox_productos, motor.productos_buscar_por_texto)
+    combobox_productos.bind("<<ComboboxSelected>>", pedidos_mostrar_disponibilidad)
 
     # Etiquetas
     crear_etiqueta(marco_pedidos, "Productos", posicion_x=10, posicion_y=20)
+    crear_etiqueta(marco_pedidos, "Cantidad", posicion_x=10, posicion_y=55)
     crear_etiqueta(marco_pedidos, "PROCESO DE REPOSICIÓN DE PEDIDOS", posicion_x=10, posicion_y=150, fuente=fuente_titulo_2)
     crear_etiqueta(marco_pedidos, """
     Al presionar el botón 'Actualizar Stock' se ejecuta el proceso de actualización de stock de materiales.
-    La reposición se realiza sobre aquellos materiales cuyo stock actual sea inferior a su nivel de reposición.
-    Cada vez que se presiona el botón, el stock de materiales que se encuentre por debajo de su nivel de reposición
-    será incrementado en 10 unidades.
+    Primero se reciben las órdenes de compra cuya fecha de entrega ya se cumplió, y sus unidades ingresan al stock.
+    Luego se emite una orden de compra, por múltiplos de su cantidad de reposición, para cada material cuyo stock
+    sea inferior a su nivel de reposición y que no esté cubierto por órdenes pendientes de recibir.
     """, posicion_x=10, posicion_y=170, fuente=fuente_titulo_2).configure(justify=LEFT)
+    crear_etiqueta(marco_pedidos, "", posicion_x=180, posicion_y=55).configure(textvariable=texto_disponibilidad_de_producto)
+
+    # Campos de texto
+    crear_campo_de_texto(marco_pedidos, variable_relacionada=entry_cantidad_de_producto, posicion_x=80, posicion_y=55, ancho=5, acepta_solo_numeros=True)
 
     # Botones para administrar los campos de un producto seleccionado o que se está dando de alta
     crear_boton(objeto_padre=marco_pedidos, texto_boton="Calcular Pedido", imagen_boton=None, posicion_x=440, posicion_y=20, ancho=ancho_boton_xxl, alto=1, nombre_funcion=pedidos_procesar_pedido, argumentos=None)
@@ -668,18 +669,41 @@ def crear_ventana_pedidos(tabcontrol):
     # Botones de ayuda
     crear_boton(objeto_padre=marco_pedidos, texto_boton="?", imagen_boton=None, posicion_x=320, posicion_y=20, ancho=1, alto=1, nombre_funcion=mostrar_mensaje, argumentos=["Lista de Productos", "Permite seleccionar el producto sobre el cual se quiere planificar el tiempo en el cual el pedido estará listo"])
     crear_boton(objeto_padre=marco_pedidos, texto_boton="?", imagen_boton=None, posicion_x=570, posicion_y=20, ancho=1, alto=1, nombre_funcion=mostrar_mensaje, argumentos=["Calcular Pedido", "Verifica si existe demora para producir el pedido en función del stock de materiales disponibles"])
+    crear_boton(objeto_padre=marco_pedidos, texto_boton="?", imagen_boton=None, posicion_x=140, posicion_y=55, ancho=1, alto=1, nombre_funcion=mostrar_mensaje, argumentos=["Cantidad", "Cantidad de unidades del producto seleccionado que se incluyen en el pedido"])
  
     return combobox_productos
 
 def actualizar_combobox_de_materiales():
-    global conexion_bd, combobox_materiales
-
-    valores_combobox = []
-    materiales = materiales_recuperar_materiales(conexion_bd)
-    for id, material, stock, alerta, demora in materiales:
-        valores_combobox.append(material)
+    global combobox_materiales
+
+    # Rehacer la lista desplegable de materiales según el texto escrito en el combobox
+    combobox_buscar(combobox_materiales, motor.materiales_buscar_por_texto)
+
+def crear_busqueda_en_combobox(combobox, buscar):
+    # Búsqueda incremental: con cada tecla (y al desplegar la lista) el combobox muestra las primeras coincidencias del texto
+    # escrito, obtenidas con buscar(conexion_bd, texto, limite) del índice de palabras del catálogo, sin cargar la lista completa.
+    # La búsqueda se ejecuta en el trabajador de base de datos, por lo que una tecla nunca espera a la base de datos.
+    combobox.bind("<KeyRelease>", lambda evento: None if evento.keysym in TECLAS_DE_NAVEGACION else combobox_buscar(combobox, buscar))
+    combobox.configure(postcommand=lambda: combobox_buscar(combobox, buscar))
+
+def combobox_buscar(combobox, buscar):
+    # Encola la búsqueda del texto escrito en el combobox. Si al llegar el resultado el texto ya cambió, se descarta:
+    # la búsqueda encolada por la última tecla es la que completa la lista desplegable.
+    texto = combobox.get()
+    en_segundo_plano(buscar, texto, TAMAÑO_DE_BUSQUEDA, al_terminar=lambda registros: mostrar_en_combobox(combobox, registros) if combobox.get() == texto else None, lectura=True)
+
+def mostrar_en_combobox(combobox, registros):
+    # Muestra en la lista desplegable del combobox las descripciones de los registros recibidos, y recuerda sus ids
+    if registros is not None:
+        combobox['values'] = [registro[1] for registro in registros]
+        ids_por_combobox[str(combobox)] = [registro[0] for registro in registros]
 
-    combobox_materiales['values'] = valores_combobox
+def combobox_id_seleccionado(combobox):
+    # Retorna el id del registro seleccionado en el combobox (o cuyo texto se escribió completo), o None si no hay ninguno
+    posicion = combobox.current()
+    if posicion == -1:
+        return None
+    return ids_por_combobox[str(combobox)][posicion]
 
 def mostrar_version_aplicacion():
     mostrar_mensaje(["Acerca de", """
@@ -723,6 +747,7 @@ def materiales_limpiar_campos():
     diccionario_materiales["stock_actual"].set(0)
     diccionario_materiales["stock_reposicion"].set(0)
     diccionario_materiales["demora_reposicion"].set(0)
+    diccionario_materiales["cantidad_reposicion"].set(0)
 
 def formulario_de_materiales_correcto():
     global diccionario_materiales
@@ -744,8 +769,9 @@ def formulario_de_materiales_correcto():
     # Verificar que ningún número sea cero
     if diccionario_materiales["stock_actual"].get() == 0 or\
         diccionario_materiales["stock_reposicion"].get() == 0 or\
-        diccionario_materiales["demora_reposicion"].get() == 0:
-        mostrar_mensaje(["Error de datos", "Los valores de stock actual, nivel de reposición y unidades de reposición deben ser mayor a cero!"])
+        diccionario_materiales["demora_reposicion"].get() == 0 or\
+        diccionario_materiales["cantidad_reposicion"].get() == 0:
+        mostrar_mensaje(["Error de datos", "Los valores de stock actual, nivel, demora y cantidad de reposición deben ser mayor a cero!"])
         return False
 
     return True
@@ -757,28 +783,37 @@ def materiales_agregar_material():
     if not formulario_de_materiales_correcto():
         return False
 
-    # Verificar que no exista un material con la misma descripción (case sensitive)
-    sql = "SELECT COUNT(id) FROM materiales WHERE descripcion = ?"
-    datos = (diccionario_materiales["descripcion"].get(),)
-    registros_leidos = ejecutar_consulta_sql(conexion_bd, sql, datos)
-    if registros_leidos is not None:
-        if registros_leidos[0][0] > 0:
-            mostrar_mensaje(["Error", "El material ya existe en la base de datos"])
-            return False
+    # La verificación de que no exista un material con la misma descripción y el alta del registro
+    # se ejecutan en el trabajador de base de datos
+    descripcion = diccionario_materiales["descripcion"].get()
+    en_segundo_plano(materiales_agregar_registro,
+                     descripcion,
+                     diccionario_materiales["stock_actual"].get(),
+                     diccionario_materiales["stock_reposicion"].get(),
+                     diccionario_materiales["demora_reposicion"].get(),
+                     diccionario_materiales["cantidad_reposicion"].get(),
+                     al_terminar=lambda registro: materiales_material_agregado(descripcion, registro))
+    return True
 
-    # Cumplidas todas las validaciones, se procede a agregar el registro del nuevo material
-    if materiales_insertar_registro_material(conexion_bd):
-        registros = materiales_recuperar_materiales(conexion_bd)
-        mostrar_lista_de_materiales(registros)  # Actualizar el TreeView de materiales
-        materiales_limpiar_campos()             # Limpiar el formulario de materiales
-        actualizar_combobox_de_materiales()     # Rehacer la lista de materiales mostrada en el combobox de productos
-        registrar_evento(f"Se agregó el material [{diccionario_materiales['descripcion'].get()}] a la base de datos")
-        mostrar_mensaje(["El material fue agregado exitosamente a la base de datos!"])
-    else:
-        registrar_evento(f"Error agregando el material [{diccionario_materiales['descripcion'].get()}] a la base de datos")
+def materiales_material_agregado(descripcion, registro):
+    global lista_materiales
+
+    # Recibe el resultado del alta del material ejecutada por el trabajador de base de datos
+    if registro is False:
+        mostrar_mensaje(["Error", "El material ya existe en la base de datos"])
+        return False
+    if registro is None:
+        registrar_evento("Error agregando el material [{}] a la base de datos", descripcion, nivel=motor.ERROR)
         mostrar_mensaje(["Error", "No se pudo agregar el material a la base de datos"])
         return False
 
+    lista_actualizar_registros(lista_materiales, [registro])       # Agregar la fila del nuevo material al TreeView de materiales
+    lista_mostrar_registro(lista_materiales, registro[0])
+    materiales_limpiar_campos()             # Limpiar el formulario de materiales
+    # Rehacer la lista de materiales mostrada en el combobox de productos
+    actualizar_combobox_de_materiales()
+    registrar_evento("Se agregó el material [{}] a la base de datos", descripcion)
+    mostrar_mensaje(["El material fue agregado exitosamente a la base de datos!"])
     return True
 
 def materiales_actualizar_material():
@@ -795,27 +830,39 @@ def materiales_actualizar_material():
     except:
         return False    # Esta excepción se da si nunca se leyó un registro antes de querer actualizarlo
 
-    # Verificar si el usuario modificó algo, de otra manera no tiene sentido actualizar el registro sin cambios
-    registro = materiales_buscar_material(conexion_bd, id_material)
-    if registro is None:
+    # La verificación de que el material exista y su actualización se ejecutan en el trabajador de base de datos
+    en_segundo_plano(materiales_actualizar_registro,
+                     id_material,
+                     diccionario_materiales["descripcion"].get(),
+                     diccionario_materiales["stock_actual"].get(),
+                     diccionario_materiales["stock_reposicion"].get(),
+                     diccionario_materiales["demora_reposicion"].get(),
+                     diccionario_materiales["cantidad_reposicion"].get(),
+                     al_terminar=materiales_material_actualizado)
+    return True
+
+def materiales_material_actualizado(registro):
+    global lista_materiales
+
+    # Recibe el resultado de la actualización del material ejecutada por el trabajador de base de datos
+    if registro is False:
         return False    # Registro a actualizar no encontrado
+    if registro is None:
+        mostrar_mensaje(["Error", "No se pudo actualizar el material. Verifique que no haya un bloqueo de registros en la base de datos."])
+        return False
 
-    # Actualizar el material
-    if not materiales_actualizar_registro_material(conexion_bd, id_material):
-        return False    # No se pudo actualizar el material
-    
-    # Refrescar la lista de materiales para que se refleje el cambio
-    mostrar_lista_de_materiales(materiales_recuperar_materiales(conexion_bd))
+    # Refrescar la fila del material para que se refleje el cambio
+    lista_actualizar_registros(lista_materiales, [registro])
 
     # Refrescar la lista de materiales asociados a productos
-    productos_mostrar_materiales_asociados(conexion_bd)
+    productos_mostrar_materiales_asociados()
     actualizar_combobox_de_materiales()
     
     mostrar_mensaje(["Materiales", "El material fue actualizado correctamente!"])
     return True
 
 def materiales_eliminar_material():
-    global conexion_bd
+    global diccionario_materiales
 
     descripcion_material = diccionario_materiales["descripcion"].get()
     id_material = diccionario_materiales["id"].get()
@@ -825,9 +872,14 @@ def materiales_eliminar_material():
         mostrar_mensaje(["Error", "Debe seleccionar un material para poder borrarlo"])
         return False
     
-    # Verificar que el material no esté siendo usado por algún producto (de otra forma, este no puede eliminarse)
-    resultado = ejecutar_consulta_sql(conexion_bd, "SELECT COUNT(id_material) FROM materiales_por_producto WHERE id_material = ?", (id_material,))
-    if int(resultado[0][0]) > 0:
+    # Verificar que el material no esté siendo usado por algún producto (de otra forma, este no puede eliminarse). La consulta
+    # se ejecuta en el trabajador de base de datos, y continúa en materiales_productos_asociados_contados()
+    en_segundo_plano(motor.materiales_contar_productos_asociados, id_material,
+                     al_terminar=lambda productos_asociados: materiales_productos_asociados_contados(id_material, descripcion_material, productos_asociados), lectura=True)
+    return True
+
+def materiales_productos_asociados_contados(id_material, descripcion_material, productos_asociados):
+    if productos_asociados is None or productos_asociados > 0:
         mostrar_mensaje(["Error", "El material seleccionado está asociado a uno o mas productos y no puede eliminarse.\nElimine la relación del material con los productos e intente nuevamente."])
         return False
     
@@ -835,96 +887,115 @@ def materiales_eliminar_material():
     if not askyesno("Eliminar material", f"Confirma que desea eliminar el siguiente material?\n[{descripcion_material}]"):
         return False
     
-    # Eliminar el material
-    sql = "DELETE FROM materiales WHERE id = ?"
-    datos = (id_material,)
-    if ejecutar_sentencia_sql(conexion_bd, sql, datos) is not None:
-        mostrar_mensaje(["Material Eliminado", "El material seleccionado ha sido eliminado de la base de datos del sistema"])
-
-    # Actualizar el treeview de materiales y limpiar el formulario de material seleccionado
-    mostrar_lista_de_materiales(materiales_recuperar_materiales(conexion_bd))
+    # Eliminar el material en el trabajador de base de datos, y luego su fila del treeview de materiales
+    en_segundo_plano(materiales_eliminar_registro, id_material, al_terminar=lambda eliminado: materiales_material_eliminado(id_material, eliminado))
+    return True
+
+def materiales_material_eliminado(id_material, eliminado):
+    global lista_materiales
+
+    # Recibe el resultado de la eliminación del material ejecutada por el trabajador de base de datos
+    if eliminado is False:
+        mostrar_mensaje(["Error", "El material seleccionado está asociado a uno o mas productos y no puede eliminarse.\nElimine la relación del material con los productos e intente nuevamente."])
+        return False
+    if eliminado is None:
+        mostrar_mensaje(["Error", "No se pudo eliminar el material. Verifique que no haya un bloqueo de registros en la base de datos."])
+        return False
+
+    lista_eliminar_registros(lista_materiales, [id_material])
+
+    # Limpiar el formulario de material seleccionado
     materiales_limpiar_campos()
 
     actualizar_combobox_de_materiales()
 
+    mostrar_mensaje(["Material Eliminado", "El material seleccionado ha sido eliminado de la base de datos del sistema"])
     return True
 
 def productos_limpiar_campos():
     global diccionario_productos
     
-    # Limpia el campo descripción y el id asociado de la sección Productos
+    # Limpia los campos descripción y tiempo de confección, y el id asociado de la sección Productos
     diccionario_productos["id"].set(0)
     diccionario_productos["descripcion"].set("")
+    diccionario_productos["tiempo_confeccion"].set(0)
 
 def productos_agregar_producto():
-    global conexion_bd, diccionario_productos
+    global diccionario_productos
 
     # Verificar que se haya ingresado una descripción para el nuevo producto
     try:
-        valor_actual = diccionario_productos["descripcion"].get()
+        descripcion = diccionario_productos["descripcion"].get()
     except:
         mostrar_mensaje(["Error de datos", "La descripción es requerida para crear un nuevo producto"])
         return False
-    if len(diccionario_productos["descripcion"].get()) == 0:   # Verificar que se ingresó la descripción
+    if len(descripcion) == 0:   # Verificar que se ingresó la descripción
         mostrar_mensaje(["Error de datos", "La descripción es requerida para crear un nuevo producto"])
         return False
 
-    # Verificar que no exista un producto con la misma descripción (case sensitive)
-    sql = "SELECT COUNT(id) FROM productos WHERE descripcion = ?"
-    datos = (diccionario_productos["descripcion"].get(),)
-    resultado_consulta = ejecutar_consulta_sql(conexion_bd, sql, datos)
-    if resultado_consulta is not None and int(resultado_consulta[0][0]) > 0:
+    try:
+        tiempo_confeccion = diccionario_productos["tiempo_confeccion"].get()
+    except:
+        tiempo_confeccion = 0       # El campo está vacío, el producto se confecciona en el día
+
+    # Cumplidas todas las validaciones del formulario, la verificación de que no exista un producto con la misma descripción
+    # y el alta del registro se ejecutan en el trabajador de base de datos
+    en_segundo_plano(productos_agregar_registro, descripcion, tiempo_confeccion, al_terminar=lambda registro: productos_producto_agregado(descripcion, registro))
+    return True
+
+def productos_producto_agregado(descripcion, registro):
+    global lista_productos
+
+    # Recibe el resultado del alta del producto ejecutada por el trabajador de base de datos
+    if registro is False:
         mostrar_mensaje(["Error", "El producto ya existe en la base de datos"])
         return False
-
-    # Cumplidas todas las validaciones, se procede a agregar el registro del nuevo producto
-    if productos_insertar_registro_producto(conexion_bd) is not None:
-        registros = productos_recuperar_productos(conexion_bd)
-        mostrar_lista_de_productos(registros)  # Actualizar el TreeView de productos
-        productos_limpiar_campos()             # Limpiar el formulario de productos
-        registrar_evento(f"Se agregó el producto [{diccionario_productos['descripcion'].get()}] a la base de datos")
-        mostrar_mensaje(["El producto fue agregado exitosamente a la base de datos!"])
-    else:
-        registrar_evento(f"Error agregando el producto [{diccionario_productos['descripcion'].get()}] a la base de datos")
+    if registro is None:
+        registrar_evento("Error agregando el producto [{}] a la base de datos", descripcion, nivel=motor.ERROR)
         mostrar_mensaje(["Error", "No se pudo agregar el producto a la base de datos"])
         return False
 
+    lista_actualizar_registros(lista_productos, [registro])       # Actualizar el TreeView de productos
+    lista_mostrar_registro(lista_productos, registro[0])
+    refrescar_disponibilidad()
+    productos_limpiar_campos()             # Limpiar el formulario de productos
+
     # Actualizar la lista de productos en el combobox del tab de pedidos
-    pedidos_recuperar_productos(conexion_bd)
+    pedidos_recuperar_productos()
 
+    registrar_evento("Se agregó el producto [{}] a la base de datos", descripcion)
+    mostrar_mensaje(["El producto fue agregado exitosamente a la base de datos!"])
     return True
 
 def productos_asociar_material():
-    global conexion_bd, combobox_materiales, entry_cantidad_de_material, treeview_materiales_por_producto, diccionario_productos
+    global combobox_materiales, entry_cantidad_de_material, diccionario_productos
 
     # Primero se verifica que se haya seleccionado un producto y un material, y que se haya ingresado una cantidad de material
     if diccionario_productos["descripcion"].get() == "":
         mostrar_mensaje(['Atención', 'Debe seleccionar un producto antes de poder asociarle materiales'])
         return False
 
-    if combobox_materiales.current() == -1: # -1 significa que no hay nada seleccionado en el combo box
+    id_material = combobox_id_seleccionado(combobox_materiales)
+    if id_material is None:     # El texto escrito no corresponde a ningún material de la lista desplegable
         mostrar_mensaje(['Atención', 'Debe seleccionar un material de la lista desplegable de materiales'])
         return False
     if entry_cantidad_de_material.get() == 0:     # Se seleccionó un material pero no se indicó la cantidad a usar en el producto
         mostrar_mensaje(['Atención', 'Debe indicar la cantidad de unidades del material seleccionadoseleccionar un material de la lista desplegable de materiales'])
         return False
 
-    # Luego verificamos que el material (por su descripción) no se encuentre previamente agregado a la lista de materiales asociados
+    # Luego verificamos que el material no se encuentre previamente asociado al producto (la base de datos tampoco lo permite)
     material_seleccionado = combobox_materiales.get()
-    if len(treeview_materiales_por_producto.get_children()) > 0:   # Si hay materiales en el treeview
-        id_materiales_ya_asociados = treeview_materiales_por_producto.get_children()    # Se obtienen los id's de cada material previamente asociado al producto
-        for id_material in id_materiales_ya_asociados:
-            if treeview_materiales_por_producto.item(id_material)['values'][0] == material_seleccionado:          # Si devuelve True, se está intentando agregar un material previamente asociado al producto
-                mostrar_mensaje(['Atención', 'Este material ya se encuentra asociado al producto seleccionado'])
-                return False
+    if id_material in ids_materiales_asociados:
+        mostrar_mensaje(['Atención', 'Este material ya se encuentra asociado al producto seleccionado'])
+        return False
 
     # Confirmar que se quiere agregar el material
     if not askyesno("Asociar material", f"Confirma que desea asociar el siguiente material al producto seleccionado?\n\nProducto: [{diccionario_productos['descripcion'].get()}]\nMaterial: [{material_seleccionado}]"):
         return False
 
-    # Agregar el material y su cantidad al treeview de materiales asociados al producto
-    productos_asociar_material_a_producto(conexion_bd, material_seleccionado, entry_cantidad_de_material.get())
-    
+    # Asociar el material y su cantidad al producto en el trabajador de base de datos, y luego actualizar el treeview de materiales asociados
+    en_segundo_plano(motor.productos_asociar_material_a_producto, diccionario_productos["id"].get(), id_material, entry_cantidad_de_material.get(),
+                     al_terminar=lambda asociado: productos_bom_modificado(asociado, "No se pudo asociar el material al producto seleccionado"))
     return True
 
 def productos_desasociar_material():
@@ -934,19 +1005,41 @@ def productos_desasociar_material():
     if treeview_materiales_por_producto.item(treeview_materiales_por_producto.focus())['values'] == "":
         mostrar_mensaje(["Material no seleccionado", "Primero debe seleccionar un material de la listas de materiales asociados al producto"])
         return False
-    material_seleccionado = treeview_materiales_por_producto.item(treeview_materiales_por_producto.focus())['values'][0]
+    fila_seleccionada = treeview_materiales_por_producto.focus()
+    if treeview_materiales_por_producto.parent(fila_seleccionada) != "":   # Material aportado por un subproducto, no asociado directamente
+        mostrar_mensaje(["Material de un subproducto", "El material seleccionado forma parte de un subproducto. Para quitarlo, desasocie el subproducto del producto seleccionado"])
+        return False
+    material_seleccionado = treeview_materiales_por_producto.item(fila_seleccionada)['values'][0]
+
+    # Los subproductos se identifican en el treeview por su id de fila
+    if fila_seleccionada.startswith("subproducto_"):
+        if not askyesno("Desasociar subproducto", f"Confirma que desea desasociar el siguiente subproducto del producto seleccionado?\n\nProducto: [{diccionario_productos['descripcion'].get()}]\nSubproducto: [{material_seleccionado}]"):
+            return False
+        en_segundo_plano(motor.productos_desasociar_subproducto_del_producto, diccionario_productos["id"].get(), int(treeview_materiales_por_producto.item(fila_seleccionada)['text']),
+                         al_terminar=lambda desasociado: productos_bom_modificado(desasociado, "No se pudo desasociar el subproducto del producto seleccionado"))
+        return True
+
     # Confirmar la desasociación del material
 
     if not askyesno("Desasociar material", f"Confirma que desea desasociar el siguiente material del producto seleccionado?\n\nProducto: [{diccionario_productos['descripcion'].get()}]\nMaterial: [{material_seleccionado}]"):
         return False
     
-    # Eliminar la relación entre el material y el producto
-    productos_desasociar_material_del_producto(conexion_bd, material_seleccionado)
-    
+    # Eliminar la relación entre el material y el producto en el trabajador de base de datos
+    en_segundo_plano(motor.productos_desasociar_material_del_producto, diccionario_productos["id"].get(), int(treeview_materiales_por_producto.item(fila_seleccionada)['text']),
+                     al_terminar=lambda desasociado: productos_bom_modificado(desasociado, "No se pudo desasociar el material del producto seleccionado"))
+    return True
+
+def productos_bom_modificado(modificado, mensaje_de_error):
+    # Recibe el resultado de asociar o desasociar un material o subproducto, ejecutado por el trabajador de base de datos
+    if not modificado:
+        mostrar_mensaje(['Error', mensaje_de_error])
+        return False
+
+    productos_mostrar_materiales_asociados()    # Actualizar el treeview de materiales usados por el producto
     return True
 
 def productos_eliminar_producto():
-    global conexion_bd
+    global diccionario_productos
 
     descripcion_producto = diccionario_productos["descripcion"].get()
     id_producto = diccionario_productos["id"].get()
@@ -960,123 +1053,141 @@ def productos_eliminar_producto():
     if not askyesno("Eliminar producto", f"Confirma que desea eliminar el siguiente producto y sus relaciones con los materiales usados?\n[{descripcion_producto}]"):
         return False
     
-    # Eliminar la relación entre el producto y los materiales (si las hay)
-    sql = "DELETE FROM materiales_por_producto WHERE id_producto = ?"
-    datos = (id_producto,)
-    if ejecutar_sentencia_sql(conexion_bd, sql, datos) is None:
-        mostrar_mensaje(["Error", "Error eliminando materiales asociados al producto. Verifique que no haya un bloqueo de registros en la base de datos."])
-        return False
+    # Eliminar el producto y la relación entre el producto y los materiales (si las hay) en el trabajador de base de datos
+    en_segundo_plano(motor.productos_eliminar_registro_producto, id_producto, al_terminar=lambda eliminado: productos_producto_eliminado(id_producto, eliminado))
+    return True
 
-    # Eliminar el producto
-    sql = "DELETE FROM productos WHERE id = ?"
-    datos = (id_producto,)
-    if ejecutar_sentencia_sql(conexion_bd, sql, datos) is None:
-        mostrar_mensaje(["Error", "Error eliminando el producto. Verifique que no haya un bloqueo de registros en la base de datos."])
+def productos_producto_eliminado(id_producto, eliminado):
+    global diccionario_productos, lista_productos
+
+    # Recibe el resultado de la eliminación del producto ejecutada por el trabajador de base de datos
+    if not eliminado:
+        mostrar_mensaje(["Error", "Error eliminando el producto. Verifique que el producto no sea subconjunto de otros productos y que no haya un bloqueo de registros en la base de datos."])
         return False
 
-    # Refrescar el treeview de productos y el de materiales usados por producto
-    diccionario_productos["id"].set(0)
-    diccionario_productos["descripcion"].set("")
-    mostrar_lista_de_productos(productos_recuperar_productos(conexion_bd))      # Treeview de productos
-    productos_mostrar_materiales_asociados(conexion_bd)                         # Treeview de materiales asociados
+    # Refrescar el treeview de productos y el de materiales usados por producto
+    lista_eliminar_registros(lista_productos, [id_producto])                    # Treeview de productos
+    if diccionario_productos["id"].get() == id_producto:                        # Sigue seleccionado el producto eliminado
+        diccionario_productos["id"].set(0)
+        diccionario_productos["descripcion"].set("")
+        productos_mostrar_materiales_asociados()                                # Treeview de materiales asociados
 
     # Refrescar el combobox de productos en el tab de pedidos
-    pedidos_recuperar_productos(conexion_bd)
+    pedidos_recuperar_productos()
 
     mostrar_mensaje(["Producto Eliminado", "El producto seleccionado ha sido eliminado de la base de datos del sistema"])
     return True
 
 def pedidos_procesar_pedido():
-    global combobox_productos, conexion_bd
-    # Verificar que se seleccionó un producto en el combobox de productos
-    if combobox_productos.current() == -1:
+    global combobox_productos, conexion_bd, entry_cantidad_de_producto
+    # Verificar que se seleccionó un producto en el combobox de productos; el combobox conoce el id de cada producto que muestra
+    id_producto = combobox_id_seleccionado(combobox_productos)
+    if id_producto is None:     # El texto escrito no corresponde a ningún producto de la lista desplegable
         mostrar_mensaje(["Material no seleccionado", "Debe seleccionar un producto para calcular si existe demora en la entrega"])
         return False
-    producto_seleccionado = combobox_productos.get()
 
-    # El primer paso es obtener el id de producto en base a su descripción
-    sql = "SELECT id FROM productos WHERE descripcion = ?"
-    id_producto = int(ejecutar_consulta_sql(conexion_bd, sql, (producto_seleccionado,))[0][0])
-    
-    # El segundo paso requiere recuperar la información de los materiales utilizados para fabricar el producto, a fin de saber si hay stock suficiente de todos ellos.
-    # Se utiliza un JOIN entre 'materiales' y 'materiales_por_producto' para saber además cuántas unidades de cada material se requieren.
-    sql = """
-        SELECT m.id AS 'id_material', m.descripcion AS 'descripcion_material', m.stock_actual, r.cantidad_de_unidades AS 'unidades_necesarias', m.demora_reposicion, p.descripcion AS 'descripcion_producto'
-        FROM materiales m
-        INNER JOIN materiales_por_producto r
-        ON m.id = r.id_material
-        INNER JOIN productos p
-        ON r.id_producto = p.id
-        WHERE p.id = ?
-        """
-    datos = (id_producto,)
-    registros = ejecutar_consulta_sql(conexion_bd, sql, datos)
-
-    # Se analiza e informa si hay stock suficiente de todos los productos, o si se espera una demora para producir el producto solicitado
-    demora_planificada = False
-    demora_maxima = 0
-    for material in registros:
-        stock_actual = material[2]
-        stock_necesario = material[3]
-        if stock_actual < stock_necesario:   # Habrá una demora por al menos un material para el cual no hay stock suficiente
-            demora_planificada = True
-            demora_material_actual = material[4]
-            if demora_maxima < demora_material_actual:
-                demora_maxima = demora_material_actual
-    
+    # Verificar que se indicó la cantidad de unidades del producto
+    try:
+        cantidad_de_producto = entry_cantidad_de_producto.get()
+    except:
+        cantidad_de_producto = 0    # El campo está vacío
+    if cantidad_de_producto == 0:
+        mostrar_mensaje(["Cantidad no indicada", "Debe indicar la cantidad de unidades del producto a pedir"])
+        return False
+
+    # Se requiere recuperar la información de los materiales utilizados para fabricar el producto, a fin de saber si hay stock suficiente de todos ellos.
+    # El cálculo se ejecuta en el trabajador de base de datos, y continúa en pedidos_pedido_calculado()
+    en_segundo_plano(motor.pedidos_calcular_pedido_multiple, ((id_producto, cantidad_de_producto),), al_terminar=pedidos_pedido_calculado, lectura=True)
+    return True
+
+def pedidos_pedido_calculado(pedido):
+    if pedido is None:
+        mostrar_mensaje(["Error", "No se pudo calcular el pedido. Verifique que no haya un bloqueo de registros en la base de datos."])
+        return False
+    cantidad_de_producto = pedido["lineas"][0][1]
+
     # Se evalúa si puede producirse en tiempo el producto, de otra forma se informa cuál será la espera total por el mismo
-    if demora_planificada and \
-        not askyesno("No hay stock suficiente", f"Hay una demora de {demora_maxima} día(s) para producir este producto. Continuar con el pedido?"):
+    fecha_entrega = pedido["fecha_entrega"].strftime("%d/%m/%Y")
+    if pedido["demora_planificada"] and \
+        not askyesno("No hay stock suficiente", f"Hay una demora de {pedido['demora_maxima']} día(s) para producir {cantidad_de_producto} unidad(es) de este producto.\nFecha de entrega: {fecha_entrega}. Continuar con el pedido?"):
+        motor.metricas_incrementar("gemprop_pedidos_rechazados_total", motivo="demora")
         return False
     
-    for material in registros:
-        id_material = material[0]
-        stock_actual = material[2]
-        stock_necesario = material[3]
-        nuevo_stock_actual = stock_actual - stock_necesario
-        sql = "UPDATE materiales SET stock_actual = ? WHERE id = ?"
-        datos = (nuevo_stock_actual, id_material)
-        if ejecutar_sentencia_sql(conexion_bd, sql, datos) is None:
-            registrar_evento(f"Error actualizando el material con id=[{id_material}]")
-        else:
-            registrar_evento(f"Stock de material actualizado - id=[{id_material}] - stock anterior=[{stock_actual}] - nuevo nivel de stock=[{nuevo_stock_actual}]")
-
-    # Actualizar el treeview de materiales del tab de materiales
-    mostrar_lista_de_materiales(materiales_recuperar_materiales(conexion_bd))
+    # La actualización del stock se ejecuta en el trabajador de base de datos, y continúa en pedidos_pedido_confirmado()
+    en_segundo_plano(motor.pedidos_confirmar_pedido, pedido, al_terminar=lambda confirmado: pedidos_pedido_confirmado(pedido, confirmado))
+    return True
+
+def pedidos_pedido_confirmado(pedido, confirmado):
+    if not confirmado:
+        mostrar_mensaje(["Error", "No se pudo generar el pedido, el stock de materiales no fue modificado. Verifique que no haya un bloqueo de registros en la base de datos."])
+        return False
+
+    # Actualizar en el treeview del tab de materiales solo los materiales usados por el pedido
+    refrescar_materiales_en_segundo_plano([material[0] for material in pedido["materiales"]])
+    refrescar_disponibilidad()
+    pedidos_mostrar_disponibilidad()
+    fecha_entrega = pedido["fecha_entrega"].strftime("%d/%m/%Y")
 
     # Informar sobre el procedimiento de pedido completado
-    mostrar_mensaje(["Pedido generado", "El pedido ha sido generado, y el stock de materiales usados por el producto fue actualizado"])
+    mostrar_mensaje(["Pedido generado", f"El pedido número {pedido['id_pedido']} ha sido generado, y el stock de materiales usados por el producto fue actualizado.\nFecha de entrega: {fecha_entrega}"])
 
     return True
 
 ###############################################################################
 
+# Los eventos se muestran por consola y se guardan en gemprop.log. El rastreo de cada consulta SQL
+# (muy verboso) se habilita definiendo la variable de entorno GEMPROP_RASTREO_SQL=1.
+motor.configurar_registro(archivo="gemprop.log", rastreo_sql=os.environ.get("GEMPROP_RASTREO_SQL") == "1")
+
 nombre_sistema_operativo = platform.system()
 if nombre_sistema_operativo == 'Darwin':
     nombre_sistema_operativo = 'MacOS'
 aplicar_ajustas_por_sistema_operativo(nombre_sistema_operativo)
-registrar_evento("Aplicación iniciada - Sistema operativo: " + nombre_sistema_operativo)
+registrar_evento("Aplicación iniciada - Sistema operativo: {}", nombre_sistema_operativo)
 
-# Conectarse a la base de datos y asegurar que existan las tablas necesarias
+# Conectarse a la base de datos y asegurar que su esquema esté actualizado
 # Por defecto, el nombre de la base de datos es gemprop.db, pero si se pasa un argumento por
 # línea de comandos entonces se utiliza ese argumento como nombre de base de datos.
+# Un segundo argumento indica el perfil de las conexiones (por ejemplo "concurrente", para compartir
+# la base de datos entre varias instancias de GEMPROP).
 if len(sys.argv) > 1:
     nombre_base_de_datos = sys.argv[1]
-conexion_bd = abrir_base_de_datos(nombre_base_de_datos)
-crear_tabla_de_materiales(conexion_bd)
-crear_tabla_de_productos(conexion_bd)
-crear_tabla_de_materiales_por_producto(conexion_bd)
+if len(sys.argv) > 2:
+    perfil_de_conexion = sys.argv[2]
+conexion_bd = motor.abrir_base_de_datos(nombre_base_de_datos, perfil_de_conexion)
+if conexion_bd is None:
+    sys.exit(1)
+if not motor.actualizar_esquema(conexion_bd):
+    registrar_evento("No se pudo actualizar el esquema de la base de datos [{}]", nombre_base_de_datos, nivel=motor.ERROR)
+    sys.exit(1)
+
+# Las operaciones que pueden demorar (cargas completas, pedidos, actualización de stock) se ejecutan en un hilo con
+# su propia conexión, de forma que un bloqueo de la base de datos no congele la ventana. Las búsquedas de los combobox
+# también se ejecutan allí: el trabajador construye los índices de búsqueda en cada conexión que atiende lecturas.
+trabajador_bd = motor.crear_trabajador(nombre_base_de_datos, perfil_de_conexion, preparar_lecturas=[motor.catalogo_preparar_busqueda])
+if trabajador_bd is None:
+    sys.exit(1)
+
+# Las métricas para Prometheus se publican en http://127.0.0.1:<puerto>/metrics si se define la variable de entorno
+# GEMPROP_METRICAS_PUERTO. El servidor atiende en su propio hilo, sin intervenir en el ciclo de eventos de la ventana.
+servidor_metricas = None
+if os.environ.get("GEMPROP_METRICAS_PUERTO"):
+    servidor_metricas = motor.metricas_iniciar_servidor(nombre_base_de_datos, perfil_de_conexion, int(os.environ["GEMPROP_METRICAS_PUERTO"]))
 
 # Crear las ventanas en de gestión
 tabcontrol = crear_ventana_principal(ventana_principal)
-treeview_materiales = crear_ventana_materiales(tabcontrol)
-treeview_productos, treeview_materiales_por_producto, combobox_materiales = crear_ventana_productos(tabcontrol)
+treeview_materiales, lista_materiales = crear_ventana_materiales(tabcontrol)
+treeview_productos, lista_productos, treeview_materiales_por_producto, combobox_materiales = crear_ventana_productos(tabcontrol)
 combobox_productos = crear_ventana_pedidos(tabcontrol)
-actualizar_combobox_de_materiales()
-
-mostrar_lista_de_materiales(materiales_recuperar_materiales(conexion_bd))
-mostrar_lista_de_productos(productos_recuperar_productos(conexion_bd))
-
-pedidos_recuperar_productos(conexion_bd)
 
-ventana_principal.mainloop()
\ No newline at end of file
+# Las cargas iniciales se realizan en segundo plano: la ventana se muestra mientras se leen las tablas
+en_segundo_plano(motor.materiales_recuperar_materiales, al_terminar=mostrar_lista_de_materiales, lectura=True)
+en_segundo_plano(motor.disponibilidad_recuperar_productos, al_terminar=mostrar_lista_de_productos, lectura=True)
+combobox_buscar(combobox_materiales, motor.materiales_buscar_por_texto)
+combobox_buscar(combobox_productos, motor.productos_buscar_por_texto)
+atender_trabajador_bd()
+
+ventana_principal.mainloop()
+motor.trabajador_detener(trabajador_bd)
+if servidor_metricas is not None:
+    motor.metricas_detener_servidor(servidor_metricas)
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+Lista virtual para objetos Treeview de tkinter
+
+Un Treeview con decenas de miles de filas tarda segundos en vaciarse y volver a llenarse. La lista
+virtual mantiene todos los registros en memoria (indexados por id) pero solo crea en el Treeview las
+filas de la ventana visible. El desplazamiento con la barra, la rueda del mouse o el teclado (flechas y
+avance o retroceso de página) solo mueve esa ventana.
+
+Las modificaciones se aplican por clave (alta, actualización o baja por id), de forma que el costo de
+refrescar la vista depende de la cantidad de cambios y del tamaño de la ventana, y no del tamaño de la tabla.
+Cada fila del Treeview usa el id del registro como identificador, por lo que la selección sigue al registro.
+"""
+
+from bisect import bisect_left, insort      # Lista ordenada de ids
+
+
+def crear_lista_virtual(treeview, scrollbar, formatear_fila, filas_visibles):
+    # Asocia una lista virtual al treeview y su scrollbar.
+    # 'formatear_fila' recibe un registro (cuyo primer campo es el id) y retorna la tupla 'values' de la fila del treeview.
+    lista = {
+        "treeview": treeview,
+        "scrollbar": scrollbar,
+        "formatear_fila": formatear_fila,
+        "filas_visibles": filas_visibles,
+        "registros": {},            # id -> valores formateados de la fila
+        "ids": [],                  # ids ordenados en forma ascendente
+        "desplazamiento": 0,        # Posición (en la lista de ids) de la primera fila visible
+        "filas_mostradas": {}       # id -> valores mostrados actualmente en el treeview
+    }
+
+    treeview.configure(height=filas_visibles)
+    scrollbar.config(command=lambda *argumentos: lista_desplazar(lista, *argumentos))
+    treeview.config(yscrollcommand=lambda *argumentos: None)    # La barra refleja la lista completa, no solo las filas creadas
+    treeview.bind("<MouseWheel>", lambda evento: lista_desplazar(lista, "scroll", -1 if evento.delta > 0 else 1, "units"))
+    treeview.bind("<Button-4>", lambda evento: lista_desplazar(lista, "scroll", -1, "units"))     # Rueda del mouse en Linux
+    treeview.bind("<Button-5>", lambda evento: lista_desplazar(lista, "scroll", 1, "units"))
+    treeview.bind("<Up>", lambda evento: lista_mover_foco(lista, -1))
+    treeview.bind("<Down>", lambda evento: lista_mover_foco(lista, 1))
+    treeview.bind("<Prior>", lambda evento: lista_mover_foco(lista, -filas_visibles))
+    treeview.bind("<Next>", lambda evento: lista_mover_foco(lista, filas_visibles))
+    return lista
+
+def lista_sincronizar(lista, registros):
+    # Aplica sobre la lista las diferencias con los registros recibidos (altas, actualizaciones y bajas por id)
+    formatear_fila = lista["formatear_fila"]
+    nuevos = {registro[0]: formatear_fila(registro) for registro in registros}
+    eliminados = [id_registro for id_registro in lista["registros"] if id_registro not in nuevos]
+    modificados = [registro for registro in registros if lista["registros"].get(registro[0]) != nuevos[registro[0]]]
+    lista_eliminar_registros(lista, eliminados, refrescar=False)
+    lista_actualizar_registros(lista, modificados)
+
+def lista_actualizar_registros(lista, registros, refrescar=True):
+    # Da de alta o actualiza los registros recibidos, identificados por su id
+    formatear_fila = lista["formatear_fila"]
+    for registro in registros:
+        id_registro = registro[0]
+        if id_registro not in lista["registros"]:
+            insort(lista["ids"], id_registro)
+        lista["registros"][id_registro] = formatear_fila(registro)
+    if refrescar:
+        _lista_refrescar(lista)
+
+def lista_eliminar_registros(lista, ids_registros, refrescar=True):
+    # Elimina de la lista los registros cuyos ids se reciben
+    for id_registro in ids_registros:
+        if lista["registros"].pop(id_registro, None) is not None:
+            posicion = bisect_left(lista["ids"], id_registro)
+            del lista["ids"][posicion]
+    if refrescar:
+        _lista_refrescar(lista)
+
+def lista_desplazar(lista, accion, cantidad, unidad=None):
+    # Atiende los comandos de la scrollbar ("moveto", fracción) y ("scroll", n, "units" | "pages")
+    total = len(lista["ids"])
+    if accion == "moveto":
+        desplazamiento = int(float(cantidad) * total)
+    elif unidad == "pages":
+        desplazamiento = lista["desplazamiento"] + int(cantidad) * lista["filas_visibles"]
+    else:
+        desplazamiento = lista["desplazamiento"] + int(cantidad)
+
+    desplazamiento = max(0, min(desplazamiento, total - lista["filas_visibles"]))
+    if desplazamiento != lista["desplazamiento"]:
+        lista["desplazamiento"] = desplazamiento
+        _lista_refrescar(lista)
+    return "break"      # Evita que el treeview procese además el evento de la rueda del mouse
+
+def lista_mover_foco(lista, filas):
+    # Atiende las flechas y el avance o retroceso de página: mueve el foco y la selección 'filas' registros (hacia arriba
+    # si es negativo) en la lista completa. Si el registro destino no está en la ventana visible, la ventana se desplaza
+    # lo mínimo necesario para mostrarlo, como con la scrollbar.
+    treeview = lista["treeview"]
+    ids = lista["ids"]
+    if not ids:
+        return "break"
+
+    foco = treeview.focus()
+    posicion = lista["desplazamiento"]
+    if foco and int(foco) in lista["registros"]:
+        posicion = bisect_left(ids, int(foco))
+    posicion = max(0, min(posicion + filas, len(ids) - 1))
+    if posicion < lista["desplazamiento"]:
+        lista["desplazamiento"] = posicion
+        _lista_refrescar(lista)
+    elif posicion >= lista["desplazamiento"] + lista["filas_visibles"]:
+        lista["desplazamiento"] = posicion - lista["filas_visibles"] + 1
+        _lista_refrescar(lista)
+
+    iid = str(ids[posicion])
+    treeview.focus(iid)
+    treeview.selection_set(iid)
+    return "break"      # Evita que el treeview mueva además el foco entre las filas creadas
+
+def lista_mostrar_registro(lista, id_registro):
+    # Desplaza la ventana visible para que el registro indicado quede a la vista
+    posicion = bisect_left(lista["ids"], id_registro)
+    if posicion < lista["desplazamiento"] or posicion >= lista["desplazamiento"] + lista["filas_visibles"]:
+        lista["desplazamiento"] = max(0, min(posicion, len(lista["ids"]) - lista["filas_visibles"]))
+        _lista_refrescar(lista)
+
+def _lista_refrescar(lista):
+    # Sincroniza las filas del treeview con la ventana visible: solo se eliminan, insertan, mueven o
+    # actualizan las filas que cambiaron, con un costo proporcional a la cantidad de filas visibles
+    treeview = lista["treeview"]
+    total = len(lista["ids"])
+    lista["desplazamiento"] = max(0, min(lista["desplazamiento"], total - lista["filas_visibles"]))
+    ids_visibles = lista["ids"][lista["desplazamiento"]:lista["desplazamiento"] + lista["filas_visibles"]]
+    filas_mostradas = lista["filas_mostradas"]
+
+    conjunto_visible = set(ids_visibles)
+    for id_registro in [id_registro for id_registro in filas_mostradas if id_registro not in conjunto_visible]:
+        treeview.delete(str(id_registro))
+        del filas_mostradas[id_registro]
+
+    for posicion, id_registro in enumerate(ids_visibles):
+        valores = lista["registros"][id_registro]
+        if id_registro not in filas_mostradas:
+            treeview.insert("", posicion, iid=str(id_registro), text=str(id_registro), values=valores)
+        else:
+            if filas_mostradas[id_registro] != valores:
+                treeview.item(str(id_registro), values=valores)
+            if treeview.index(str(id_registro)) != posicion:
+                treeview.move(str(id_registro), "", posicion)
+        filas_mostradas[id_registro] = valores
+
+    # Actualizar la barra de desplazamiento en función de la lista completa
+    if total == 0:
+        lista["scrollbar"].set(0, 1)
+    else:
+        lista["scrollbar"].set(lista["desplazamiento"] / total, (lista["desplazamiento"] + len(ids_visibles)) / total)
@@ -0,0 +1,129 @@
+"""
+GEMPROP - Motor de modelo y controlador
+
+Expone la lógica de materiales, productos y pedidos sin depender de tkinter, de forma que
+pueda usarse desde la vista de escritorio (gemprop.py), procesos batch, pruebas o benchmarks.
+Importar este paquete no crea ventanas ni abre la base de datos.
+"""
+
+from gemprop_motor.eventos import registrar_evento, configurar_registro, vaciar_registro, DEPURACION, INFO, ADVERTENCIA, ERROR
+from gemprop_motor.instrumentacion import (
+    instrumentacion_configurar,
+    instrumentacion_agregar_observador,
+    instrumentacion_quitar_observador,
+    instrumentacion_reiniciar,
+    instrumentacion_estadisticas,
+    instrumentacion_consultas_lentas
+)
+from gemprop_motor.metricas import (
+    PUERTO_PREDETERMINADO,
+    metricas_habilitar,
+    metricas_incrementar,
+    metricas_observar,
+    metricas_reiniciar,
+    metricas_exponer,
+    metricas_iniciar_servidor,
+    metricas_detener_servidor
+)
+from gemprop_motor.sql import PERFILES_DE_CONEXION, abrir_base_de_datos, ejecutar_consulta_sql, iterar_consulta_sql, ejecutar_sentencia_sql, ejecutar_sentencia_multiple_sql
+from gemprop_motor.esquema import VERSION_ESQUEMA, obtener_version_esquema, actualizar_esquema
+from gemprop_motor.materiales import (
+    materiales_insertar_registro_material,
+    materiales_actualizar_registro_material,
+    materiales_eliminar_registro_material,
+    materiales_buscar_material,
+    materiales_buscar_materiales,
+    materiales_buscar_por_texto,
+    materiales_buscar_id_por_descripcion,
+    materiales_existe_descripcion,
+    materiales_contar_productos_asociados,
+    materiales_recuperar_materiales
+)
+from gemprop_motor.productos import (
+    productos_insertar_registro_producto,
+    productos_actualizar_tiempo_confeccion,
+    productos_eliminar_registro_producto,
+    productos_recuperar_productos,
+    productos_buscar_producto,
+    productos_buscar_por_texto,
+    productos_buscar_id_por_descripcion,
+    productos_existe_descripcion,
+    productos_asociar_material_a_producto,
+    productos_desasociar_material_del_producto,
+    productos_recuperar_materiales_asociados,
+    productos_asociar_subproducto_a_producto,
+    productos_desasociar_subproducto_del_producto,
+    productos_recuperar_subproductos_asociados
+)
+from gemprop_motor.catalogo import catalogo_preparar_busqueda, catalogo_descartar
+from gemprop_motor.explosion import (
+    explosion_de_materiales,
+    explosion_de_productos,
+    explosion_recuperar_materiales,
+    explosion_invalidar_producto,
+    explosion_descartar
+)
+from gemprop_motor.disponibilidad import (
+    disponibilidad_de_productos,
+    disponibilidad_recuperar_productos,
+    disponibilidad_actualizar_materiales,
+    disponibilidad_descartar
+)
+from gemprop_motor.pedidos import (
+    pedidos_calcular_pedido,
+    pedidos_calcular_pedido_multiple,
+    pedidos_confirmar_pedido,
+    pedidos_procesar_pedido_multiple,
+    pedidos_actualizar_stock,
+    pedidos_recuperar_historial,
+    pedidos_recuperar_lineas,
+    pedidos_cambiar_estado
+)
+from gemprop_motor.reposicion import (
+    CANTIDAD_REPOSICION_PREDETERMINADA,
+    reposicion_emitir_ordenes,
+    reposicion_recibir_ordenes,
+    reposicion_recuperar_cola,
+    reposicion_recuperar_ordenes_pendientes
+)
+from gemprop_motor.movimientos import (
+    MOVIMIENTOS_POR_INSTANTANEA,
+    movimientos_registrar_instantanea,
+    movimientos_stock_a_la_fecha,
+    movimientos_recuperar_movimientos
+)
+from gemprop_motor.importacion import (
+    importar_leer_filas,
+    importar_materiales,
+    importar_materiales_por_producto
+)
+from gemprop_motor.exportacion import REPORTES, exportar_reporte
+from gemprop_motor.trabajador import (
+    crear_trabajador,
+    trabajador_encolar,
+    trabajador_entregar_resultados,
+    trabajador_detener
+)
+from gemprop_motor.atp import (
+    atp_cargar,
+    atp_proyeccion,
+    atp_registrar_movimiento,
+    atp_cotizar,
+    atp_cotizar_pedido,
+    atp_comprometer,
+    atp_descartar
+)
+from gemprop_motor.planificacion import (
+    planificacion_cargar,
+    planificacion_calcular,
+    planificacion_ejecutar,
+    planificacion_leer_demanda
+)
+from gemprop_motor.simulacion import (
+    simulacion_crear_instantanea,
+    simulacion_cargar,
+    simulacion_simular,
+    simulacion_simular_escenarios
+)
+from gemprop_motor.generador import DISTRIBUCIONES_DE_STOCK, generar_base_de_datos
+from gemprop_motor.rendimiento import OPERACIONES, rendimiento_medir, rendimiento_ejecutar, rendimiento_comparar
@@ -0,0 +1,190 @@
+"""
+Línea de comandos del motor de GEMPROP
+
+Permite ejecutar sin la ventana de la aplicación los procesos masivos del motor:
+    python -m gemprop_motor importar <base de datos> materiales|bom <archivo> [--rechazos <archivo>]
+    python -m gemprop_motor exportar <base de datos> <reporte> [archivo | -] [--formato csv|jsonl]
+    python -m gemprop_motor reponer <base de datos> [--fecha aaaa-mm-dd] [--listar]
+    python -m gemprop_motor planificar <base de datos> <archivo de demanda> [--fecha aaaa-mm-dd]
+    python -m gemprop_motor generar <base de datos> [--materiales N] [--productos N] [--semilla N] ...
+    python -m gemprop_motor medir <resultados.json> [--tamaños 1000x200,20000x4000] [--repeticiones N] [--comparar <anterior.json>]
+
+Los comandos que operan sobre una base de datos aceptan --consultas-lentas <milisegundos>, que informa con su
+plan de ejecución cada consulta que demore al menos ese tiempo (ver instrumentacion.py).
+"""
+
+import argparse                     # Argumentos de la línea de comandos
+from datetime import date           # Fecha de la reposición
+import sys                          # Salida estándar
+
+import gemprop_motor as motor
+
+
+def comando_importar(argumentos):
+    # Importa materiales o materiales por producto, mostrando el progreso en la consola
+    conexion_bd = abrir_base_de_datos_actualizada(argumentos)
+
+    def mostrar_progreso(resumen):
+        print(f"\r{resumen['leidas']} fila(s) leída(s), {resumen['importadas']} importada(s), {resumen['rechazadas']} rechazada(s) - {resumen['filas_por_segundo']:.0f} filas/s", end="", flush=True)
+
+    importar = motor.importar_materiales if argumentos.tipo == "materiales" else motor.importar_materiales_por_producto
+    resumen = importar(conexion_bd, argumentos.archivo, argumentos.formato, argumentos.lote, mostrar_progreso, argumentos.rechazos)
+    print()
+    if resumen is None:
+        return 1
+    for numero_de_fila, motivo in resumen["rechazos"]:
+        print(f"Fila {numero_de_fila}: {motivo}")
+    return 0
+
+def comando_exportar(argumentos):
+    # Exporta un reporte a un archivo o a la salida estándar
+    conexion_bd = abrir_base_de_datos_actualizada(argumentos)
+    destino = sys.stdout if argumentos.destino == "-" else argumentos.destino
+    if motor.exportar_reporte(conexion_bd, argumentos.reporte, destino, argumentos.formato) is None:
+        return 1
+    return 0
+
+def comando_reponer(argumentos):
+    # Lista la cola de reposición, o recibe las órdenes de compra vencidas y emite las nuevas (ver reposicion.py)
+    conexion_bd = abrir_base_de_datos_actualizada(argumentos)
+    if argumentos.listar:
+        cola = motor.reposicion_recuperar_cola(conexion_bd)
+        if cola is None:
+            return 1
+        for id_material, descripcion, stock_actual, stock_reposicion, pendiente, fecha_alta in cola:
+            print(f"{id_material}\t{descripcion}\tstock={stock_actual}\tnivel={stock_reposicion}\tpendiente={pendiente}\tdesde={fecha_alta}")
+        return 0
+
+    resultado = motor.pedidos_actualizar_stock(conexion_bd, argumentos.fecha)
+    if resultado is None:
+        return 1
+    print(f"{resultado['ordenes_recibidas']} orden(es) recibida(s), {resultado['ordenes_emitidas']} orden(es) emitida(s)")
+    return 0
+
+def comando_planificar(argumentos):
+    # Calcula los requerimientos de materiales de la demanda del archivo y lista los faltantes y las compras sugeridas
+    conexion_bd = abrir_base_de_datos_actualizada(argumentos)
+    demanda = motor.planificacion_leer_demanda(conexion_bd, argumentos.demanda, argumentos.formato)
+    if demanda is None:
+        return 1
+    resultado = motor.planificacion_ejecutar(conexion_bd, demanda, argumentos.fecha)
+    if resultado is None:
+        return 1
+
+    for id_material, bruto, stock_actual, pendiente, neto, faltante in resultado["faltantes"]:
+        print(f"faltante\t{id_material}\tbruto={bruto}\tstock={stock_actual}\tpendiente={pendiente}\tneto={neto}\tfaltante={faltante}")
+    for id_material, cantidad, fecha_entrega in resultado["compras_sugeridas"]:
+        print(f"compra\t{id_material}\tcantidad={cantidad}\tentrega={fecha_entrega.isoformat()}")
+    print(f"{resultado['materiales_requeridos']} material(es) requerido(s), {len(resultado['faltantes'])} con faltante, "
+          f"{len(resultado['compras_sugeridas'])} compra(s) sugerida(s) en {resultado['segundos']:.2f} s")
+    return 0
+
+def comando_generar(argumentos):
+    # Genera una base de datos sintética (ver generador.py)
+    resumen = motor.generar_base_de_datos(argumentos.base_de_datos, argumentos.materiales, argumentos.productos, argumentos.materiales_por_producto,
+                                          argumentos.subproductos_por_producto, argumentos.niveles, argumentos.stock, argumentos.stock_maximo, argumentos.semilla)
+    if resumen is None:
+        return 1
+    print(f"{resumen['materiales']} material(es), {resumen['productos']} producto(s), {resumen['materiales_por_producto']} asociación(es) de materiales, "
+          f"{resumen['subproductos_por_producto']} de subproductos en {resumen['segundos']:.1f} s")
+    return 0
+
+def comando_medir(argumentos):
+    # Mide las operaciones del motor en bases de datos sintéticas de cada tamaño y guarda los resultados (ver rendimiento.py)
+    resultados = motor.rendimiento_ejecutar(argumentos.resultados, argumentos.tamaños, argumentos.repeticiones, argumentos.directorio, argumentos.semilla)
+    if resultados is None:
+        return 1
+    for tamaño in resultados["tamaños"]:
+        for nombre, metricas in tamaño["operaciones"].items():
+            print(f"{tamaño['materiales']}x{tamaño['productos']}\t{nombre}\tp50={metricas['p50_ms']:.3f} ms\tp99={metricas['p99_ms']:.3f} ms\t"
+                  f"{metricas['operaciones_por_segundo']:.0f} op/s\tmemoria={metricas['memoria_pico_kib']:.0f} KiB\tsql={metricas['sentencias_sql']:.1f}")
+
+    if argumentos.comparar:
+        comparacion = motor.rendimiento_comparar(argumentos.comparar, resultados)
+        if comparacion is None:
+            return 1
+        for materiales, productos, nombre, p50_anterior, p50_nuevo, variacion in comparacion:
+            print(f"{materiales}x{productos}\t{nombre}\tp50 {p50_anterior:.3f} -> {p50_nuevo:.3f} ms\t{variacion:+.1f}%")
+    return 0
+
+def leer_tamaños(texto):
+    # Convierte "1000x200,20000x4000" en ((1000, 200), (20000, 4000))
+    try:
+        return tuple(tuple(int(valor) for valor in tamaño.split("x")) for tamaño in texto.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError("Los tamaños se indican como <materiales>x<productos> separados por comas")
+
+def abrir_base_de_datos_actualizada(argumentos):
+    # Abre la base de datos con el perfil indicado y actualiza su esquema; si no es posible finaliza el proceso
+    conexion_bd = motor.abrir_base_de_datos(argumentos.base_de_datos, argumentos.perfil)
+    if conexion_bd is None or not motor.actualizar_esquema(conexion_bd):
+        sys.exit(1)
+    return conexion_bd
+
+def crear_parser():
+    parser = argparse.ArgumentParser(prog="python -m gemprop_motor", description="Procesos masivos del motor de GEMPROP")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    importar = comandos.add_parser("importar", help="Importación de materiales o materiales por producto desde CSV o JSONL")
+    importar.add_argument("base_de_datos", help="Archivo de la base de datos SQLite")
+    importar.add_argument("tipo", choices=["materiales", "bom"], help="materiales, o bom (materiales por producto)")
+    importar.add_argument("archivo", help="Archivo .csv o .jsonl a importar")
+    importar.add_argument("--formato", choices=["csv", "jsonl"], help="Formato del archivo (por defecto, según su extensión)")
+    importar.add_argument("--lote", type=int, default=motor.importacion.TAMAÑO_DE_LOTE, help="Filas insertadas en cada transacción")
+    importar.add_argument("--rechazos", help="Archivo CSV donde se escriben las filas rechazadas")
+    importar.set_defaults(funcion=comando_importar)
+
+    exportar = comandos.add_parser("exportar", help="Exportación de reportes a CSV o JSONL")
+    exportar.add_argument("base_de_datos", help="Archivo de la base de datos SQLite")
+    exportar.add_argument("reporte", choices=list(motor.REPORTES), help="Reporte a exportar")
+    exportar.add_argument("destino", nargs="?", default="-", help="Archivo de destino, o - para la salida estándar")
+    exportar.add_argument("--formato", choices=["csv", "jsonl"], help="Formato de salida (por defecto, según la extensión del archivo, o csv)")
+    exportar.set_defaults(funcion=comando_exportar)
+
+    reponer = comandos.add_parser("reponer", help="Recepción y emisión de órdenes de compra de reposición")
+    reponer.add_argument("base_de_datos", help="Archivo de la base de datos SQLite")
+    reponer.add_argument("--fecha", type=date.fromisoformat, help="Fecha de la reposición, aaaa-mm-dd (por defecto la actual)")
+    reponer.add_argument("--listar", action="store_true", help="Solo lista los materiales de la cola de reposición")
+    reponer.set_defaults(funcion=comando_reponer)
+
+    planificar = comandos.add_parser("planificar", help="Planificación de requerimientos de materiales (MRP) de una demanda de productos")
+    planificar.add_argument("base_de_datos", help="Archivo de la base de datos SQLite")
+    planificar.add_argument("demanda", help="Archivo .csv o .jsonl con las columnas producto (descripción) y cantidad")
+    planificar.add_argument("--formato", choices=["csv", "jsonl"], help="Formato del archivo (por defecto, según su extensión)")
+    planificar.add_argument("--fecha", type=date.fromisoformat, help="Fecha de la planificación, aaaa-mm-dd (por defecto la actual)")
+    planificar.set_defaults(funcion=comando_planificar)
+
+    generar = comandos.add_parser("generar", help="Generación de una base de datos sintética para medir el rendimiento")
+    generar.add_argument("base_de_datos", help="Archivo de la base de datos SQLite a crear (no debe existir)")
+    generar.add_argument("--materiales", type=int, default=1000, help="Cantidad de materiales")
+    generar.add_argument("--productos", type=int, default=200, help="Cantidad de productos")
+    generar.add_argument("--materiales-por-producto", type=int, default=8, help="Materiales por producto, en promedio")
+    generar.add_argument("--subproductos-por-producto", type=int, default=1, help="Subproductos por producto, en promedio")
+    generar.add_argument("--niveles", type=int, default=3, help="Niveles del BOM")
+    generar.add_argument("--stock", default="uniforme", choices=list(motor.DISTRIBUCIONES_DE_STOCK), help="Distribución del stock actual de los materiales")
+    generar.add_argument("--stock-maximo", type=int, default=500, help="Stock actual máximo de los materiales")
+    generar.add_argument("--semilla", type=int, default=0, help="Semilla de la generación")
+    generar.set_defaults(funcion=comando_generar)
+
+    medir = comandos.add_parser("medir", help="Medición del rendimiento de las operaciones del motor en bases de datos sintéticas")
+    medir.add_argument("resultados", help="Archivo JSON donde se guardan los resultados")
+    medir.add_argument("--tamaños", type=leer_tamaños, default=motor.rendimiento.TAMAÑOS, help="Tamaños a medir, <materiales>x<productos> separados por comas")
+    medir.add_argument("--repeticiones", type=int, default=motor.rendimiento.REPETICIONES, help="Ejecuciones de cada operación")
+    medir.add_argument("--directorio", help="Directorio de las bases de datos sintéticas (se reutilizan si ya existen)")
+    medir.add_argument("--semilla", type=int, default=0, help="Semilla de la generación y de la elección de registros")
+    medir.add_argument("--comparar", help="Archivo JSON de una medición anterior con el cual comparar")
+    medir.set_defaults(funcion=comando_medir)
+
+    for subparser in (importar, exportar, reponer, planificar):
+        subparser.add_argument("--perfil", default="predeterminado", choices=list(motor.PERFILES_DE_CONEXION), help="Perfil de conexión a la base de datos")
+        subparser.add_argument("--consultas-lentas", type=float, metavar="MS", help="Informa las consultas que demoren al menos MS milisegundos, con su plan de ejecución")
+    return parser
+
+
+if __name__ == "__main__":
+    argumentos = crear_parser().parse_args()
+    # Por consola solo se muestran los problemas. Si el reporte se escribe en la salida estándar, los eventos no se muestran.
+    motor.configurar_registro(nivel=motor.ADVERTENCIA, consola=getattr(argumentos, "destino", None) != "-")
+    if getattr(argumentos, "consultas_lentas", None) is not None:
+        motor.instrumentacion_configurar(umbral_lento_ms=argumentos.consultas_lentas)
+    sys.exit(argumentos.funcion(argumentos))
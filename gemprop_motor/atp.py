@@ -0,0 +1,266 @@
+"""
+Disponible para prometer (ATP) y fecha de entrega de pedidos
+
+Implementa los requerimientos 3.1 y 3.2: la fecha de entrega de un producto es la fecha actual
+más su tiempo de confección (2.4) si hay stock de todos los materiales, o la mayor demora de
+reposición de los materiales faltantes más el tiempo de confección en caso contrario.
+
+Para poder cotizar muchos pedidos sin volver a leer las tablas, se mantiene en memoria una
+proyección por material, indexada por día (0 = fecha base de la proyección):
+- el stock disponible el día 0,
+- los movimientos futuros: reposiciones que ingresan (+) y consumos comprometidos por pedidos (-),
+- el stock proyectado al final de cada día con movimientos y, para cada uno de esos días, el mínimo
+  stock proyectado desde ese día en adelante.
+Ese mínimo no decrece con el día, por lo que el primer día a partir del cual se dispone en forma
+permanente de una cantidad se obtiene con una búsqueda binaria. Una cotización cuesta entonces
+O(materiales del BOM x log días) y no realiza consultas SQL una vez memorizada la explosión del producto.
+
+El cálculo de pedidos cotiza con la proyección memorizada de su conexión (ver atp_proyeccion), que se
+carga una vez por día y se mantiene como el catálogo: las escrituras del motor la actualizan en el momento
+(un pedido confirmado compromete su consumo, una orden de compra emitida ingresa el día de su entrega, una
+recepción o un ajuste modifican el stock del día 0) y los materiales y productos que modifican otras
+conexiones se vuelven a leer según el registro de cambios (ver sql.cambios_externos). Un pedido confirmado
+descuenta el stock en el momento (ver pedidos.py), por lo que su consumo se compromete el día 0: así la
+proyección memorizada coincide siempre con la que se cargaría de la base de datos.
+"""
+
+from bisect import bisect_left, insort      # Búsqueda binaria sobre los días de la proyección
+from datetime import date, timedelta        # Fecha base y fecha de entrega
+import json                         # Lista de ids enviada como un único parámetro de consulta
+import weakref                      # Memorias que se liberan junto con su conexión
+
+from gemprop_motor.eventos import registrar_evento, ADVERTENCIA
+from gemprop_motor.sql import ejecutar_consulta_sql, cambios_externos
+from gemprop_motor.explosion import explosion_de_materiales
+
+
+# Proyecciones memorizadas: conexión -> {"atp": proyección | None, "sincronizacion": cambios vistos de otras conexiones (ver sql.cambios_externos)}
+proyecciones_por_conexion = weakref.WeakKeyDictionary()
+
+
+def atp_cargar(conexion_bd, fecha_base=None):
+    # Construye la proyección de todos los materiales a partir de la base de datos.
+    # Retorna el diccionario de la proyección, o None si hubo un error.
+    productos = ejecutar_consulta_sql(conexion_bd, "SELECT id, tiempo_confeccion FROM productos")
+    if productos is None:
+        return None
+
+    atp = {
+        "conexion_bd": conexion_bd,
+        "fecha_base": fecha_base or date.today(),
+        "materiales": {},
+        "tiempos_de_confeccion": {id_producto: tiempo or 0 for id_producto, tiempo in productos}
+    }
+    if not _leer_materiales(atp, None):
+        return None
+
+    registrar_evento("Proyección ATP cargada: {} material(es), {} producto(s)", len(atp["materiales"]), len(productos))
+    return atp
+
+def _leer_materiales(atp, ids_materiales):
+    # Lee de la base de datos la proyección de los materiales indicados (o de todos), reemplazando la que tuvieran; los que
+    # ya no existen se quitan. Las órdenes de compra pendientes ingresan el día de su fecha de entrega (las atrasadas, el
+    # día 0). Retorna False si hubo un error.
+    sql_materiales = "SELECT id, stock_actual, demora_reposicion FROM materiales"
+    sql_ordenes = "SELECT id_material, cantidad, CAST(julianday(fecha_entrega) - julianday(?) AS integer) FROM ordenes_de_compra WHERE fecha_recepcion IS NULL"
+    argumentos = ()
+    if ids_materiales is not None:
+        ids_materiales = list(ids_materiales)
+        sql_materiales += " WHERE id IN (SELECT value FROM json_each(?))"
+        sql_ordenes += " AND id_material IN (SELECT value FROM json_each(?))"
+        argumentos = (json.dumps(ids_materiales),)
+    materiales = ejecutar_consulta_sql(atp["conexion_bd"], sql_materiales, argumentos)
+    ordenes = ejecutar_consulta_sql(atp["conexion_bd"], sql_ordenes, (atp["fecha_base"].isoformat(),) + argumentos)
+    if materiales is None or ordenes is None:
+        return False
+
+    for id_material in ids_materiales or ():
+        atp["materiales"].pop(id_material, None)
+    for id_material, stock_actual, demora_reposicion in materiales:
+        atp["materiales"][id_material] = _crear_proyeccion(stock_actual, demora_reposicion)
+    for id_material, cantidad, dia in ordenes:
+        atp_registrar_movimiento(atp, id_material, dia, cantidad)
+    return True
+
+def _leer_productos(atp, ids_productos):
+    # Lee de la base de datos el tiempo de confección de los productos indicados; los que ya no existen se quitan.
+    # Retorna False si hubo un error.
+    ids_productos = list(ids_productos)
+    productos = ejecutar_consulta_sql(atp["conexion_bd"], "SELECT id, tiempo_confeccion FROM productos WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(ids_productos),))
+    if productos is None:
+        return False
+
+    for id_producto in ids_productos:
+        atp["tiempos_de_confeccion"].pop(id_producto, None)
+    for id_producto, tiempo in productos:
+        atp["tiempos_de_confeccion"][id_producto] = tiempo or 0
+    return True
+
+def atp_proyeccion(conexion_bd):
+    # Retorna la proyección memorizada de la conexión, cargándola si es necesario (y cada vez que cambia el día), con los
+    # materiales y productos modificados por otras conexiones ya actualizados. Retorna None si hubo un error.
+    memoria = proyecciones_por_conexion.get(conexion_bd)
+    if memoria is None:
+        memoria = proyecciones_por_conexion[conexion_bd] = {"atp": None, "sincronizacion": {}}
+
+    cambios = cambios_externos(conexion_bd, memoria["sincronizacion"])
+    atp = memoria["atp"]
+    if atp is not None and (cambios is False or atp["fecha_base"] != date.today()):
+        atp = None
+    elif atp is not None and cambios:
+        ids_materiales = cambios.get("materiales", set()) | cambios.get("reposicion", set())
+        if (ids_materiales and not _leer_materiales(atp, ids_materiales)) or ("productos" in cambios and not _leer_productos(atp, cambios["productos"])):
+            atp = None
+
+    if atp is None:
+        atp = atp_cargar(conexion_bd)
+    memoria["atp"] = atp
+    return atp
+
+def atp_memorizada(conexion_bd):
+    # Retorna la proyección memorizada de la conexión si ya fue cargada, sin cargarla ni verificar cambios de otras
+    # conexiones, o None. La usan las escrituras del motor para actualizarla en el momento (write-through).
+    memoria = proyecciones_por_conexion.get(conexion_bd)
+    if memoria is None:
+        return None
+    return memoria["atp"]
+
+def atp_recargar_registros(conexion_bd, ids_materiales=(), ids_productos=()):
+    # Escritura write-through: vuelve a leer de la base de datos los materiales y productos indicados en la proyección
+    # memorizada de la conexión (si está cargada), por ejemplo luego de un alta o una baja. Si no pueden leerse, se descarta.
+    atp = atp_memorizada(conexion_bd)
+    if atp is None:
+        return
+
+    if (ids_materiales and not _leer_materiales(atp, ids_materiales)) or (ids_productos and not _leer_productos(atp, ids_productos)):
+        atp_descartar(conexion_bd)
+
+def atp_actualizar_demora(atp, id_material, demora_reposicion):
+    # Registra en la proyección la nueva demora de reposición del material
+    proyeccion = atp["materiales"].get(id_material)
+    if proyeccion is not None:
+        proyeccion["demora_reposicion"] = demora_reposicion
+
+def atp_descartar(conexion_bd):
+    # Descarta la proyección memorizada de la conexión; se vuelve a cargar en la próxima cotización
+    memoria = proyecciones_por_conexion.get(conexion_bd)
+    if memoria is not None:
+        memoria["atp"] = None
+
+def _crear_proyeccion(stock_actual, demora_reposicion):
+    # Proyección de un material sin movimientos futuros: el día 0 con el stock actual
+    return {
+        "demora_reposicion": demora_reposicion,
+        "dias": [0],                        # Días con movimientos, ordenados (siempre incluye el día 0)
+        "movimientos": [stock_actual],      # Cantidad neta que ingresa (+) o se consume (-) cada día
+        "proyectado": [stock_actual],       # Stock proyectado al final de cada día
+        "minimo_posterior": [stock_actual]  # Mínimo stock proyectado desde cada día en adelante
+    }
+
+def _recalcular_proyeccion(proyeccion):
+    # Recalcula el stock proyectado y los mínimos posteriores a partir de los movimientos
+    acumulado = 0
+    proyectado = []
+    for movimiento in proyeccion["movimientos"]:
+        acumulado += movimiento
+        proyectado.append(acumulado)
+
+    minimo_posterior = proyectado[:]
+    for i in range(len(minimo_posterior) - 2, -1, -1):
+        minimo_posterior[i] = min(minimo_posterior[i], minimo_posterior[i + 1])
+
+    proyeccion["proyectado"] = proyectado
+    proyeccion["minimo_posterior"] = minimo_posterior
+
+def atp_registrar_movimiento(atp, id_material, dia, cantidad):
+    # Registra en la proyección un movimiento del material: una reposición que ingresa el día indicado (cantidad positiva),
+    # un consumo comprometido por un pedido (cantidad negativa) o, el día 0, un cambio del stock actual
+    proyeccion = atp["materiales"].get(id_material)
+    if proyeccion is None:
+        registrar_evento("El material con id=[{}] no forma parte de la proyección ATP", id_material, nivel=ADVERTENCIA)
+        return False
+
+    dia = max(0, int(dia))
+    posicion = bisect_left(proyeccion["dias"], dia)
+    if posicion < len(proyeccion["dias"]) and proyeccion["dias"][posicion] == dia:
+        proyeccion["movimientos"][posicion] += cantidad
+    else:
+        insort(proyeccion["dias"], dia)
+        proyeccion["movimientos"].insert(posicion, cantidad)
+    _recalcular_proyeccion(proyeccion)
+    return True
+
+def atp_dia_disponible(proyeccion, unidades):
+    # Primer día a partir del cual se dispone en forma permanente de las unidades indicadas del material.
+    # Si la proyección nunca alcanza esas unidades, el material debe reponerse: llega luego de su demora de reposición.
+    # Si ya hay movimientos previstos que las cubren antes de esa demora, se toma el día más cercano.
+    posicion = bisect_left(proyeccion["minimo_posterior"], unidades)
+    if posicion == 0:
+        return 0
+    if posicion < len(proyeccion["dias"]):
+        return min(proyeccion["dias"][posicion], proyeccion["demora_reposicion"])
+
+    return proyeccion["demora_reposicion"]
+
+def atp_cotizar(atp, id_producto, cantidad=1):
+    # Cotiza la fecha de entrega de 'cantidad' unidades del producto (requerimientos 3.1 y 3.2). Ver atp_cotizar_pedido().
+    # Retorna la cotización con el producto y la cantidad, o None si hubo un error.
+    cotizacion = atp_cotizar_pedido(atp, [(id_producto, cantidad)])
+    if cotizacion is None:
+        return None
+
+    cotizacion.update(id_producto=id_producto, cantidad=cantidad)
+    return cotizacion
+
+def atp_cotizar_pedido(atp, lineas_de_pedido):
+    # Cotiza la fecha de entrega de un pedido de varios productos, con una lista de tuplas (id_producto, cantidad): las
+    # unidades de cada material se suman sobre todas las líneas, la confección comienza cuando se dispone de todos los
+    # materiales y los productos se confeccionan en paralelo. Retorna un diccionario con las unidades necesarias de cada
+    # material, el día en que se dispondrá de todos ellos, el mayor tiempo de confección, la fecha de entrega y los
+    # materiales que demoran el pedido, o None si hubo un error.
+    unidades_necesarias = {}
+    tiempo_confeccion = 0
+    for id_producto, cantidad in lineas_de_pedido:
+        explosion = explosion_de_materiales(atp["conexion_bd"], id_producto)
+        if explosion is None:
+            return None
+        for id_material, unidades in explosion.items():
+            unidades_necesarias[id_material] = unidades_necesarias.get(id_material, 0) + unidades * cantidad
+        tiempo_confeccion = max(tiempo_confeccion, atp["tiempos_de_confeccion"].get(id_producto, 0))
+
+    dia_materiales = 0
+    materiales_faltantes = []
+    for id_material, unidades in unidades_necesarias.items():
+        proyeccion = atp["materiales"].get(id_material)
+        if proyeccion is None:
+            registrar_evento("El material con id=[{}] no forma parte de la proyección ATP", id_material, nivel=ADVERTENCIA)
+            return None
+        dia = atp_dia_disponible(proyeccion, unidades)
+        if dia > 0:
+            materiales_faltantes.append(id_material)
+            if dia > dia_materiales:
+                dia_materiales = dia
+
+    dias_de_entrega = dia_materiales + tiempo_confeccion
+    return {
+        "lineas": list(lineas_de_pedido),
+        "unidades_necesarias": unidades_necesarias,
+        "dia_materiales": dia_materiales,
+        "tiempo_confeccion": tiempo_confeccion,
+        "dias_de_entrega": dias_de_entrega,
+        "fecha_entrega": atp["fecha_base"] + timedelta(days=dias_de_entrega),
+        "materiales_faltantes": materiales_faltantes
+    }
+
+def atp_comprometer(atp, id_producto, cantidad=1):
+    # Cotiza el pedido y compromete en la proyección el consumo de sus materiales, de forma que las cotizaciones siguientes
+    # tengan en cuenta este pedido. El consumo se registra el día 0, como el descuento de stock de pedidos_confirmar_pedido().
+    # Retorna la cotización, o None si hubo un error.
+    cotizacion = atp_cotizar(atp, id_producto, cantidad)
+    if cotizacion is None:
+        return None
+
+    for id_material, unidades in cotizacion["unidades_necesarias"].items():
+        atp_registrar_movimiento(atp, id_material, 0, -unidades)
+
+    return cotizacion
@@ -0,0 +1,253 @@
+"""
+Catálogo de materiales y productos en memoria
+
+Evita volver a leer las tablas 'materiales' y 'productos' en cada acción del controlador. Cada
+catálogo se carga una vez por conexión, indexado por id y con un índice secundario por descripción.
+Las escrituras que hace el motor lo actualizan en el momento (write-through), y antes de cada lectura
+se verifica con 'PRAGMA data_version' si otra conexión modificó la base de datos, en cuyo caso solo se
+vuelven a leer los registros que esa conexión modificó, según el registro de cambios (ver
+sql.cambios_externos). Así, un pedido que el trabajador de base de datos confirma en su conexión cuesta
+a la conexión de la ventana releer los materiales consumidos, no todo el catálogo. Las memorias se
+liberan junto con su conexión.
+
+Para la búsqueda incremental por descripción (los combobox de materiales y productos) cada catálogo
+mantiene además un índice de palabras: una lista ordenada de (palabra, descripción, id), con las palabras
+y descripciones normalizadas (en minúsculas y sin acentos). Las descripciones que tienen una palabra que
+comienza con el texto buscado ocupan un tramo contiguo de la lista, que se ubica con una búsqueda binaria,
+por lo que obtener las primeras coincidencias no depende de la cantidad de registros. El índice se
+construye con la primera búsqueda, o antes con catalogo_preparar_busqueda() (el trabajador de base de
+datos lo hace al abrir cada conexión que atiende lecturas), y se mantiene con las escrituras del motor.
+"""
+
+from bisect import bisect_left, insort      # Índice de palabras ordenado
+import json                         # Lista de ids enviada como un único parámetro de consulta
+import re                           # Separación de las descripciones en palabras
+import unicodedata                  # Normalización de acentos para la búsqueda
+import weakref                      # Memorias que se liberan junto con su conexión
+
+from gemprop_motor.eventos import registrar_evento
+from gemprop_motor.sql import ejecutar_consulta_sql, cambios_externos
+
+
+# Consulta de carga de cada catálogo. El primer campo es el id y el segundo la descripción.
+CONSULTAS_CATALOGO = {
+    "materiales": "SELECT id, descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion FROM materiales",
+    "productos": "SELECT id, descripcion, tiempo_confeccion FROM productos"
+}
+
+# Catálogos cargados: conexión -> {"tablas": {tabla: {"registros": {id: registro}, "por_descripcion": {descripcion: id},
+#                                                   "ordenados": lista | None, "indice_de_palabras": lista | None}},
+#                                  "sincronizacion": cambios vistos de otras conexiones (ver sql.cambios_externos)}
+catalogos_por_conexion = weakref.WeakKeyDictionary()
+
+
+def _catalogos(conexion_bd):
+    # Retorna los catálogos de la conexión, con los cambios hechos por otras conexiones ya aplicados
+    catalogos = catalogos_por_conexion.get(conexion_bd)
+    if catalogos is None:
+        catalogos = catalogos_por_conexion[conexion_bd] = {"tablas": {}, "sincronizacion": {}}
+
+    cambios = cambios_externos(conexion_bd, catalogos["sincronizacion"])
+    if cambios is False:
+        registrar_evento("No se pudieron determinar los cambios de otras conexiones, se descarta el catálogo en memoria")
+        catalogos["tablas"].clear()
+    elif cambios:
+        for tabla in list(catalogos["tablas"]):
+            if tabla in cambios:
+                catalogo_recargar_registros(conexion_bd, tabla, cambios[tabla])
+    return catalogos
+
+def _catalogo_cargado(conexion_bd, tabla):
+    # Retorna el catálogo de la tabla si ya está cargado, sin verificar cambios de otras conexiones, o None
+    catalogos = catalogos_por_conexion.get(conexion_bd)
+    if catalogos is None:
+        return None
+    return catalogos["tablas"].get(tabla)
+
+def _catalogo(conexion_bd, tabla):
+    # Retorna el catálogo vigente de la tabla, cargándolo si es necesario, o None si hubo un error
+    catalogos = _catalogos(conexion_bd)["tablas"]
+    catalogo = catalogos.get(tabla)
+    if catalogo is not None:
+        return catalogo
+
+    registros = ejecutar_consulta_sql(conexion_bd, CONSULTAS_CATALOGO[tabla])
+    if registros is None:
+        return None
+
+    catalogo = {
+        "registros": {registro[0]: registro for registro in registros},
+        "por_descripcion": {registro[1]: registro[0] for registro in registros},
+        "ordenados": None,
+        "indice_de_palabras": None          # Se construye con la primera búsqueda por texto
+    }
+    catalogos[tabla] = catalogo
+    registrar_evento("Catálogo de '{}' cargado en memoria: {} registro(s)", tabla, len(registros))
+    return catalogo
+
+def catalogo_recuperar(conexion_bd, tabla):
+    # Retorna todos los registros de la tabla ordenados por id, o None si hubo un error
+    catalogo = _catalogo(conexion_bd, tabla)
+    if catalogo is None:
+        return None
+
+    if catalogo["ordenados"] is None:
+        catalogo["ordenados"] = [catalogo["registros"][id_registro] for id_registro in sorted(catalogo["registros"])]
+    return catalogo["ordenados"]
+
+def catalogo_buscar(conexion_bd, tabla, ids_registros):
+    # Retorna los registros cuyos ids se reciben, ordenados por id (los ids inexistentes se ignoran), o None si hubo un error
+    catalogo = _catalogo(conexion_bd, tabla)
+    if catalogo is None:
+        return None
+
+    registros = catalogo["registros"]
+    return [registros[id_registro] for id_registro in sorted(set(ids_registros)) if id_registro in registros]
+
+def catalogo_buscar_id_por_descripcion(conexion_bd, tabla, descripcion):
+    # Retorna el id del registro con la descripción indicada, None si no existe, o False si hubo un error
+    catalogo = _catalogo(conexion_bd, tabla)
+    if catalogo is None:
+        return False
+
+    return catalogo["por_descripcion"].get(descripcion)
+
+def catalogo_buscar_por_texto(conexion_bd, tabla, texto, limite=20):
+    # Búsqueda incremental: retorna hasta 'limite' registros cuya descripción tiene, para cada palabra del texto, una palabra
+    # que comienza con ella (sin distinguir mayúsculas ni acentos), ordenados por esa palabra y por descripción.
+    # Con el texto vacío retorna los primeros registros del índice. Retorna None si hubo un error.
+    catalogo = _catalogo(conexion_bd, tabla)
+    if catalogo is None:
+        return None
+
+    # Se recorre el tramo del índice de la palabra buscada con menos entradas (la más selectiva); el resto de las palabras
+    # se verifica en cada descripción
+    indice = _indice_de_palabras(catalogo)
+    registros = catalogo["registros"]
+    palabras_buscadas = _palabras(texto)
+    tramos = [(palabra, bisect_left(indice, (palabra,)), bisect_left(indice, (palabra + "\U0010ffff",))) for palabra in palabras_buscadas] or [("", 0, len(indice))]
+    palabra_principal, posicion, fin = min(tramos, key=lambda tramo: tramo[2] - tramo[1])
+    otras_palabras = [palabra for palabra in palabras_buscadas if palabra != palabra_principal]
+    resultado = []
+    ids_encontrados = set()
+    while posicion < fin and len(resultado) < limite:
+        palabra, descripcion_normalizada, id_registro = indice[posicion]
+        posicion += 1
+        if id_registro in ids_encontrados:
+            continue
+        if otras_palabras:
+            palabras_descripcion = descripcion_normalizada.split()
+            if not all(any(palabra_descripcion.startswith(otra) for palabra_descripcion in palabras_descripcion) for otra in otras_palabras):
+                continue
+        ids_encontrados.add(id_registro)
+        resultado.append(registros[id_registro])
+
+    return resultado
+
+def catalogo_preparar_busqueda(conexion_bd, tablas=("materiales", "productos")):
+    # Carga los catálogos de las tablas indicadas y construye sus índices de palabras, para que la primera búsqueda por
+    # texto en la conexión no tenga que hacerlo. Retorna True, o False si hubo un error.
+    for tabla in tablas:
+        catalogo = _catalogo(conexion_bd, tabla)
+        if catalogo is None:
+            return False
+        _indice_de_palabras(catalogo)
+
+    return True
+
+def _indice_de_palabras(catalogo):
+    # Retorna el índice de palabras del catálogo, construyéndolo si es necesario
+    if catalogo["indice_de_palabras"] is None:
+        catalogo["indice_de_palabras"] = sorted(entrada for registro in catalogo["registros"].values() for entrada in _entradas_del_indice(registro))
+    return catalogo["indice_de_palabras"]
+
+def _palabras(texto):
+    # Palabras del texto en minúsculas y sin acentos
+    texto = unicodedata.normalize("NFKD", str(texto))
+    texto = "".join(caracter for caracter in texto if not unicodedata.combining(caracter))
+    return re.findall(r"\w+", texto.casefold())
+
+def _entradas_del_indice(registro):
+    # Entradas (palabra, descripción normalizada, id) del índice de palabras para un registro
+    palabras = _palabras(registro[1])
+    descripcion_normalizada = " ".join(palabras)
+    return [(palabra, descripcion_normalizada, registro[0]) for palabra in set(palabras)]
+
+def _indice_agregar(catalogo, registro):
+    # Agrega las palabras del registro al índice (si ya fue construido)
+    indice = catalogo.get("indice_de_palabras")
+    if indice is None:
+        return
+    for entrada in _entradas_del_indice(registro):
+        insort(indice, entrada)
+
+def _indice_quitar(catalogo, registro):
+    # Quita las palabras del registro del índice (si ya fue construido)
+    indice = catalogo.get("indice_de_palabras")
+    if indice is None:
+        return
+    for entrada in _entradas_del_indice(registro):
+        posicion = bisect_left(indice, entrada)
+        if posicion < len(indice) and indice[posicion] == entrada:
+            del indice[posicion]
+
+def catalogo_guardar(conexion_bd, tabla, registros):
+    # Escritura write-through: da de alta o actualiza en el catálogo (si está cargado) los registros recibidos
+    catalogo = _catalogo_cargado(conexion_bd, tabla)
+    if catalogo is None:
+        return
+
+    for registro in registros:
+        anterior = catalogo["registros"].get(registro[0])
+        if anterior is not None and anterior[1] != registro[1]:
+            if catalogo["por_descripcion"].get(anterior[1]) == registro[0]:     # Otro registro pudo tomar la descripción
+                del catalogo["por_descripcion"][anterior[1]]
+            _indice_quitar(catalogo, anterior)
+        if anterior is None or anterior[1] != registro[1]:
+            _indice_agregar(catalogo, registro)
+        catalogo["registros"][registro[0]] = registro
+        catalogo["por_descripcion"][registro[1]] = registro[0]
+    catalogo["ordenados"] = None
+
+def catalogo_eliminar(conexion_bd, tabla, ids_registros):
+    # Escritura write-through: elimina del catálogo (si está cargado) los registros cuyos ids se reciben
+    catalogo = _catalogo_cargado(conexion_bd, tabla)
+    if catalogo is None:
+        return
+
+    for id_registro in ids_registros:
+        registro = catalogo["registros"].pop(id_registro, None)
+        if registro is not None:
+            if catalogo["por_descripcion"].get(registro[1]) == id_registro:
+                del catalogo["por_descripcion"][registro[1]]
+            _indice_quitar(catalogo, registro)
+    catalogo["ordenados"] = None
+
+def catalogo_recargar_registros(conexion_bd, tabla, ids_registros):
+    # Vuelve a leer de la base de datos los registros indicados y los actualiza en el catálogo (si está cargado); los que
+    # ya no existen se eliminan. Se usa después de escrituras relativas (por ejemplo stock_actual - unidades) cuyo resultado
+    # no conoce el motor, y con los registros que modificaron otras conexiones.
+    catalogo = _catalogo_cargado(conexion_bd, tabla)
+    if catalogo is None:
+        return
+
+    ids_registros = list(ids_registros)
+    sql = CONSULTAS_CATALOGO[tabla] + " WHERE id IN (SELECT value FROM json_each(?))"
+    registros = ejecutar_consulta_sql(conexion_bd, sql, (json.dumps(ids_registros),))
+    if registros is None:
+        catalogo_descartar(conexion_bd, tabla)
+        return
+
+    catalogo_guardar(conexion_bd, tabla, registros)
+    catalogo_eliminar(conexion_bd, tabla, set(ids_registros).difference(registro[0] for registro in registros))
+
+def catalogo_descartar(conexion_bd, tabla=None):
+    # Descarta el catálogo de la tabla indicada (o todos los de la conexión); se vuelve a cargar en la próxima lectura
+    catalogos = catalogos_por_conexion.get(conexion_bd)
+    if catalogos is None:
+        return
+
+    if tabla is None:
+        catalogos["tablas"].clear()
+    else:
+        catalogos["tablas"].pop(tabla, None)
@@ -0,0 +1,130 @@
+"""
+Cantidad fabricable de cada producto
+
+La cantidad fabricable de un producto es la cantidad de unidades que pueden confeccionarse en este momento
+con el stock actual: el mínimo, sobre los materiales de su explosión (ver explosion.py), del stock del
+material dividido (división entera) por las unidades que requiere una unidad del producto. Los productos
+sin materiales no tienen cantidad fabricable (None).
+
+Las cantidades se mantienen en memoria por conexión, como el catálogo y las explosiones, junto con un índice
+de uso inverso: para cada material, los productos que lo usan a cualquier nivel del BOM, obtenidos de sus
+explosiones. Cuando el motor modifica el stock de un material solo se recalculan los productos de su entrada
+en el índice (ver disponibilidad_actualizar_materiales), por lo que consultar la disponibilidad de todo el
+catálogo no ejecuta consultas. Cuando cambia el BOM de un producto, su explosión memorizada se reemplaza por
+otra; al leer la cantidad se detecta que la explosión usada ya no es la vigente y solo ese producto se vuelve
+a calcular. Si otra conexión modifica la base de datos ('PRAGMA data_version'), por ejemplo el trabajador de
+base de datos al confirmar un pedido, se recalculan del mismo modo los productos que usan los materiales que
+figuran en el registro de cambios (ver sql.cambios_externos).
+"""
+
+import weakref                      # Memorias que se liberan junto con su conexión
+
+from gemprop_motor.sql import cambios_externos
+from gemprop_motor.catalogo import catalogo_recuperar, catalogo_buscar
+from gemprop_motor.explosion import explosion_de_productos
+
+
+# Disponibilidad memorizada: conexión -> {"cantidades": {id_producto: cantidad | None}, "explosiones": {id_producto: explosión usada},
+#                                        "productos_por_material": {id_material: {id_producto, ...}},
+#                                        "sincronizacion": cambios vistos de otras conexiones (ver sql.cambios_externos)}
+disponibilidades_por_conexion = weakref.WeakKeyDictionary()
+
+
+def _disponibilidad(conexion_bd):
+    # Retorna la memoria de la conexión, con los productos que usan materiales modificados por otras conexiones ya recalculados.
+    # Si esos materiales no pueden determinarse, se descarta toda la memoria.
+    disponibilidad = disponibilidades_por_conexion.get(conexion_bd)
+    if disponibilidad is None:
+        disponibilidad = disponibilidades_por_conexion[conexion_bd] = {"cantidades": {}, "explosiones": {}, "productos_por_material": {}, "sincronizacion": {}}
+
+    cambios = cambios_externos(conexion_bd, disponibilidad["sincronizacion"])
+    if cambios is False:
+        disponibilidad_descartar(conexion_bd)
+    elif cambios and "materiales" in cambios:
+        disponibilidad_actualizar_materiales(conexion_bd, cambios["materiales"])
+    return disponibilidad
+
+def disponibilidad_de_productos(conexion_bd, ids_productos=None):
+    # Retorna un diccionario {id_producto: cantidad fabricable} de los productos indicados (o de todos), con None para
+    # los productos sin materiales, o None si hubo un error
+    disponibilidad = _disponibilidad(conexion_bd)        # Antes de leer el catálogo, para no perder cambios intermedios
+    if ids_productos is None:
+        productos = catalogo_recuperar(conexion_bd, "productos")
+    else:
+        productos = catalogo_buscar(conexion_bd, "productos", ids_productos)
+    if productos is None:
+        return None
+
+    explosiones = explosion_de_productos(conexion_bd, [registro[0] for registro in productos])
+    if explosiones is None:
+        return None
+
+    # Productos nuevos o con el BOM modificado
+    a_calcular = [id_producto for id_producto, explosion in explosiones.items() if disponibilidad["explosiones"].get(id_producto) is not explosion]
+    for id_producto in a_calcular:
+        _indexar_producto(disponibilidad, id_producto, explosiones[id_producto])
+    if a_calcular and not _calcular_productos(conexion_bd, disponibilidad, a_calcular):
+        return None
+
+    return {id_producto: disponibilidad["cantidades"][id_producto] for id_producto in explosiones}
+
+def disponibilidad_recuperar_productos(conexion_bd):
+    # Lee todos los registros de productos, ordenados por id, con la cantidad fabricable agregada como último campo
+    productos = catalogo_recuperar(conexion_bd, "productos")
+    cantidades = disponibilidad_de_productos(conexion_bd)
+    if productos is None or cantidades is None:
+        return None
+
+    return [registro + (cantidades[registro[0]],) for registro in productos]
+
+def disponibilidad_actualizar_materiales(conexion_bd, ids_materiales):
+    # Recalcula la cantidad fabricable de los productos que usan los materiales indicados. Debe invocarse luego de modificar
+    # el stock de esos materiales y de actualizar el catálogo. Si no puede recalcularse, se descarta la memoria de la conexión.
+    disponibilidad = disponibilidades_por_conexion.get(conexion_bd)
+    if disponibilidad is None:
+        return
+
+    productos_por_material = disponibilidad["productos_por_material"]
+    productos = set()
+    for id_material in ids_materiales:
+        productos.update(productos_por_material.get(id_material, ()))
+    if productos and not _calcular_productos(conexion_bd, disponibilidad, productos):
+        disponibilidad_descartar(conexion_bd)
+
+def disponibilidad_descartar(conexion_bd):
+    # Descarta la disponibilidad memorizada de la conexión; se vuelve a calcular en la próxima lectura
+    disponibilidad = disponibilidades_por_conexion.get(conexion_bd)
+    if disponibilidad is not None:
+        disponibilidad.update(cantidades={}, explosiones={}, productos_por_material={})
+
+def _indexar_producto(disponibilidad, id_producto, explosion):
+    # Reemplaza en el índice de uso inverso los materiales de la explosión anterior del producto por los de la nueva
+    productos_por_material = disponibilidad["productos_por_material"]
+    for id_material in disponibilidad["explosiones"].get(id_producto, {}):
+        productos_por_material.get(id_material, set()).discard(id_producto)
+    for id_material in explosion:
+        productos_por_material.setdefault(id_material, set()).add(id_producto)
+    disponibilidad["explosiones"][id_producto] = explosion
+
+def _calcular_productos(conexion_bd, disponibilidad, ids_productos):
+    # Calcula la cantidad fabricable de los productos a partir del stock de sus materiales en el catálogo, leído una
+    # única vez para todos ellos. Retorna False si hubo un error.
+    explosiones = disponibilidad["explosiones"]
+    ids_materiales = set()
+    for id_producto in ids_productos:
+        ids_materiales.update(explosiones[id_producto])
+    materiales = catalogo_buscar(conexion_bd, "materiales", ids_materiales)
+    if materiales is None:
+        return False
+
+    stock_por_material = {registro[0]: registro[2] for registro in materiales}
+    for id_producto in ids_productos:
+        cantidad = None
+        for id_material, unidades in explosiones[id_producto].items():
+            if unidades <= 0:
+                continue
+            cantidad_material = max(stock_por_material.get(id_material) or 0, 0) // unidades
+            if cantidad is None or cantidad_material < cantidad:
+                cantidad = cantidad_material
+        disponibilidad["cantidades"][id_producto] = cantidad
+    return True
@@ -0,0 +1,308 @@
+"""
+Esquema de la base de datos de GEMPROP
+
+La estructura de la base de datos se versiona con 'PRAGMA user_version'. Cada migración
+lleva el esquema de una versión a la siguiente y se aplica en su propia transacción, de forma
+que una base existente (por ejemplo base_demo/gemprop_demo.db) se actualiza en el lugar y una
+base nueva se crea aplicando todas las migraciones en orden. Al iniciar la aplicación alcanza
+con leer el número de versión para saber si hay algo que hacer.
+"""
+
+import sqlite3                      # Objetos de manejo de la base de datos
+
+from gemprop_motor.eventos import registrar_evento, ADVERTENCIA, ERROR
+from gemprop_motor.metricas import metricas_incrementar
+
+
+# Versión 1: tablas originales de la aplicación. Las bases creadas antes de versionar el esquema ya
+# las tienen (con user_version = 0), por eso se usa IF NOT EXISTS.
+MIGRACION_1 = [
+    "CREATE TABLE IF NOT EXISTS materiales (id integer PRIMARY KEY, descripcion text, stock_actual integer, stock_reposicion integer, demora_reposicion integer)",
+    "CREATE TABLE IF NOT EXISTS productos (id integer PRIMARY KEY, descripcion text)",
+    "CREATE TABLE IF NOT EXISTS materiales_por_producto (id_material integer, id_producto integer, cantidad_de_unidades integer)"
+]
+
+def renombrar_descripciones_repetidas(cursor):
+    # Paso de la migración 2. Las bases anteriores al versionado admitían descripciones repetidas, que impedirían crear
+    # los índices únicos: se conserva la descripción del registro de menor id y los demás se renombran agregando su id
+    # ("Tornillo (id 17)"), informando cada cambio. Los ids no cambian, por lo que los BOM y pedidos no se modifican.
+    for tabla in ("materiales", "productos"):
+        sql = f"""
+            SELECT id, descripcion FROM {tabla}
+            WHERE descripcion IS NOT NULL AND id NOT IN (SELECT MIN(id) FROM {tabla} WHERE descripcion IS NOT NULL GROUP BY descripcion)
+            ORDER BY id"""
+        for id_registro, descripcion in cursor.execute(sql).fetchall():
+            nueva_descripcion = f"{descripcion} (id {id_registro})"
+            sufijo = 1
+            while cursor.execute(f"SELECT 1 FROM {tabla} WHERE descripcion = ?", (nueva_descripcion,)).fetchone():
+                sufijo += 1
+                nueva_descripcion = f"{descripcion} (id {id_registro}-{sufijo})"
+            cursor.execute(f"UPDATE {tabla} SET descripcion = ? WHERE id = ?", (nueva_descripcion, id_registro))
+            registrar_evento("Descripción repetida en la tabla {}: el registro id={} [{}] se renombró a [{}]", tabla, id_registro, descripcion, nueva_descripcion, nivel=ADVERTENCIA)
+
+# Versión 2: clave primaria compuesta e integridad referencial en 'materiales_por_producto', índice inverso
+# por material (para saber qué productos usan un material) e índices únicos por descripción.
+# SQLite no permite agregar claves a una tabla existente, por lo que la tabla se reconstruye. Las asociaciones
+# repetidas se unifican y se descartan las que apuntan a materiales o productos inexistentes. Las descripciones
+# repetidas se renombran antes de crear los índices únicos (ver renombrar_descripciones_repetidas).
+MIGRACION_2 = [
+    """CREATE TABLE materiales_por_producto_v2 (
+        id_producto integer NOT NULL REFERENCES productos(id),
+        id_material integer NOT NULL REFERENCES materiales(id),
+        cantidad_de_unidades integer,
+        PRIMARY KEY (id_producto, id_material)
+    ) WITHOUT ROWID""",
+    """INSERT INTO materiales_por_producto_v2(id_producto, id_material, cantidad_de_unidades)
+        SELECT r.id_producto, r.id_material, MAX(r.cantidad_de_unidades)
+        FROM materiales_por_producto r
+        INNER JOIN materiales m ON m.id = r.id_material
+        INNER JOIN productos p ON p.id = r.id_producto
+        GROUP BY r.id_producto, r.id_material""",
+    "DROP TABLE materiales_por_producto",
+    "ALTER TABLE materiales_por_producto_v2 RENAME TO materiales_por_producto",
+    "CREATE INDEX indice_materiales_por_producto_material ON materiales_por_producto(id_material)",
+    renombrar_descripciones_repetidas,
+    "CREATE UNIQUE INDEX indice_materiales_descripcion ON materiales(descripcion)",
+    "CREATE UNIQUE INDEX indice_productos_descripcion ON productos(descripcion)"
+]
+
+# Versión 3: BOM de varios niveles. Un producto puede usar otros productos (subconjuntos) como componentes.
+# El índice por id_subproducto permite recorrer el BOM hacia arriba (qué productos usan un subproducto).
+MIGRACION_3 = [
+    """CREATE TABLE productos_por_producto (
+        id_producto integer NOT NULL REFERENCES productos(id),
+        id_subproducto integer NOT NULL REFERENCES productos(id),
+        cantidad_de_unidades integer,
+        PRIMARY KEY (id_producto, id_subproducto),
+        CHECK (id_producto <> id_subproducto)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX indice_productos_por_producto_subproducto ON productos_por_producto(id_subproducto)"
+]
+
+# Versión 4: tiempo de confección de cada producto en días (requerimiento 2.4)
+MIGRACION_4 = [
+    "ALTER TABLE productos ADD COLUMN tiempo_confeccion integer NOT NULL DEFAULT 0"
+]
+
+# Versión 5: reposición de materiales (requerimiento 1.5). Cada material tiene la cantidad de unidades que se
+# solicitan al proveedor en cada orden de compra; los materiales existentes toman la cantidad que reponía la versión
+# anterior (10 unidades). Los índices parciales solo contienen los materiales por debajo de su nivel de reposición
+# y las órdenes de compra pendientes de recibir, que son las filas que recorre cada reposición (ver reposicion.py).
+MIGRACION_5 = [
+    "ALTER TABLE materiales ADD COLUMN cantidad_reposicion integer NOT NULL DEFAULT 10 CHECK (cantidad_reposicion > 0)",
+    """CREATE TABLE ordenes_de_compra (
+        id integer PRIMARY KEY,
+        id_material integer NOT NULL REFERENCES materiales(id) ON DELETE CASCADE,
+        cantidad integer NOT NULL CHECK (cantidad > 0),
+        fecha_emision text NOT NULL,
+        fecha_entrega text NOT NULL,
+        fecha_recepcion text
+    )""",
+    "CREATE INDEX indice_materiales_bajo_reposicion ON materiales(id) WHERE stock_actual < stock_reposicion",
+    "CREATE INDEX indice_ordenes_de_compra_pendientes_material ON ordenes_de_compra(id_material) WHERE fecha_recepcion IS NULL",
+    "CREATE INDEX indice_ordenes_de_compra_pendientes_entrega ON ordenes_de_compra(fecha_entrega) WHERE fecha_recepcion IS NULL"
+]
+
+# Versión 6: cola de reposición mantenida por triggers. Un material entra en la cola cuando su stock actual pasa a ser
+# inferior a su nivel de reposición (por un alta, un pedido confirmado o un cambio del nivel) y sale cuando se recupera
+# o se elimina. Los triggers se ejecutan dentro de la misma transacción que modifica el stock, por lo que la cola
+# siempre coincide con los datos confirmados. La cola reemplaza al índice parcial de la versión 5.
+MIGRACION_6 = [
+    """CREATE TABLE cola_de_reposicion (
+        id_material integer PRIMARY KEY,
+        fecha_alta text NOT NULL DEFAULT (date('now', 'localtime'))
+    )""",
+    "INSERT INTO cola_de_reposicion(id_material) SELECT id FROM materiales WHERE stock_actual < stock_reposicion",
+    "DROP INDEX indice_materiales_bajo_reposicion",
+    """CREATE TRIGGER cola_de_reposicion_alta_material AFTER INSERT ON materiales
+        WHEN NEW.stock_actual < NEW.stock_reposicion
+        BEGIN
+            INSERT OR IGNORE INTO cola_de_reposicion(id_material) VALUES (NEW.id);
+        END""",
+    """CREATE TRIGGER cola_de_reposicion_bajo_nivel AFTER UPDATE OF stock_actual, stock_reposicion ON materiales
+        WHEN NEW.stock_actual < NEW.stock_reposicion AND NOT (OLD.stock_actual < OLD.stock_reposicion)
+        BEGIN
+            INSERT OR IGNORE INTO cola_de_reposicion(id_material) VALUES (NEW.id);
+        END""",
+    """CREATE TRIGGER cola_de_reposicion_nivel_recuperado AFTER UPDATE OF stock_actual, stock_reposicion ON materiales
+        WHEN NOT (NEW.stock_actual < NEW.stock_reposicion) AND OLD.stock_actual < OLD.stock_reposicion
+        BEGIN
+            DELETE FROM cola_de_reposicion WHERE id_material = NEW.id;
+        END""",
+    """CREATE TRIGGER cola_de_reposicion_baja_material AFTER DELETE ON materiales
+        BEGIN
+            DELETE FROM cola_de_reposicion WHERE id_material = OLD.id;
+        END"""
+]
+
+# Versión 7: libro de movimientos de stock e instantáneas (ver movimientos.py). El stock de un material solo cambia al
+# registrarse un movimiento: el trigger 'movimientos_de_stock_aplicar' suma su cantidad al stock en la misma sentencia,
+# por lo que el movimiento y el cambio de stock se confirman juntos. El alta de un material registra su stock inicial
+# como un movimiento de tipo 'alta', que no se vuelve a sumar. Los movimientos no pueden modificarse ni eliminarse, y
+# no referencian a 'materiales' para conservar la historia de los materiales eliminados. Las instantáneas iniciales
+# registran el stock de los materiales existentes al aplicar la migración.
+MIGRACION_7 = [
+    """CREATE TABLE movimientos_de_stock (
+        id integer PRIMARY KEY,
+        id_material integer NOT NULL,
+        fecha text NOT NULL DEFAULT (datetime('now', 'localtime')),
+        tipo text NOT NULL CHECK (tipo IN ('alta', 'consumo', 'recepcion', 'ajuste')),
+        cantidad integer NOT NULL,
+        referencia integer
+    )""",
+    "CREATE INDEX indice_movimientos_de_stock_material ON movimientos_de_stock(id_material)",
+    "CREATE INDEX indice_movimientos_de_stock_fecha ON movimientos_de_stock(fecha)",
+    """CREATE TABLE instantaneas_de_stock (
+        id_material integer NOT NULL,
+        fecha text NOT NULL,
+        stock integer NOT NULL,
+        id_ultimo_movimiento integer NOT NULL,
+        PRIMARY KEY (id_material, fecha)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX indice_instantaneas_de_stock_ultimo_movimiento ON instantaneas_de_stock(id_ultimo_movimiento)",
+    "INSERT INTO instantaneas_de_stock(id_material, fecha, stock, id_ultimo_movimiento) SELECT id, datetime('now', 'localtime'), stock_actual, 0 FROM materiales",
+    """CREATE TRIGGER movimientos_de_stock_aplicar AFTER INSERT ON movimientos_de_stock
+        WHEN NEW.tipo <> 'alta'
+        BEGIN
+            UPDATE materiales SET stock_actual = stock_actual + NEW.cantidad WHERE id = NEW.id_material;
+        END""",
+    """CREATE TRIGGER movimientos_de_stock_no_modificar BEFORE UPDATE ON movimientos_de_stock
+        BEGIN
+            SELECT RAISE(ABORT, 'Los movimientos de stock no pueden modificarse');
+        END""",
+    """CREATE TRIGGER movimientos_de_stock_no_eliminar BEFORE DELETE ON movimientos_de_stock
+        BEGIN
+            SELECT RAISE(ABORT, 'Los movimientos de stock no pueden eliminarse');
+        END""",
+    """CREATE TRIGGER movimientos_de_stock_alta_material AFTER INSERT ON materiales
+        WHEN NEW.stock_actual <> 0
+        BEGIN
+            INSERT INTO movimientos_de_stock(id_material, tipo, cantidad) VALUES (NEW.id, 'alta', NEW.stock_actual);
+        END"""
+]
+
+# Versión 8: historial de pedidos. Cada pedido confirmado se registra con sus líneas (una por producto, con la cantidad
+# total), la demora y la fecha de entrega informadas, en la misma transacción que descuenta el stock. Los índices permiten
+# recorrer el historial por fecha, por estado o por producto en el orden de la paginación (fecha, id) sin ordenar; para
+# ello cada línea repite la fecha de su pedido.
+MIGRACION_8 = [
+    """CREATE TABLE pedidos (
+        id integer PRIMARY KEY,
+        fecha text NOT NULL DEFAULT (datetime('now', 'localtime')),
+        estado text NOT NULL DEFAULT 'confirmado' CHECK (estado IN ('confirmado', 'entregado', 'cancelado')),
+        demora_maxima integer NOT NULL,
+        tiempo_confeccion integer NOT NULL,
+        fecha_entrega text NOT NULL
+    )""",
+    """CREATE TABLE lineas_de_pedido (
+        id_pedido integer NOT NULL REFERENCES pedidos(id),
+        id_producto integer NOT NULL,
+        cantidad integer NOT NULL CHECK (cantidad > 0),
+        fecha text NOT NULL,
+        PRIMARY KEY (id_pedido, id_producto)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX indice_pedidos_fecha ON pedidos(fecha)",
+    "CREATE INDEX indice_pedidos_estado_fecha ON pedidos(estado, fecha)",
+    "CREATE INDEX indice_lineas_de_pedido_producto_fecha ON lineas_de_pedido(id_producto, fecha, id_pedido)"
+]
+
+# Versión 9: registro de cambios. Cada alta, modificación o baja de un material o un producto agrega a 'registro_de_cambios'
+# la tabla y el id del registro, cada cambio en una relación del BOM agrega el id del producto compuesto con la tabla
+# 'bom', y cada cambio en una orden de compra agrega el id de su material con la tabla 'reposicion', en la misma
+# transacción que el cambio. Cuando otra conexión modifica la base de datos, las memorias por conexión del motor
+# (catálogo, explosiones, disponibilidad y proyección ATP) leen los cambios posteriores al último que vieron y actualizan solo
+# esos registros (ver sql.cambios_externos). Se conservan los últimos 10000 cambios: cada 1000 cambios se eliminan los
+# anteriores, y una memoria que no llegó a ver los cambios eliminados se descarta completa.
+MIGRACION_9 = [
+    """CREATE TABLE registro_de_cambios (
+        id integer PRIMARY KEY,
+        tabla text NOT NULL,
+        id_registro integer NOT NULL
+    )""",
+    """CREATE TRIGGER registro_de_cambios_depurar AFTER INSERT ON registro_de_cambios
+        WHEN NEW.id % 1000 = 0
+        BEGIN
+            DELETE FROM registro_de_cambios WHERE id <= NEW.id - 10000;
+        END"""
+] + [
+    f"""CREATE TRIGGER registro_de_cambios_{tabla}_{evento.lower()} AFTER {evento} ON {tabla}
+        BEGIN
+            INSERT INTO registro_de_cambios(tabla, id_registro) VALUES {valores};
+        END"""
+    # Tabla, cambio registrado por un alta, una modificación y una baja (una relación del BOM puede cambiar de producto)
+    for tabla, valores_alta, valores_modificacion, valores_baja in (
+        ("materiales", "('materiales', NEW.id)", "('materiales', NEW.id)", "('materiales', OLD.id)"),
+        ("productos", "('productos', NEW.id)", "('productos', NEW.id)", "('productos', OLD.id)"),
+        ("materiales_por_producto", "('bom', NEW.id_producto)", "('bom', OLD.id_producto), ('bom', NEW.id_producto)", "('bom', OLD.id_producto)"),
+        ("productos_por_producto", "('bom', NEW.id_producto)", "('bom', OLD.id_producto), ('bom', NEW.id_producto)", "('bom', OLD.id_producto)"),
+        ("ordenes_de_compra", "('reposicion', NEW.id_material)", "('reposicion', NEW.id_material)", "('reposicion', OLD.id_material)")
+    )
+    for evento, valores in (("INSERT", valores_alta), ("UPDATE", valores_modificacion), ("DELETE", valores_baja))
+]
+
+# Lista ordenada de migraciones: la posición i (comenzando en 1) lleva el esquema a la versión i
+MIGRACIONES = [
+    ("Tablas de materiales, productos y materiales por producto", MIGRACION_1),
+    ("Claves, índices y foreign keys de materiales por producto", MIGRACION_2),
+    ("Productos usados como subconjuntos de otros productos", MIGRACION_3),
+    ("Tiempo de confección de los productos", MIGRACION_4),
+    ("Cantidad de reposición de los materiales y órdenes de compra", MIGRACION_5),
+    ("Cola de reposición mantenida por triggers", MIGRACION_6),
+    ("Libro de movimientos de stock e instantáneas", MIGRACION_7),
+    ("Historial de pedidos", MIGRACION_8),
+    ("Registro de cambios para sincronizar las memorias de otras conexiones", MIGRACION_9)
+]
+
+VERSION_ESQUEMA = len(MIGRACIONES)
+
+
+def obtener_version_esquema(conexion_bd):
+    # Retorna la versión del esquema registrada en la base de datos (0 si nunca fue versionada)
+    return conexion_bd.execute("PRAGMA user_version").fetchone()[0]
+
+def aplicar_migracion(conexion_bd, version, sentencias):
+    # Aplica las sentencias de una migración y registra la nueva versión, todo dentro de una misma transacción.
+    # Una sentencia puede ser también una función, que recibe el cursor, para los pasos que no se expresan en SQL.
+    # Retorna True si la migración se aplicó, o False si hubo un error (en cuyo caso no se modifica nada).
+    try:
+        cursor = conexion_bd.cursor()
+        cursor.execute("BEGIN")
+        for sentencia in sentencias:
+            if callable(sentencia):
+                sentencia(cursor)
+            else:
+                cursor.execute(sentencia)
+        cursor.execute(f"PRAGMA user_version = {int(version)}")
+        conexion_bd.commit()
+        return True
+    except sqlite3.Error as err:
+        conexion_bd.rollback()
+        metricas_incrementar("gemprop_errores_de_base_de_datos_total")
+        registrar_evento("Error aplicando la migración a la versión {} del esquema\nError: [{}]", version, err.args[0], nivel=ERROR)
+
+    return False
+
+def actualizar_esquema(conexion_bd):
+    # Lleva la base de datos a la última versión del esquema, aplicando solo las migraciones pendientes.
+    # Retorna True si la base quedó actualizada, o False si alguna migración falló.
+    try:
+        version_actual = obtener_version_esquema(conexion_bd)
+    except sqlite3.Error as err:
+        metricas_incrementar("gemprop_errores_de_base_de_datos_total")
+        registrar_evento("No se pudo leer la versión del esquema de la base de datos\nError: [{}]", err.args[0], nivel=ERROR)
+        return False
+
+    if version_actual > VERSION_ESQUEMA:
+        registrar_evento("La base de datos tiene la versión {} del esquema, posterior a la soportada por la aplicación ({})", version_actual, VERSION_ESQUEMA, nivel=ERROR)
+        return False
+    if version_actual == VERSION_ESQUEMA:
+        registrar_evento("El esquema de la base de datos está actualizado (versión {})", version_actual)
+        return True
+
+    for version in range(version_actual + 1, VERSION_ESQUEMA + 1):
+        descripcion, sentencias = MIGRACIONES[version - 1]
+        if not aplicar_migracion(conexion_bd, version, sentencias):
+            return False
+        registrar_evento("Esquema de la base de datos actualizado a la versión {}: {}", version, descripcion)
+
+    return True
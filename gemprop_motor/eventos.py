@@ -0,0 +1,158 @@
+"""
+Registro de eventos del motor de GEMPROP
+
+Centraliza los mensajes informativos que emiten el modelo y el controlador, de forma que
+cualquier cliente del motor (la vista tkinter, un proceso batch o un benchmark) los reciba
+con el mismo formato.
+
+Registrar un evento no realiza entrada/salida: el evento se agrega a un buffer circular en memoria
+(si se llena, se descartan los eventos más antiguos) y un hilo en segundo plano los escribe en lotes
+en la consola y/o en un archivo rotativo. El texto se formatea recién al escribirse, por lo que los
+argumentos se pasan por separado: registrar_evento("Se modificaron {} fila(s)", filas).
+El rastreo de cada consulta y sentencia SQL se habilita con configurar_registro(rastreo_sql=True);
+deshabilitado, su costo es la lectura de la variable 'rastreo_sql_activo'.
+"""
+
+import atexit                       # Escritura de los eventos pendientes al finalizar el proceso
+import os                           # Rotación del archivo de eventos
+import sys                          # Salida por consola
+import threading                    # Hilo de escritura en segundo plano
+import time                         # Fecha y hora de cada evento
+from collections import deque       # Buffer circular de eventos
+
+
+# Niveles de severidad
+DEPURACION = 10
+INFO = 20
+ADVERTENCIA = 30
+ERROR = 40
+
+NOMBRES_DE_NIVELES = {DEPURACION: "DEPURACION", INFO: "INFO", ADVERTENCIA: "ADVERTENCIA", ERROR: "ERROR"}
+
+# Configuración vigente (ver configurar_registro)
+nivel_minimo = INFO
+rastreo_sql_activo = False
+configuracion = {
+    "consola": True,
+    "archivo": None,
+    "tamaño_maximo": 5 * 1024 * 1024,     # Bytes a partir de los cuales se rota el archivo
+    "copias": 3,                          # Cantidad de archivos rotados que se conservan
+    "intervalo": 0.5                      # Segundos máximos de espera entre escrituras
+}
+
+# Buffer circular de eventos pendientes de escribir: (marca de tiempo, nivel, texto, argumentos)
+eventos_pendientes = deque(maxlen=10000)
+eventos_descartados = 0
+
+_hay_eventos = threading.Event()
+_cerrojo_escritura = threading.Lock()
+_hilo_escritor = None
+
+
+def configurar_registro(nivel=INFO, consola=True, archivo=None, rastreo_sql=False, tamaño_maximo=5 * 1024 * 1024, copias=3, capacidad=10000):
+    # Configura el registro de eventos. Los eventos de nivel menor a 'nivel' se ignoran sin costo.
+    # Si se indica 'archivo', los eventos se escriben además en ese archivo, rotándolo al superar 'tamaño_maximo' bytes.
+    # 'rastreo_sql' habilita un evento de depuración por cada consulta y sentencia SQL ejecutada.
+    global nivel_minimo, rastreo_sql_activo, eventos_pendientes
+
+    vaciar_registro()
+    nivel_minimo = DEPURACION if rastreo_sql else nivel
+    rastreo_sql_activo = rastreo_sql
+    configuracion["consola"] = consola
+    configuracion["archivo"] = archivo
+    configuracion["tamaño_maximo"] = tamaño_maximo
+    configuracion["copias"] = copias
+    if capacidad != eventos_pendientes.maxlen:
+        eventos_pendientes = deque(eventos_pendientes, maxlen=capacidad)
+
+def registrar_evento(texto, *argumentos, nivel=INFO):
+    # Agrega un evento al buffer. Si se reciben argumentos, el texto se formatea con texto.format(*argumentos) al escribirse.
+    global eventos_descartados, _hilo_escritor
+
+    if nivel < nivel_minimo:
+        return
+
+    if len(eventos_pendientes) == eventos_pendientes.maxlen:
+        eventos_descartados += 1
+    eventos_pendientes.append((time.time(), nivel, texto, argumentos))
+
+    if _hilo_escritor is None:
+        _hilo_escritor = threading.Thread(target=_escribir_eventos_en_segundo_plano, name="gemprop-eventos", daemon=True)
+        _hilo_escritor.start()
+    _hay_eventos.set()
+
+def vaciar_registro():
+    # Escribe en el momento todos los eventos pendientes (por ejemplo antes de finalizar el proceso)
+    with _cerrojo_escritura:
+        _escribir_lote()
+
+def formatear_evento(evento):
+    # Texto de un evento: "[aaaa/mm/dd hh:mm:ss] NIVEL texto"
+    marca_de_tiempo, nivel, texto, argumentos = evento
+    fecha = time.localtime(marca_de_tiempo)
+    fecha_formateada = ("{}/{:02}/{:02} {}:{:02}:{:02}".format(fecha.tm_year, fecha.tm_mon, fecha.tm_mday, fecha.tm_hour, fecha.tm_min, fecha.tm_sec))
+    if argumentos:
+        try:
+            texto = texto.format(*argumentos)
+        except (IndexError, KeyError, ValueError):
+            texto = f"{texto} {argumentos}"
+    if nivel == INFO:
+        return f"[{fecha_formateada}] {texto}"
+    return f"[{fecha_formateada}] {NOMBRES_DE_NIVELES.get(nivel, nivel)} {texto}"
+
+def _escribir_eventos_en_segundo_plano():
+    # Ciclo del hilo escritor: espera eventos y los escribe en lotes
+    while True:
+        _hay_eventos.wait(configuracion["intervalo"])
+        _hay_eventos.clear()
+        with _cerrojo_escritura:
+            _escribir_lote()
+
+def _escribir_lote():
+    # Extrae del buffer todos los eventos pendientes y los escribe juntos en la consola y/o el archivo
+    global eventos_descartados
+
+    lineas = []
+    while eventos_pendientes:
+        try:
+            lineas.append(formatear_evento(eventos_pendientes.popleft()))
+        except IndexError:
+            break
+    if eventos_descartados > 0:
+        lineas.append(formatear_evento((time.time(), ADVERTENCIA, "Se descartaron {} evento(s) por falta de espacio en el buffer", (eventos_descartados,))))
+        eventos_descartados = 0
+    if len(lineas) == 0:
+        return
+
+    bloque = "\n".join(lineas) + "\n"
+    if configuracion["consola"] and sys.stdout is not None:     # En Windows, pythonw no tiene consola
+        sys.stdout.write(bloque)
+        sys.stdout.flush()
+    if configuracion["archivo"] is not None:
+        try:
+            _rotar_archivo(len(bloque.encode("utf-8")))
+            with open(configuracion["archivo"], "a", encoding="utf-8") as archivo:
+                archivo.write(bloque)
+        except OSError as err:
+            sys.stderr.write(f"No se pudo escribir el archivo de eventos [{configuracion['archivo']}]: {err}\n")
+
+def _rotar_archivo(bytes_a_escribir):
+    # Si el archivo superaría el tamaño máximo, se renombra como .1 (desplazando .1 a .2, etc.) y se comienza uno nuevo
+    nombre = configuracion["archivo"]
+    try:
+        tamaño_actual = os.path.getsize(nombre)
+    except OSError:
+        return
+    if tamaño_actual + bytes_a_escribir <= configuracion["tamaño_maximo"]:
+        return
+
+    for numero in range(configuracion["copias"] - 1, 0, -1):
+        if os.path.exists(f"{nombre}.{numero}"):
+            os.replace(f"{nombre}.{numero}", f"{nombre}.{numero + 1}")
+    if configuracion["copias"] > 0:
+        os.replace(nombre, f"{nombre}.1")
+    else:
+        os.remove(nombre)
+
+
+atexit.register(vaciar_registro)
@@ -0,0 +1,163 @@
+"""
+Explosión de la lista de materiales (BOM) de un producto
+
+Un producto puede usar materiales del almacén (tabla 'materiales_por_producto') y otros productos
+como subconjuntos (tabla 'productos_por_producto'), con cualquier cantidad de niveles. La explosión
+de un producto es la lista plana de materiales del almacén, con las unidades necesarias para
+confeccionar una unidad del producto.
+
+Las explosiones se memorizan por conexión y por producto. Cuando cambia una relación del BOM de un
+producto solo se descartan las explosiones de ese producto y de sus ancestros (los productos que lo
+usan directa o indirectamente), el resto de la memoria sigue siendo válida. Lo mismo ocurre cuando otra
+conexión modifica la base de datos ('PRAGMA data_version'): se descartan las explosiones de los productos
+cuyo BOM figura en el registro de cambios (ver sql.cambios_externos) y las de sus ancestros.
+"""
+
+import json                         # Envío de la explosión como un único parámetro de consulta
+import weakref                      # Memorias que se liberan junto con su conexión
+
+from gemprop_motor.eventos import registrar_evento, ADVERTENCIA
+from gemprop_motor.sql import ejecutar_consulta_sql, cambios_externos
+
+
+# Explosiones memorizadas: conexión -> {"explosiones": {id_producto: {id_material: unidades por unidad de producto}},
+#                                      "sincronizacion": cambios vistos de otras conexiones (ver sql.cambios_externos)}
+explosiones_por_conexion = weakref.WeakKeyDictionary()
+
+
+def explosion_recuperar_ancestros(conexion_bd, id_producto):
+    # Retorna el conjunto de productos que usan al producto indicado, directa o indirectamente, o None si hubo un error.
+    # Recorre hacia arriba la relación 'productos_por_producto' usando el índice por id_subproducto.
+    sql = """
+        WITH RECURSIVE ancestros(id) AS (
+            SELECT id_producto FROM productos_por_producto WHERE id_subproducto = ?
+            UNION
+            SELECT r.id_producto FROM productos_por_producto r INNER JOIN ancestros a ON r.id_subproducto = a.id
+        )
+        SELECT id FROM ancestros
+        """
+    registros = ejecutar_consulta_sql(conexion_bd, sql, (id_producto,))
+    if registros is None:
+        return None
+
+    return {registro[0] for registro in registros}
+
+def explosion_genera_ciclo(conexion_bd, id_producto, id_subproducto):
+    # Verifica si usar 'id_subproducto' como componente de 'id_producto' generaría un ciclo en el BOM,
+    # es decir si 'id_producto' es el mismo subproducto o ya es un componente (a cualquier nivel) del subproducto.
+    # Retorna None si no pudo realizarse la verificación.
+    if id_producto == id_subproducto:
+        return True
+
+    ancestros = explosion_recuperar_ancestros(conexion_bd, id_producto)
+    if ancestros is None:
+        return None
+
+    return id_subproducto in ancestros
+
+def _explosiones(conexion_bd):
+    # Retorna las explosiones memorizadas de la conexión, descartando las de los productos cuyo BOM modificaron otras conexiones
+    memoria = explosiones_por_conexion.get(conexion_bd)
+    if memoria is None:
+        memoria = explosiones_por_conexion[conexion_bd] = {"explosiones": {}, "sincronizacion": {}}
+
+    cambios = cambios_externos(conexion_bd, memoria["sincronizacion"])
+    if cambios is False:
+        memoria["explosiones"].clear()
+    elif cambios:
+        for id_producto in cambios.get("bom", ()):
+            explosion_invalidar_producto(conexion_bd, id_producto)
+    return memoria["explosiones"]
+
+def explosion_invalidar_producto(conexion_bd, id_producto):
+    # Descarta la explosión memorizada del producto y la de todos sus ancestros.
+    # Debe invocarse cada vez que cambia el BOM del producto (alta, baja o modificación de una relación).
+    memoria = explosiones_por_conexion.get(conexion_bd)
+    if memoria is None or not memoria["explosiones"]:
+        return
+
+    explosiones = memoria["explosiones"]
+    ancestros = explosion_recuperar_ancestros(conexion_bd, id_producto)
+    if ancestros is None:     # Sin poder determinar los ancestros, se descarta toda la memoria de la conexión
+        explosiones.clear()
+        return
+
+    explosiones.pop(id_producto, None)
+    for id_ancestro in ancestros:
+        explosiones.pop(id_ancestro, None)
+
+def explosion_descartar(conexion_bd):
+    # Descarta todas las explosiones memorizadas de la conexión (por ejemplo luego de una importación masiva)
+    memoria = explosiones_por_conexion.get(conexion_bd)
+    if memoria is not None:
+        memoria["explosiones"].clear()
+
+def explosion_de_materiales(conexion_bd, id_producto):
+    # Retorna un diccionario {id_material: unidades} con los materiales del almacén necesarios para confeccionar
+    # una unidad del producto, incluyendo los de todos sus subproductos, o None si hubo un error.
+    # El diccionario retornado es compartido con la memoria de explosiones y no debe modificarse.
+    explosiones = _explosiones(conexion_bd)
+    if id_producto in explosiones:
+        return explosiones[id_producto]
+
+    return _explotar_producto(conexion_bd, id_producto, explosiones, set())
+
+def explosion_de_productos(conexion_bd, ids_productos):
+    # Igual que explosion_de_materiales() para varios productos, verificando una sola vez si otra conexión modificó la base de datos.
+    # Retorna un diccionario {id_producto: explosión}, o None si hubo un error.
+    explosiones = _explosiones(conexion_bd)
+    resultado = {}
+    for id_producto in ids_productos:
+        explosion = explosiones.get(id_producto)
+        if explosion is None:
+            explosion = _explotar_producto(conexion_bd, id_producto, explosiones, set())
+            if explosion is None:
+                return None
+        resultado[id_producto] = explosion
+
+    return resultado
+
+def _explotar_producto(conexion_bd, id_producto, explosiones, productos_en_curso):
+    # Calcula (y memoriza) la explosión del producto, reutilizando las explosiones ya memorizadas de sus subproductos
+    if id_producto in productos_en_curso:     # Protección ante un ciclo introducido por fuera del motor
+        registrar_evento("El BOM del producto con id=[{}] contiene un ciclo", id_producto, nivel=ADVERTENCIA)
+        return None
+    productos_en_curso.add(id_producto)
+
+    materiales = ejecutar_consulta_sql(conexion_bd, "SELECT id_material, cantidad_de_unidades FROM materiales_por_producto WHERE id_producto = ?", (id_producto,))
+    subproductos = ejecutar_consulta_sql(conexion_bd, "SELECT id_subproducto, cantidad_de_unidades FROM productos_por_producto WHERE id_producto = ?", (id_producto,))
+    if materiales is None or subproductos is None:
+        return None
+
+    explosion = {}
+    for id_material, unidades in materiales:
+        explosion[id_material] = explosion.get(id_material, 0) + unidades
+
+    for id_subproducto, unidades_subproducto in subproductos:
+        explosion_subproducto = explosiones.get(id_subproducto)
+        if explosion_subproducto is None:
+            explosion_subproducto = _explotar_producto(conexion_bd, id_subproducto, explosiones, productos_en_curso)
+            if explosion_subproducto is None:
+                return None
+        for id_material, unidades in explosion_subproducto.items():
+            explosion[id_material] = explosion.get(id_material, 0) + unidades * unidades_subproducto
+
+    productos_en_curso.discard(id_producto)
+    explosiones[id_producto] = explosion
+    return explosion
+
+def explosion_recuperar_materiales(conexion_bd, id_producto):
+    # Retorna la explosión del producto como lista de registros (id_material, descripcion_material, unidades),
+    # obteniendo las descripciones de todos los materiales en una única consulta, o None si hubo un error.
+    explosion = explosion_de_materiales(conexion_bd, id_producto)
+    if explosion is None:
+        return None
+
+    sql = """
+        SELECT m.id, m.descripcion, json_extract(e.value, '$[1]')
+        FROM json_each(?) e
+        INNER JOIN materiales m
+        ON m.id = json_extract(e.value, '$[0]')
+        ORDER BY m.id
+        """
+    return ejecutar_consulta_sql(conexion_bd, sql, (json.dumps(list(explosion.items())),))
@@ -0,0 +1,126 @@
+"""
+Exportación de reportes a archivos CSV o JSONL
+
+Cada reporte es una consulta cuyos registros se leen del cursor en bloques (ver iterar_consulta_sql)
+y se escriben a medida que se leen, por lo que la memoria usada es constante sin importar la cantidad
+de registros, y la salida comienza a producirse de inmediato. El destino puede ser un archivo o
+cualquier objeto de texto abierto para escritura, por ejemplo sys.stdout.
+
+Las columnas de los reportes de materiales y de materiales por producto coinciden con las que acepta
+la importación (ver importacion.py), por lo que un archivo exportado puede volver a importarse.
+
+Uso desde la línea de comandos (ver __main__.py):
+    python -m gemprop_motor exportar <base de datos> <reporte> [archivo | -] [--formato csv|jsonl]
+"""
+
+import csv                          # Escritura de archivos CSV
+import json                         # Escritura de archivos JSONL
+import os                           # Extensión del archivo de destino
+import sqlite3                      # Gestión de errores accediendo a la base de datos
+
+from gemprop_motor.eventos import registrar_evento, ERROR
+from gemprop_motor.sql import iterar_consulta_sql
+
+
+# Reportes disponibles: nombre -> (columnas, consulta)
+REPORTES = {
+    "materiales": (
+        ("id", "descripcion", "stock_actual", "stock_reposicion", "demora_reposicion", "cantidad_reposicion"),
+        "SELECT id, descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion FROM materiales ORDER BY id"
+    ),
+    "productos": (
+        ("id", "descripcion", "tiempo_confeccion"),
+        "SELECT id, descripcion, tiempo_confeccion FROM productos ORDER BY id"
+    ),
+    "bom": (
+        ("producto", "material", "cantidad"),
+        """SELECT p.descripcion, m.descripcion, r.cantidad_de_unidades
+           FROM materiales_por_producto r
+           INNER JOIN productos p ON p.id = r.id_producto
+           INNER JOIN materiales m ON m.id = r.id_material
+           ORDER BY r.id_producto, r.id_material"""
+    ),
+    "subproductos": (
+        ("producto", "subproducto", "cantidad"),
+        """SELECT p.descripcion, s.descripcion, r.cantidad_de_unidades
+           FROM productos_por_producto r
+           INNER JOIN productos p ON p.id = r.id_producto
+           INNER JOIN productos s ON s.id = r.id_subproducto
+           ORDER BY r.id_producto, r.id_subproducto"""
+    ),
+    "bajo_reposicion": (
+        ("id", "descripcion", "stock_actual", "stock_reposicion", "demora_reposicion", "cantidad_reposicion"),
+        """SELECT m.id, m.descripcion, m.stock_actual, m.stock_reposicion, m.demora_reposicion, m.cantidad_reposicion
+           FROM cola_de_reposicion c
+           INNER JOIN materiales m ON m.id = c.id_material
+           ORDER BY m.id"""
+    ),
+    "movimientos": (
+        ("id", "id_material", "fecha", "tipo", "cantidad", "referencia"),
+        "SELECT id, id_material, fecha, tipo, cantidad, referencia FROM movimientos_de_stock ORDER BY id"
+    ),
+    "pedidos": (
+        ("id", "fecha", "estado", "demora_maxima", "tiempo_confeccion", "fecha_entrega", "producto", "cantidad"),
+        """SELECT p.id, p.fecha, p.estado, p.demora_maxima, p.tiempo_confeccion, p.fecha_entrega, pr.descripcion, l.cantidad
+           FROM pedidos p
+           INNER JOIN lineas_de_pedido l ON l.id_pedido = p.id
+           LEFT JOIN productos pr ON pr.id = l.id_producto
+           ORDER BY p.id, l.id_producto"""
+    ),
+    "ordenes_de_compra": (
+        ("id", "material", "cantidad", "fecha_emision", "fecha_entrega", "fecha_recepcion"),
+        """SELECT o.id, m.descripcion, o.cantidad, o.fecha_emision, o.fecha_entrega, o.fecha_recepcion
+           FROM ordenes_de_compra o
+           INNER JOIN materiales m ON m.id = o.id_material
+           ORDER BY o.id"""
+    )
+}
+
+
+def exportar_reporte(conexion_bd, reporte, destino, formato=None):
+    # Escribe el reporte indicado en 'destino', que puede ser la ruta de un archivo o un objeto de texto abierto para escritura.
+    # Si no se indica el formato, se deduce de la extensión del archivo (por defecto csv).
+    # Retorna la cantidad de registros exportados, o None si hubo un error.
+    if reporte not in REPORTES:
+        registrar_evento("Reporte desconocido [{}]. Reportes disponibles: {}", reporte, ", ".join(REPORTES), nivel=ERROR)
+        return None
+    if formato is None:
+        formato = "jsonl" if isinstance(destino, str) and os.path.splitext(destino)[1].lower() == ".jsonl" else "csv"
+
+    columnas, consulta = REPORTES[reporte]
+    registros = iterar_consulta_sql(conexion_bd, consulta)
+    if registros is None:
+        return None
+
+    try:
+        if isinstance(destino, str):
+            with open(destino, "w", newline="", encoding="utf-8") as archivo:
+                exportados = _escribir_registros(archivo, columnas, registros, formato)
+        else:
+            exportados = _escribir_registros(destino, columnas, registros, formato)
+    except sqlite3.Error:
+        return None         # El error ya fue registrado por iterar_consulta_sql()
+    except OSError as err:
+        registrar_evento("No se pudo escribir el reporte '{}' en [{}]\nError: [{}]", reporte, destino, err, nivel=ERROR)
+        return None
+
+    registrar_evento("Reporte '{}' exportado: {} registro(s)", reporte, exportados)
+    return exportados
+
+def _escribir_registros(archivo, columnas, registros, formato):
+    # Escribe los registros en el archivo a medida que se leen. Retorna la cantidad de registros escritos.
+    exportados = 0
+    if formato == "jsonl":
+        for registro in registros:
+            archivo.write(json.dumps(dict(zip(columnas, registro)), ensure_ascii=False))
+            archivo.write("\n")
+            exportados += 1
+    else:
+        escritor = csv.writer(archivo)
+        escritor.writerow(columnas)
+        for registro in registros:
+            escritor.writerow(registro)
+            exportados += 1
+
+    return exportados
+
@@ -0,0 +1,133 @@
+"""
+Generador de bases de datos sintéticas
+
+Crea bases de datos de GEMPROP del tamaño que se indique, para medir el rendimiento del motor (ver
+rendimiento.py) con volúmenes muy superiores a los de base_demo/gemprop_demo.db. La generación es
+reproducible: con la misma semilla y los mismos parámetros se obtiene siempre la misma base de datos.
+
+Parámetros de la generación:
+- cantidad de materiales y de productos,
+- materiales por producto (BOM): cada producto usa, en promedio, esa cantidad de materiales distintos,
+- subproductos por producto y niveles del BOM: los productos se reparten en niveles y cada producto solo
+  usa subproductos del nivel siguiente, por lo que el BOM no tiene ciclos y su profundidad es acotada,
+- distribución del stock actual de los materiales (ver DISTRIBUCIONES_DE_STOCK) y stock máximo.
+
+La base se crea con el esquema vigente (ver esquema.py), por lo que los triggers de la cola de reposición
+y del libro de movimientos se aplican a los materiales generados como a cualquier alta.
+"""
+
+import os                           # Verificación de que la base de datos no exista, y baja de una generación fallida
+import random                       # Generación reproducible a partir de una semilla
+import time                         # Duración de la generación
+
+from gemprop_motor.eventos import registrar_evento, ERROR
+from gemprop_motor.sql import abrir_base_de_datos, ejecutar_sentencia_multiple_sql
+from gemprop_motor.esquema import actualizar_esquema
+
+
+# Distribuciones del stock actual: nombre -> función (generador aleatorio, stock máximo) -> stock
+DISTRIBUCIONES_DE_STOCK = {
+    # Cualquier valor entre 0 y el máximo con la misma probabilidad
+    "uniforme": lambda aleatorio, maximo: aleatorio.randint(0, maximo),
+    # Concentrado alrededor de la mitad del máximo
+    "normal": lambda aleatorio, maximo: min(maximo, max(0, round(aleatorio.gauss(maximo / 2, maximo / 6)))),
+    # La mayoría de los materiales con poco stock y una cuarta parte sin stock: muchos pedidos con demora
+    "escasa": lambda aleatorio, maximo: 0 if aleatorio.random() < 0.25 else min(maximo, int(aleatorio.expovariate(10 / maximo)))
+}
+
+CANTIDADES_DE_REPOSICION = (5, 10, 20, 50, 100)     # Cantidades de reposición posibles de los materiales generados
+
+
+def generar_base_de_datos(ruta_base_de_datos, materiales=1000, productos=200, materiales_por_producto=8, subproductos_por_producto=1,
+                          niveles=3, distribucion_stock="uniforme", stock_maximo=500, semilla=0):
+    # Crea la base de datos indicada, que no debe existir, con datos sintéticos generados a partir de la semilla.
+    # Retorna un resumen con los parámetros, la cantidad de registros de cada tabla y la duración, o None si hubo un error.
+    if distribucion_stock not in DISTRIBUCIONES_DE_STOCK:
+        registrar_evento("Distribución de stock desconocida [{}]. Distribuciones disponibles: {}", distribucion_stock, ", ".join(DISTRIBUCIONES_DE_STOCK), nivel=ERROR)
+        return None
+    if os.path.exists(ruta_base_de_datos):
+        registrar_evento("La base de datos [{}] ya existe, no se generan datos sobre una base existente", ruta_base_de_datos, nivel=ERROR)
+        return None
+    if materiales <= 0 or productos <= 0 or niveles <= 0:
+        registrar_evento("La cantidad de materiales, de productos y de niveles debe ser mayor a cero", nivel=ERROR)
+        return None
+    if stock_maximo <= 0:
+        registrar_evento("El stock máximo debe ser mayor a cero", nivel=ERROR)
+        return None
+
+    inicio = time.perf_counter()
+    conexion_bd = abrir_base_de_datos(ruta_base_de_datos)
+    if conexion_bd is None:
+        return None
+    if not actualizar_esquema(conexion_bd):
+        _descartar_base_de_datos(conexion_bd, ruta_base_de_datos)
+        return None
+
+    aleatorio = random.Random(semilla)
+    generar_stock = DISTRIBUCIONES_DE_STOCK[distribucion_stock]
+    registros_materiales = [
+        (i, f"Material {i:07d}", generar_stock(aleatorio, stock_maximo), aleatorio.randint(1, max(1, stock_maximo // 5)),
+         aleatorio.randint(1, 30), aleatorio.choice(CANTIDADES_DE_REPOSICION))
+        for i in range(1, materiales + 1)
+    ]
+    registros_productos = [(i, f"Producto {i:07d}", aleatorio.randint(0, 5)) for i in range(1, productos + 1)]
+
+    # Cada producto usa entre 1 y 2 x materiales_por_producto - 1 materiales distintos (en promedio, materiales_por_producto)
+    registros_bom = []
+    for id_producto in range(1, productos + 1):
+        cantidad = min(materiales, aleatorio.randint(1, max(1, 2 * materiales_por_producto - 1)))
+        for id_material in aleatorio.sample(range(1, materiales + 1), cantidad):
+            registros_bom.append((id_producto, id_material, aleatorio.randint(1, 5)))
+
+    # Los productos del nivel n solo usan subproductos del nivel n + 1; los del último nivel no tienen subproductos
+    registros_subproductos = []
+    limites = [productos * nivel // niveles for nivel in range(niveles + 1)]
+    for nivel in range(niveles - 1):
+        siguientes = range(limites[nivel + 1] + 1, limites[nivel + 2] + 1)
+        if len(siguientes) == 0:
+            continue
+        for id_producto in range(limites[nivel] + 1, limites[nivel + 1] + 1):
+            cantidad = min(len(siguientes), aleatorio.randint(0, 2 * subproductos_por_producto))
+            for id_subproducto in aleatorio.sample(siguientes, cantidad):
+                registros_subproductos.append((id_producto, id_subproducto, aleatorio.randint(1, 3)))
+
+    sentencias = [
+        ("INSERT INTO materiales(id, descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion) VALUES (?, ?, ?, ?, ?, ?)", registros_materiales),
+        ("INSERT INTO productos(id, descripcion, tiempo_confeccion) VALUES (?, ?, ?)", registros_productos),
+        ("INSERT INTO materiales_por_producto(id_producto, id_material, cantidad_de_unidades) VALUES (?, ?, ?)", registros_bom),
+        ("INSERT INTO productos_por_producto(id_producto, id_subproducto, cantidad_de_unidades) VALUES (?, ?, ?)", registros_subproductos)
+    ]
+    for sentencia, registros in sentencias:
+        if registros and ejecutar_sentencia_multiple_sql(conexion_bd, sentencia, registros) is None:
+            _descartar_base_de_datos(conexion_bd, ruta_base_de_datos)
+            return None
+    conexion_bd.close()
+
+    resumen = {
+        "base_de_datos": ruta_base_de_datos,
+        "semilla": semilla,
+        "distribucion_stock": distribucion_stock,
+        "stock_maximo": stock_maximo,
+        "niveles": niveles,
+        "materiales": len(registros_materiales),
+        "productos": len(registros_productos),
+        "materiales_por_producto": len(registros_bom),
+        "subproductos_por_producto": len(registros_subproductos),
+        "segundos": time.perf_counter() - inicio
+    }
+    registrar_evento("Base de datos sintética [{}] generada: {} material(es), {} producto(s), {} asociación(es) de materiales, {} de subproductos en {:.1f} s",
+                     ruta_base_de_datos, resumen["materiales"], resumen["productos"], resumen["materiales_por_producto"], resumen["subproductos_por_producto"], resumen["segundos"])
+    return resumen
+
+def _descartar_base_de_datos(conexion_bd, ruta_base_de_datos):
+    # Cierra y elimina la base de datos de una generación fallida (junto con sus archivos de journal), para que no se
+    # la confunda con una base completa: rendimiento.py reutiliza las bases generadas que ya existen
+    conexion_bd.close()
+    for ruta in (ruta_base_de_datos, ruta_base_de_datos + "-journal", ruta_base_de_datos + "-wal", ruta_base_de_datos + "-shm"):
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+        except OSError as err:
+            registrar_evento("No se pudo eliminar el archivo [{}] de la generación fallida\nError: [{}]", ruta, err, nivel=ERROR)
+    registrar_evento("Se eliminó la base de datos [{}] de la generación fallida", ruta_base_de_datos, nivel=ERROR)
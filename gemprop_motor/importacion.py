@@ -0,0 +1,210 @@
+"""
+Importación masiva de materiales y de materiales por producto (BOM) desde archivos CSV o JSONL
+
+Los archivos se leen fila por fila y se procesan en lotes de tamaño fijo: cada lote se valida y se
+inserta con executemany() en su propia transacción, por lo que la memoria usada no depende del tamaño
+del archivo (solo del mapa de descripciones, que tiene una entrada por material o producto).
+Las descripciones se resuelven a ids con un mapa cargado una única vez al comenzar, sin una consulta por fila.
+
+Formatos aceptados (el formato se deduce de la extensión .csv o .jsonl si no se indica):
+- CSV con encabezado, separado por comas y codificado en UTF-8.
+- JSONL: un objeto JSON por línea.
+
+Columnas de materiales: descripcion, stock_actual, stock_reposicion, demora_reposicion y, en forma opcional,
+cantidad_reposicion (si falta o está vacía se usa CANTIDAD_REPOSICION_PREDETERMINADA)
+Columnas de materiales por producto: producto, material, cantidad (descripciones del producto y del material)
+
+Cada importación retorna un resumen con las filas leídas, importadas y rechazadas, las filas por segundo
+y los primeros rechazos (número de fila y motivo). Si se indica 'ruta_rechazos', todas las filas
+rechazadas se escriben en ese archivo CSV junto con el motivo.
+
+Uso desde la línea de comandos (ver __main__.py):
+    python -m gemprop_motor importar <base de datos> materiales|bom <archivo> [--rechazos <archivo>]
+"""
+
+import csv                          # Lectura de archivos CSV y escritura de rechazos
+import json                         # Lectura de archivos JSONL
+import os                           # Extensión del archivo a importar
+import time                         # Filas importadas por segundo
+from itertools import islice        # Lectura del archivo de a un lote
+
+from gemprop_motor.eventos import registrar_evento, ADVERTENCIA
+from gemprop_motor.sql import ejecutar_consulta_sql, ejecutar_sentencia_multiple_sql
+from gemprop_motor.catalogo import catalogo_descartar
+from gemprop_motor.explosion import explosion_descartar
+from gemprop_motor.reposicion import CANTIDAD_REPOSICION_PREDETERMINADA
+from gemprop_motor.atp import atp_descartar
+
+
+TAMAÑO_DE_LOTE = 5000               # Filas validadas e insertadas en cada transacción
+MAXIMO_DE_RECHAZOS_EN_RESUMEN = 100 # Rechazos que se conservan en el resumen (el total se informa siempre)
+
+COLUMNAS_MATERIALES = ("descripcion", "stock_actual", "stock_reposicion", "demora_reposicion", "cantidad_reposicion")
+COLUMNAS_MATERIALES_POR_PRODUCTO = ("producto", "material", "cantidad")
+
+
+def importar_leer_filas(ruta_archivo, formato=None):
+    # Generador que retorna, de a una, las filas del archivo como tuplas (número de fila, diccionario de columnas).
+    # Las filas que no pueden interpretarse se retornan con el diccionario en None.
+    if formato is None:
+        formato = os.path.splitext(ruta_archivo)[1].lstrip(".").lower()
+
+    with open(ruta_archivo, newline="", encoding="utf-8-sig") as archivo:
+        if formato == "csv":
+            for numero_de_fila, fila in enumerate(csv.DictReader(archivo), start=2):    # La fila 1 es el encabezado
+                yield numero_de_fila, fila
+        elif formato == "jsonl":
+            for numero_de_fila, linea in enumerate(archivo, start=1):
+                if not linea.strip():
+                    continue
+                try:
+                    fila = json.loads(linea)
+                except ValueError:
+                    fila = None
+                yield numero_de_fila, fila if isinstance(fila, dict) else None
+        else:
+            raise ValueError(f"Formato de importación desconocido [{formato}]: se admiten csv y jsonl")
+
+def importar_materiales(conexion_bd, ruta_archivo, formato=None, tamaño_de_lote=TAMAÑO_DE_LOTE, al_progresar=None, ruta_rechazos=None):
+    # Importa los materiales del archivo. Se rechazan las filas incompletas, con valores no numéricos o negativos, con nivel
+    # de reposición, demora o cantidad de reposición igual a cero (como en el formulario de materiales), y las descripciones que ya existen en la
+    # base de datos o que se repiten en el archivo. Retorna el resumen de la importación, o None si hubo un error.
+    registros = ejecutar_consulta_sql(conexion_bd, "SELECT descripcion FROM materiales")
+    if registros is None:
+        return None
+    descripciones = {registro[0] for registro in registros}
+
+    def validar(fila):
+        descripcion = str(fila.get("descripcion") or "").strip()
+        if len(descripcion) == 0:
+            return None, "La descripción del material es requerida"
+        if descripcion in descripciones:
+            return None, "El material ya existe"
+        if fila.get("cantidad_reposicion") in (None, ""):
+            fila = dict(fila, cantidad_reposicion=CANTIDAD_REPOSICION_PREDETERMINADA)
+        valores = _valores_enteros(fila, COLUMNAS_MATERIALES[1:])
+        if valores is None:
+            return None, "Los valores de stock actual, nivel, demora y cantidad de reposición deben ser números enteros"
+        stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion = valores
+        if stock_actual < 0 or stock_reposicion <= 0 or demora_reposicion <= 0 or cantidad_reposicion <= 0:
+            return None, "El stock actual no puede ser negativo, y el nivel, la demora y la cantidad de reposición deben ser mayores a cero"
+        descripciones.add(descripcion)
+        return (descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion), None
+
+    sql = "INSERT INTO materiales(descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion) VALUES (?, ?, ?, ?, ?)"
+    resumen = _importar(conexion_bd, "materiales", ruta_archivo, formato, tamaño_de_lote, validar, sql, al_progresar, ruta_rechazos)
+    if resumen is not None and resumen["importadas"] > 0:
+        catalogo_descartar(conexion_bd, "materiales")      # Alta masiva: el catálogo se vuelve a cargar en la próxima lectura
+        atp_descartar(conexion_bd)
+    return resumen
+
+def importar_materiales_por_producto(conexion_bd, ruta_archivo, formato=None, tamaño_de_lote=TAMAÑO_DE_LOTE, al_progresar=None, ruta_rechazos=None):
+    # Importa las asociaciones entre productos y materiales del archivo. El producto y el material deben existir; si la
+    # asociación ya existe se reemplaza su cantidad de unidades. Retorna el resumen de la importación, o None si hubo un error.
+    materiales = ejecutar_consulta_sql(conexion_bd, "SELECT descripcion, id FROM materiales")
+    productos = ejecutar_consulta_sql(conexion_bd, "SELECT descripcion, id FROM productos")
+    if materiales is None or productos is None:
+        return None
+    ids_materiales = dict(materiales)
+    ids_productos = dict(productos)
+    del materiales, productos
+
+    def validar(fila):
+        id_producto = ids_productos.get(str(fila.get("producto") or "").strip())
+        if id_producto is None:
+            return None, "El producto no existe"
+        id_material = ids_materiales.get(str(fila.get("material") or "").strip())
+        if id_material is None:
+            return None, "El material no existe"
+        valores = _valores_enteros(fila, ("cantidad",))
+        if valores is None or valores[0] <= 0:
+            return None, "La cantidad de unidades debe ser un número entero mayor a cero"
+        return (id_producto, id_material, valores[0]), None
+
+    sql = """
+        INSERT INTO materiales_por_producto(id_producto, id_material, cantidad_de_unidades) VALUES (?, ?, ?)
+        ON CONFLICT(id_producto, id_material) DO UPDATE SET cantidad_de_unidades = excluded.cantidad_de_unidades
+        """
+    resumen = _importar(conexion_bd, "materiales_por_producto", ruta_archivo, formato, tamaño_de_lote, validar, sql, al_progresar, ruta_rechazos)
+    if resumen is not None and resumen["importadas"] > 0:
+        explosion_descartar(conexion_bd)      # Cambiaron los BOM de muchos productos: se descartan todas las explosiones
+    return resumen
+
+def _valores_enteros(fila, columnas):
+    # Retorna la tupla de valores enteros de las columnas indicadas, o None si alguno falta o no es un número entero
+    valores = []
+    for columna in columnas:
+        valor = fila.get(columna)
+        if isinstance(valor, bool):
+            return None
+        if isinstance(valor, str):
+            valor = valor.strip()
+        try:
+            valor_entero = int(valor)
+        except (TypeError, ValueError):
+            return None
+        if isinstance(valor, float) and valor != valor_entero:
+            return None
+        valores.append(valor_entero)
+    return tuple(valores)
+
+def _importar(conexion_bd, tabla, ruta_archivo, formato, tamaño_de_lote, validar, sentencia_sql, al_progresar, ruta_rechazos):
+    # Lee el archivo de a un lote, valida cada fila con validar(fila) -> (datos, motivo de rechazo) e inserta las filas válidas
+    # del lote con una única sentencia executemany() y un único commit()
+    resumen = {"tabla": tabla, "archivo": ruta_archivo, "leidas": 0, "importadas": 0, "rechazadas": 0, "filas_por_segundo": 0.0, "rechazos": []}
+    inicio = time.perf_counter()
+    archivo_rechazos = None
+    escritor_rechazos = None
+
+    def rechazar(numero_de_fila, motivo, fila):
+        resumen["rechazadas"] += 1
+        if len(resumen["rechazos"]) < MAXIMO_DE_RECHAZOS_EN_RESUMEN:
+            resumen["rechazos"].append((numero_de_fila, motivo))
+        if escritor_rechazos is not None:
+            escritor_rechazos.writerow([numero_de_fila, motivo, json.dumps(fila, ensure_ascii=False)])
+
+    try:
+        if ruta_rechazos is not None:
+            archivo_rechazos = open(ruta_rechazos, "w", newline="", encoding="utf-8")
+            escritor_rechazos = csv.writer(archivo_rechazos)
+            escritor_rechazos.writerow(["fila", "motivo", "datos"])
+
+        filas = importar_leer_filas(ruta_archivo, formato)
+        while True:
+            lote = list(islice(filas, tamaño_de_lote))
+            if len(lote) == 0:
+                break
+
+            datos_del_lote = []
+            for numero_de_fila, fila in lote:
+                resumen["leidas"] += 1
+                if fila is None:
+                    rechazar(numero_de_fila, "La fila no puede interpretarse", None)
+                    continue
+                datos, motivo = validar(fila)
+                if datos is None:
+                    rechazar(numero_de_fila, motivo, fila)
+                else:
+                    datos_del_lote.append((numero_de_fila, fila, datos))
+
+            if datos_del_lote:
+                if ejecutar_sentencia_multiple_sql(conexion_bd, sentencia_sql, [datos for numero_de_fila, fila, datos in datos_del_lote]) is None:
+                    for numero_de_fila, fila, datos in datos_del_lote:     # La transacción del lote se deshizo completa
+                        rechazar(numero_de_fila, "Error de la base de datos al insertar el lote", fila)
+                else:
+                    resumen["importadas"] += len(datos_del_lote)
+
+            resumen["filas_por_segundo"] = resumen["leidas"] / max(time.perf_counter() - inicio, 1e-9)
+            if al_progresar is not None:
+                al_progresar(resumen)
+    except (OSError, UnicodeDecodeError, csv.Error, ValueError) as err:
+        registrar_evento("Error leyendo el archivo a importar [{}]\nError: [{}]", ruta_archivo, err, nivel=ADVERTENCIA)
+        return None
+    finally:
+        if archivo_rechazos is not None:
+            archivo_rechazos.close()
+
+    registrar_evento("Importación de '{}' desde [{}]: {} fila(s) leída(s), {} importada(s), {} rechazada(s), {:.0f} filas/s",
+                     tabla, ruta_archivo, resumen["leidas"], resumen["importadas"], resumen["rechazadas"], resumen["filas_por_segundo"])
+    return resumen
+
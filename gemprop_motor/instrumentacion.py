@@ -0,0 +1,180 @@
+"""
+Instrumentación de las consultas y sentencias SQL
+
+Las funciones de sql.py por las que pasa todo el acceso a la base de datos informan a este módulo, si la
+instrumentación está habilitada, cada consulta o sentencia ejecutada con su duración, la cantidad de filas
+leídas o modificadas y la función del motor que la invocó. Con cada medición:
+- se actualizan las estadísticas en memoria de la sentencia (ejecuciones, tiempo total y máximo, filas y un
+  histograma de duraciones en intervalos fijos, del que se estiman los percentiles), y de sus invocantes,
+- si la duración supera el umbral de consultas lentas, se obtiene el plan de ejecución de la sentencia
+  (EXPLAIN QUERY PLAN con los mismos argumentos), se registra como advertencia y se conserva en el registro
+  de consultas lentas (las más recientes),
+- se invoca a los observadores agregados con instrumentacion_agregar_observador(), por ejemplo para
+  exportar las mediciones a otro sistema.
+
+Deshabilitada (el valor por defecto), su costo en cada consulta es la lectura de la variable
+'instrumentacion_activa', como el rastreo de eventos SQL (ver eventos.py). Habilitada, cada medición
+cuesta unos pocos microsegundos, salvo las consultas lentas, que además ejecutan su plan de ejecución.
+"""
+
+from bisect import bisect_left      # Intervalo del histograma de cada duración
+from collections import deque       # Registro de las consultas lentas más recientes
+import sys                          # Función invocante de cada consulta
+import sqlite3                      # Gestión de errores obteniendo el plan de ejecución
+import threading                    # Las consultas se ejecutan desde varios hilos (ver trabajador.py)
+import time                         # Fecha y hora de las consultas lentas
+
+from gemprop_motor.eventos import registrar_evento, ADVERTENCIA, ERROR
+
+
+# Límites superiores, en milisegundos, de los intervalos del histograma de duraciones (el último intervalo no tiene límite)
+INTERVALOS_DEL_HISTOGRAMA_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# Configuración vigente (ver instrumentacion_configurar)
+instrumentacion_activa = False
+umbral_consulta_lenta = 0.1         # Segundos a partir de los cuales una consulta se considera lenta
+capturar_planes = True              # Obtener el plan de ejecución de las consultas lentas
+
+# Estadísticas por sentencia: texto normalizado -> {"ejecuciones", "segundos", "maximo", "filas", "histograma", "invocantes"}
+estadisticas_por_sentencia = {}
+consultas_lentas = deque(maxlen=100)
+observadores = []
+
+_textos_normalizados = {}           # Texto de la sentencia -> texto con los espacios normalizados (clave de las estadísticas)
+_cerrojo = threading.Lock()
+
+
+def instrumentacion_configurar(activa=True, umbral_lento_ms=100, planes=True, capacidad_lentas=100):
+    # Habilita o deshabilita la instrumentación. Las consultas que demoran 'umbral_lento_ms' milisegundos o más se registran
+    # como lentas, con su plan de ejecución si 'planes' es True; se conservan las 'capacidad_lentas' más recientes.
+    global instrumentacion_activa, umbral_consulta_lenta, capturar_planes, consultas_lentas
+
+    umbral_consulta_lenta = umbral_lento_ms / 1000
+    capturar_planes = planes
+    if capacidad_lentas != consultas_lentas.maxlen:
+        consultas_lentas = deque(consultas_lentas, maxlen=capacidad_lentas)
+    instrumentacion_activa = activa
+
+def instrumentacion_agregar_observador(observador):
+    # Agrega una función que recibe cada medición: un diccionario con la sentencia, los segundos, las filas, la función
+    # invocante y si fue lenta. Los observadores se ejecutan en el hilo de la consulta y deben ser rápidos.
+    # Un observador ya agregado no se agrega de nuevo.
+    with _cerrojo:
+        if observador not in observadores:
+            observadores.append(observador)
+
+def instrumentacion_quitar_observador(observador):
+    # Quita un observador agregado con instrumentacion_agregar_observador()
+    with _cerrojo:
+        if observador in observadores:
+            observadores.remove(observador)
+
+def instrumentacion_reiniciar():
+    # Descarta las estadísticas y el registro de consultas lentas acumulados
+    with _cerrojo:
+        estadisticas_por_sentencia.clear()
+        consultas_lentas.clear()
+
+def instrumentacion_registrar(conexion_bd, sentencia_sql, argumentos, segundos, filas, invocante=None):
+    # Registra la medición de una sentencia. La invocan las funciones de sql.py; si no se indica la función invocante,
+    # es la que llamó a la función de sql.py (dos niveles por encima de esta en la pila).
+    if invocante is None:
+        invocante = sys._getframe(2).f_code.co_name
+    texto = _textos_normalizados.get(sentencia_sql)
+    if texto is None:
+        texto = _textos_normalizados.setdefault(sentencia_sql, " ".join(sentencia_sql.split()))
+    lenta = segundos >= umbral_consulta_lenta
+    intervalo = bisect_left(INTERVALOS_DEL_HISTOGRAMA_MS, segundos * 1000)
+
+    with _cerrojo:
+        estadisticas = estadisticas_por_sentencia.get(texto)
+        if estadisticas is None:
+            estadisticas = estadisticas_por_sentencia[texto] = {
+                "ejecuciones": 0, "segundos": 0.0, "maximo": 0.0, "filas": 0,
+                "histograma": [0] * (len(INTERVALOS_DEL_HISTOGRAMA_MS) + 1), "invocantes": {}
+            }
+        estadisticas["ejecuciones"] += 1
+        estadisticas["segundos"] += segundos
+        estadisticas["filas"] += max(filas, 0)
+        if segundos > estadisticas["maximo"]:
+            estadisticas["maximo"] = segundos
+        estadisticas["histograma"][intervalo] += 1
+        estadisticas["invocantes"][invocante] = estadisticas["invocantes"].get(invocante, 0) + 1
+        observadores_actuales = list(observadores) if observadores else None
+
+    if lenta:
+        _registrar_consulta_lenta(conexion_bd, texto, sentencia_sql, argumentos, segundos, filas, invocante)
+
+    if observadores_actuales:
+        medicion = {"sentencia": texto, "segundos": segundos, "filas": filas, "invocante": invocante, "lenta": lenta}
+        for observador in observadores_actuales:
+            try:
+                observador(medicion)
+            except Exception as err:
+                registrar_evento("Error en un observador de la instrumentación SQL\nError: [{}]", err, nivel=ERROR)
+
+def _registrar_consulta_lenta(conexion_bd, texto, sentencia_sql, argumentos, segundos, filas, invocante):
+    # Obtiene el plan de ejecución de la sentencia con los mismos argumentos y la agrega al registro de consultas lentas.
+    # Las sentencias que no admiten EXPLAIN (por ejemplo BEGIN o PRAGMA) se registran sin plan.
+    plan = None
+    if capturar_planes:
+        try:
+            cursor = conexion_bd.execute("EXPLAIN QUERY PLAN " + sentencia_sql, argumentos if argumentos is not None else ())
+            plan = [detalle for id_paso, id_padre, no_usado, detalle in cursor.fetchall()]
+        except (sqlite3.Error, ValueError):
+            plan = None
+
+    with _cerrojo:
+        consultas_lentas.append({
+            "fecha": time.strftime("%Y/%m/%d %H:%M:%S"),
+            "sentencia": texto,
+            "segundos": segundos,
+            "filas": filas,
+            "invocante": invocante,
+            "plan": plan
+        })
+    registrar_evento("Consulta lenta ({:.1f} ms, {} fila(s)) invocada por {}: [{}]\nPlan: {}", segundos * 1000, filas, invocante, texto,
+                     " | ".join(plan) if plan else "no disponible", nivel=ADVERTENCIA)
+
+def instrumentacion_estadisticas():
+    # Retorna una lista de diccionarios con las estadísticas de cada sentencia, ordenada por tiempo total descendente:
+    # sentencia, ejecuciones, tiempo total, medio y máximo, p50 y p99 estimados (límite superior de su intervalo del
+    # histograma), filas, histograma e invocantes
+    with _cerrojo:
+        copia = [(texto, dict(estadisticas, histograma=list(estadisticas["histograma"]), invocantes=dict(estadisticas["invocantes"])))
+                 for texto, estadisticas in estadisticas_por_sentencia.items()]
+
+    resultado = []
+    for texto, estadisticas in copia:
+        ejecuciones = estadisticas["ejecuciones"]
+        resultado.append({
+            "sentencia": texto,
+            "ejecuciones": ejecuciones,
+            "total_ms": estadisticas["segundos"] * 1000,
+            "media_ms": estadisticas["segundos"] * 1000 / ejecuciones,
+            "maximo_ms": estadisticas["maximo"] * 1000,
+            "p50_ms": _percentil(estadisticas, 0.50),
+            "p99_ms": _percentil(estadisticas, 0.99),
+            "filas": estadisticas["filas"],
+            "histograma": estadisticas["histograma"],
+            "invocantes": estadisticas["invocantes"]
+        })
+    resultado.sort(key=lambda sentencia: sentencia["total_ms"], reverse=True)
+    return resultado
+
+def _percentil(estadisticas, fraccion):
+    # Límite superior (en milisegundos) del intervalo del histograma que contiene el percentil; para el último intervalo, el máximo
+    objetivo = fraccion * estadisticas["ejecuciones"]
+    acumulado = 0
+    for intervalo, cantidad in enumerate(estadisticas["histograma"]):
+        acumulado += cantidad
+        if acumulado >= objetivo and cantidad > 0:
+            if intervalo < len(INTERVALOS_DEL_HISTOGRAMA_MS):
+                return min(INTERVALOS_DEL_HISTOGRAMA_MS[intervalo], estadisticas["maximo"] * 1000)
+            break
+    return estadisticas["maximo"] * 1000
+
+def instrumentacion_consultas_lentas():
+    # Retorna la lista de las consultas lentas registradas, de la más antigua a la más reciente
+    with _cerrojo:
+        return list(consultas_lentas)
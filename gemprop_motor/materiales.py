@@ -0,0 +1,116 @@
+"""
+Modelo de materiales
+
+Funciones de alta, baja, modificación y consulta de la tabla 'materiales'.
+Reciben todos los datos como argumentos, sin leer variables de la vista.
+Las consultas se responden desde el catálogo en memoria, que las altas, bajas y modificaciones actualizan.
+Los cambios de stock se registran como movimientos del libro de stock (ver movimientos.py).
+"""
+
+import sqlite3                      # Gestión de errores accediendo a la base de datos
+
+from gemprop_motor.eventos import registrar_evento, ERROR
+from gemprop_motor.metricas import metricas_incrementar
+from gemprop_motor.sql import ejecutar_consulta_sql, ejecutar_sentencia_sql
+from gemprop_motor.catalogo import catalogo_recuperar, catalogo_buscar, catalogo_buscar_por_texto, catalogo_buscar_id_por_descripcion, catalogo_guardar, catalogo_eliminar
+from gemprop_motor.disponibilidad import disponibilidad_actualizar_materiales
+from gemprop_motor.atp import atp_memorizada, atp_registrar_movimiento, atp_actualizar_demora, atp_recargar_registros, atp_descartar
+
+
+def materiales_insertar_registro_material(conexion_bd, descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion):
+
+    sql = "INSERT INTO materiales(descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion) VALUES (?, ?, ?, ?, ?)"
+    datos_material = (descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion)
+    if ejecutar_sentencia_sql(conexion_bd, sql, datos_material) is None:
+        return False
+
+    # Agregar el nuevo material al catálogo en memoria (su id lo asigna la base de datos)
+    sql = "SELECT id, descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion FROM materiales WHERE descripcion = ?"
+    registros = ejecutar_consulta_sql(conexion_bd, sql, (descripcion,)) or []
+    catalogo_guardar(conexion_bd, "materiales", registros)
+    atp_recargar_registros(conexion_bd, ids_materiales=[registro[0] for registro in registros])
+    return True
+
+def materiales_actualizar_registro_material(conexion_bd, id_material, descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion):
+    # Actualiza el registro de la base de datos cuyo ID coincide con el argumento id_material. Si cambió el stock, la diferencia
+    # se registra como un movimiento de ajuste (que actualiza el stock), en la misma transacción que el resto de los datos.
+    sql_anterior = "SELECT stock_actual FROM materiales WHERE id = ?"
+    sql_ajuste = "INSERT INTO movimientos_de_stock(id_material, tipo, cantidad) SELECT id, 'ajuste', ? - stock_actual FROM materiales WHERE id = ? AND stock_actual <> ?"
+    sql = "UPDATE materiales SET descripcion=?, stock_reposicion=?, demora_reposicion=?, cantidad_reposicion=? WHERE id=?"
+    try:
+        cursor = conexion_bd.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        anterior = cursor.execute(sql_anterior, (id_material,)).fetchone()
+        ajustes = cursor.execute(sql_ajuste, (stock_actual, id_material, stock_actual)).rowcount
+        cursor.execute(sql, (descripcion, stock_reposicion, demora_reposicion, cantidad_reposicion, id_material))
+        conexion_bd.commit()
+    except sqlite3.Error as err:
+        conexion_bd.rollback()
+        metricas_incrementar("gemprop_errores_de_base_de_datos_total")
+        registrar_evento("Error actualizando el material con id={}\nError: [{}]", id_material, err.args[0], nivel=ERROR)
+        return False
+
+
+    catalogo_guardar(conexion_bd, "materiales", [(id_material, descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion)])
+    disponibilidad_actualizar_materiales(conexion_bd, [id_material])
+    atp = atp_memorizada(conexion_bd)
+    if atp is not None:
+        atp_actualizar_demora(atp, id_material, demora_reposicion)
+        if ajustes and not atp_registrar_movimiento(atp, id_material, 0, stock_actual - anterior[0]):
+            atp_descartar(conexion_bd)
+    registrar_evento("Se actualizó el material con id={}", id_material)
+    if ajustes:
+        metricas_incrementar("gemprop_actualizaciones_de_stock_total", tipo="ajuste")
+    return True
+
+def materiales_eliminar_registro_material(conexion_bd, id_material):
+    # Elimina el registro de la base de datos cuyo ID coincide con el argumento id_material
+    sql = "DELETE FROM materiales WHERE id = ?"
+    if ejecutar_sentencia_sql(conexion_bd, sql, (id_material,)) is None:
+        return False
+
+    catalogo_eliminar(conexion_bd, "materiales", [id_material])
+    atp_recargar_registros(conexion_bd, ids_materiales=[id_material])
+    return True
+
+def materiales_buscar_material(conexion_bd, id_material):
+    # Obtiene una lista con el registro cuyo ID coincide con el argumento id_material (vacía si no existe)
+    return catalogo_buscar(conexion_bd, "materiales", [int(id_material)])
+
+def materiales_buscar_materiales(conexion_bd, ids_materiales):
+    # Obtiene los registros de los materiales cuyos IDs se reciben, ordenados por id
+    return catalogo_buscar(conexion_bd, "materiales", ids_materiales)
+
+def materiales_buscar_por_texto(conexion_bd, texto, limite=20):
+    # Búsqueda incremental por descripción: obtiene hasta 'limite' materiales con palabras que comienzan con las del texto
+    return catalogo_buscar_por_texto(conexion_bd, "materiales", texto, limite)
+
+def materiales_buscar_id_por_descripcion(conexion_bd, descripcion_material):
+    # Obtiene el id único del material cuya descripción coincide con la recibida, o None si no existe
+    id_material = catalogo_buscar_id_por_descripcion(conexion_bd, "materiales", descripcion_material)
+    if id_material is False:
+        return None
+
+    return id_material
+
+def materiales_existe_descripcion(conexion_bd, descripcion_material):
+    # Verifica si existe un material con la misma descripción (case sensitive)
+    # Retorna None si no pudo realizarse la consulta
+    id_material = catalogo_buscar_id_por_descripcion(conexion_bd, "materiales", descripcion_material)
+    if id_material is False:
+        return None
+
+    return id_material is not None
+
+def materiales_contar_productos_asociados(conexion_bd, id_material):
+    # Cantidad de productos que usan el material. Retorna None si no pudo realizarse la consulta.
+    sql = "SELECT COUNT(id_material) FROM materiales_por_producto WHERE id_material = ?"
+    resultado = ejecutar_consulta_sql(conexion_bd, sql, (id_material,))
+    if resultado is None:
+        return None
+
+    return int(resultado[0][0])
+
+def materiales_recuperar_materiales(conexion_bd):
+    # Lee todos los registros de la tabla de materiales, ordenados por id
+    return catalogo_recuperar(conexion_bd, "materiales")
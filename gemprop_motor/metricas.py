@@ -0,0 +1,217 @@
+"""
+Métricas de una instancia de GEMPROP en formato Prometheus
+
+El motor acumula en memoria, mientras las métricas están habilitadas:
+- contadores: pedidos procesados, rechazados (por demora o por error) y demorados, actualizaciones de stock
+  por tipo de movimiento (ver movimientos.py) y errores de base de datos,
+- histogramas de duración: de las consultas y sentencias SQL por función invocante (a partir de la
+  instrumentación de sql.py, ver instrumentacion.py) y de las acciones que la vista ejecuta en el
+  trabajador de base de datos (ver trabajador.py),
+- indicadores que se calculan al consultarlos: materiales en la cola de reposición (con stock inferior a
+  su nivel de reposición), materiales sin stock y órdenes de compra pendientes.
+
+metricas_iniciar_servidor() publica las métricas en http://127.0.0.1:<puerto>/metrics para que las recoja
+Prometheus. El servidor atiende las solicitudes de a una en un hilo propio, con su propia conexión de
+solo lectura a la base de datos para calcular los indicadores, por lo que nunca ejecuta código en el hilo
+de la ventana ni usa sus conexiones. Solo escucha en la interfaz local.
+
+Deshabilitadas (el valor por defecto), el costo de cada punto de medición es la lectura de la variable
+'metricas_activas'.
+"""
+
+from bisect import bisect_left      # Intervalo del histograma de cada duración
+import sqlite3                      # Gestión de errores calculando los indicadores
+import threading                    # Hilo del servidor y acceso concurrente a las métricas
+
+from gemprop_motor import instrumentacion
+from gemprop_motor.eventos import registrar_evento, DEPURACION, ERROR
+
+
+PUERTO_PREDETERMINADO = 9464        # Puerto del servidor de métricas si no se indica otro
+
+# Límites superiores, en segundos, de los intervalos de los histogramas de duración
+INTERVALOS_DE_DURACION = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Métricas que publica el motor: nombre -> (tipo, descripción)
+DEFINICIONES = {
+    "gemprop_pedidos_procesados_total": ("counter", "Pedidos confirmados"),
+    "gemprop_pedidos_rechazados_total": ("counter", "Pedidos calculados que no se confirmaron, por motivo (demora o error)"),
+    "gemprop_pedidos_demorados_total": ("counter", "Pedidos confirmados con demora por falta de stock"),
+    "gemprop_actualizaciones_de_stock_total": ("counter", "Movimientos de stock registrados, por tipo (consumo, recepcion o ajuste)"),
+    "gemprop_errores_de_base_de_datos_total": ("counter", "Errores de SQLite registrados por el motor"),
+    "gemprop_sql_duracion_segundos": ("histogram", "Duración de las consultas y sentencias SQL, por función invocante"),
+    "gemprop_acciones_duracion_segundos": ("histogram", "Duración de las acciones ejecutadas en el trabajador de base de datos, por función"),
+    "gemprop_materiales_bajo_reposicion": ("gauge", "Materiales con stock inferior a su nivel de reposición (cola de reposición)"),
+    "gemprop_materiales_sin_stock": ("gauge", "Materiales sin stock"),
+    "gemprop_ordenes_de_compra_pendientes": ("gauge", "Órdenes de compra pendientes de recibir")
+}
+
+# Indicadores: nombre -> consulta SQL de un único valor, que se ejecuta al publicar las métricas
+INDICADORES = {
+    "gemprop_materiales_bajo_reposicion": "SELECT COUNT(*) FROM cola_de_reposicion",
+    "gemprop_materiales_sin_stock": "SELECT COUNT(*) FROM materiales WHERE stock_actual <= 0",
+    "gemprop_ordenes_de_compra_pendientes": "SELECT COUNT(*) FROM ordenes_de_compra WHERE fecha_recepcion IS NULL"
+}
+
+# Configuración vigente (ver metricas_habilitar)
+metricas_activas = False
+_instrumentacion_propia = False     # La instrumentación de las consultas SQL la habilitaron las métricas
+
+# Valores acumulados: (nombre, etiquetas) -> valor de un contador, o [cantidades por intervalo, suma, cantidad] de un
+# histograma. Las etiquetas son una tupla ordenada de pares (etiqueta, valor).
+contadores = {}
+histogramas = {}
+
+_cerrojo = threading.Lock()
+
+
+def metricas_habilitar(activas=True):
+    # Habilita o deshabilita la acumulación de métricas. Habilitarlas habilita también la instrumentación de las
+    # consultas SQL (ver instrumentacion.py), de la que se obtiene su duración; deshabilitarlas la deshabilita solo si
+    # la habilitaron las métricas. Puede invocarse varias veces: cada sentencia se observa una sola vez.
+    global metricas_activas, _instrumentacion_propia
+
+    metricas_activas = activas
+    if activas:
+        instrumentacion.instrumentacion_agregar_observador(_observar_sentencia)
+        if not instrumentacion.instrumentacion_activa:
+            instrumentacion.instrumentacion_configurar(activa=True, umbral_lento_ms=instrumentacion.umbral_consulta_lenta * 1000,
+                                                       planes=instrumentacion.capturar_planes, capacidad_lentas=instrumentacion.consultas_lentas.maxlen)
+            _instrumentacion_propia = True
+    else:
+        instrumentacion.instrumentacion_quitar_observador(_observar_sentencia)
+        if _instrumentacion_propia:
+            instrumentacion.instrumentacion_configurar(activa=False, umbral_lento_ms=instrumentacion.umbral_consulta_lenta * 1000,
+                                                       planes=instrumentacion.capturar_planes, capacidad_lentas=instrumentacion.consultas_lentas.maxlen)
+            _instrumentacion_propia = False
+
+def metricas_incrementar(nombre, cantidad=1, **etiquetas):
+    # Suma 'cantidad' al contador indicado, con las etiquetas recibidas (por ejemplo tipo="consumo")
+    if not metricas_activas:
+        return
+    clave = (nombre, tuple(sorted(etiquetas.items())))
+    with _cerrojo:
+        contadores[clave] = contadores.get(clave, 0) + cantidad
+
+def metricas_observar(nombre, segundos, **etiquetas):
+    # Agrega una duración al histograma indicado, con las etiquetas recibidas
+    if not metricas_activas:
+        return
+    clave = (nombre, tuple(sorted(etiquetas.items())))
+    intervalo = bisect_left(INTERVALOS_DE_DURACION, segundos)
+    with _cerrojo:
+        histograma = histogramas.get(clave)
+        if histograma is None:
+            histograma = histogramas[clave] = [[0] * (len(INTERVALOS_DE_DURACION) + 1), 0.0, 0]
+        histograma[0][intervalo] += 1
+        histograma[1] += segundos
+        histograma[2] += 1
+
+def metricas_reiniciar():
+    # Descarta los valores acumulados de los contadores y los histogramas
+    with _cerrojo:
+        contadores.clear()
+        histogramas.clear()
+
+def _observar_sentencia(medicion):
+    # Observador de la instrumentación SQL: agrega la duración de cada sentencia a su histograma
+    metricas_observar("gemprop_sql_duracion_segundos", medicion["segundos"], funcion=medicion["invocante"])
+
+def metricas_exponer(conexion_bd=None):
+    # Retorna el texto de todas las métricas en el formato de exposición de Prometheus. Los indicadores solo se
+    # incluyen si se recibe una conexión a la base de datos con la cual calcularlos.
+    with _cerrojo:
+        copia_contadores = dict(contadores)
+        copia_histogramas = {clave: (list(histograma[0]), histograma[1], histograma[2]) for clave, histograma in histogramas.items()}
+
+    valores = {}
+    for (nombre, etiquetas), valor in copia_contadores.items():
+        valores.setdefault(nombre, []).append(f"{nombre}{_formatear_etiquetas(etiquetas)} {valor}")
+    for (nombre, etiquetas), (cantidades, suma, cantidad) in copia_histogramas.items():
+        lineas = valores.setdefault(nombre, [])
+        acumulado = 0
+        for limite, cantidad_intervalo in zip(INTERVALOS_DE_DURACION + ("+Inf",), cantidades):
+            acumulado += cantidad_intervalo
+            lineas.append(f"{nombre}_bucket{_formatear_etiquetas(etiquetas + (('le', str(limite)),))} {acumulado}")
+        lineas.append(f"{nombre}_sum{_formatear_etiquetas(etiquetas)} {suma}")
+        lineas.append(f"{nombre}_count{_formatear_etiquetas(etiquetas)} {cantidad}")
+    if conexion_bd is not None:
+        for nombre, sql in INDICADORES.items():
+            valor = _leer_indicador(conexion_bd, sql)
+            if valor is not None:
+                valores[nombre] = [f"{nombre} {valor}"]
+
+    texto = []
+    for nombre, (tipo, descripcion) in DEFINICIONES.items():
+        texto.append(f"# HELP {nombre} {descripcion}")
+        texto.append(f"# TYPE {nombre} {tipo}")
+        texto.extend(valores.get(nombre, []))
+    return "\n".join(texto) + "\n"
+
+def _formatear_etiquetas(etiquetas):
+    # Texto de las etiquetas de una muestra: {etiqueta="valor",...}, o vacío si no tiene etiquetas
+    if not etiquetas:
+        return ""
+    pares = ",".join('{}="{}"'.format(etiqueta, str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for etiqueta, valor in etiquetas)
+    return "{" + pares + "}"
+
+def _leer_indicador(conexion_bd, sql):
+    # Ejecuta la consulta de un indicador directamente en la conexión, sin pasar por sql.py, para que las lecturas de
+    # Prometheus no se mezclen con las métricas de las consultas de la aplicación. Retorna None si hubo un error.
+    try:
+        return conexion_bd.execute(sql).fetchone()[0]
+    except sqlite3.Error as err:
+        metricas_incrementar("gemprop_errores_de_base_de_datos_total")
+        registrar_evento("No se pudo calcular el indicador [{}]\nError: [{}]", sql, err.args[0], nivel=ERROR)
+    return None
+
+def metricas_iniciar_servidor(nombre_base_de_datos, perfil="predeterminado", puerto=PUERTO_PREDETERMINADO, direccion="127.0.0.1"):
+    # Habilita las métricas e inicia el servidor HTTP que las publica en /metrics, en un hilo en segundo plano.
+    # Retorna el diccionario del servidor (ver metricas_detener_servidor), o None si no pudo iniciarse.
+    # http.server (y socketserver) se importan recién al iniciar el servidor: importar el motor no paga su costo de carga
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from gemprop_motor.sql import abrir_base_de_datos      # sql.py importa este módulo para contar sus errores
+
+    servidor = {"nombre_base_de_datos": nombre_base_de_datos, "perfil": perfil, "conexion_bd": None, "http": None, "hilo": None}
+
+    class Solicitud(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            # La conexión se abre en el hilo del servidor, el único que la usa
+            if servidor["conexion_bd"] is None:
+                servidor["conexion_bd"] = abrir_base_de_datos(nombre_base_de_datos, perfil, solo_lectura=True)
+            cuerpo = metricas_exponer(servidor["conexion_bd"]).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, formato, *argumentos):
+            registrar_evento("Servidor de métricas: {}", formato % argumentos, nivel=DEPURACION)
+
+    try:
+        servidor["http"] = HTTPServer((direccion, puerto), Solicitud)
+    except OSError as err:
+        registrar_evento("No se pudo iniciar el servidor de métricas en {}:{}\nError: [{}]", direccion, puerto, err, nivel=ERROR)
+        return None
+
+    metricas_habilitar()
+    servidor["hilo"] = threading.Thread(target=_atender_solicitudes, args=(servidor,), name="gemprop-metricas", daemon=True)
+    servidor["hilo"].start()
+    registrar_evento("Métricas publicadas en http://{}:{}/metrics", direccion, servidor["http"].server_port)
+    return servidor
+
+def _atender_solicitudes(servidor):
+    # Ciclo del hilo del servidor: atiende las solicitudes hasta que se detiene el servidor, y luego cierra su conexión
+    servidor["http"].serve_forever()
+    servidor["http"].server_close()
+    if servidor["conexion_bd"] is not None:
+        servidor["conexion_bd"].close()
+
+def metricas_detener_servidor(servidor):
+    # Detiene el servidor de métricas y espera a que termine su hilo
+    servidor["http"].shutdown()
+    servidor["hilo"].join()
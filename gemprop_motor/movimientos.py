@@ -0,0 +1,104 @@
+"""
+Libro de movimientos de stock e instantáneas
+
+Cada cambio del stock de un material se registra como un movimiento en la tabla 'movimientos_de_stock':
+- alta: stock inicial de un material nuevo (lo registra un trigger al insertarse el material),
+- consumo: unidades usadas por un pedido confirmado (cantidad negativa; la referencia es el pedido),
+- recepcion: unidades de una orden de compra recibida (la referencia es la orden de compra),
+- ajuste: corrección manual del stock desde el formulario de materiales.
+El motor nunca modifica 'stock_actual' en forma directa: inserta el movimiento y el trigger de la tabla
+suma su cantidad al stock en la misma sentencia (ver MIGRACION_7), por lo que el libro y el stock no
+pueden quedar desalineados. El libro solo admite altas.
+
+Para conocer el stock de una fecha pasada no se recorre toda la historia: periódicamente se registra una
+instantánea con el stock de los materiales que tuvieron movimientos desde la instantánea anterior, junto
+con el id del último movimiento incluido. El stock a una fecha es el de la última instantánea anterior a
+esa fecha más los movimientos posteriores a ella, que son a lo sumo los registrados entre dos instantáneas.
+El índice por fecha del libro mantiene rápidas las consultas de auditoría por período.
+"""
+
+from datetime import date, datetime     # Fechas de las consultas
+import json                         # Lista de ids enviada como un único parámetro de consulta
+
+from gemprop_motor.eventos import registrar_evento
+from gemprop_motor.sql import ejecutar_consulta_sql, ejecutar_sentencia_sql
+
+
+MOVIMIENTOS_POR_INSTANTANEA = 10000     # Movimientos registrados a partir de los cuales conviene una nueva instantánea
+
+
+def movimientos_registrar_instantanea(conexion_bd, minimo_de_movimientos=0):
+    # Registra una instantánea del stock de los materiales que tuvieron movimientos desde la instantánea anterior, si esos
+    # movimientos son al menos 'minimo_de_movimientos'. Los movimientos y el stock se leen en la misma sentencia, por lo que
+    # la instantánea es consistente aun si otra conexión registra movimientos al mismo tiempo.
+    # Retorna la cantidad de materiales incluidos en la instantánea (0 si no hizo falta), o None si hubo un error.
+    resultado = ejecutar_consulta_sql(conexion_bd, """
+        SELECT COALESCE((SELECT MAX(id) FROM movimientos_de_stock), 0) - COALESCE((SELECT MAX(id_ultimo_movimiento) FROM instantaneas_de_stock), 0)
+        """)
+    if resultado is None:
+        return None
+    movimientos_pendientes = resultado[0][0]
+    if movimientos_pendientes == 0 or movimientos_pendientes < minimo_de_movimientos:
+        return 0
+
+    sql = """
+        INSERT OR REPLACE INTO instantaneas_de_stock(id_material, fecha, stock, id_ultimo_movimiento)
+        SELECT m.id, datetime('now', 'localtime'), m.stock_actual, (SELECT MAX(id) FROM movimientos_de_stock)
+        FROM materiales m
+        WHERE m.id IN (SELECT id_material FROM movimientos_de_stock
+                       WHERE id > COALESCE((SELECT MAX(id_ultimo_movimiento) FROM instantaneas_de_stock), 0))
+        """
+    materiales = ejecutar_sentencia_sql(conexion_bd, sql)
+    if materiales is not None:
+        registrar_evento("Instantánea de stock registrada: {} material(es), {} movimiento(s) desde la anterior", materiales, movimientos_pendientes)
+    return materiales
+
+def movimientos_stock_a_la_fecha(conexion_bd, fecha, ids_materiales=None):
+    # Reconstruye el stock de los materiales indicados (o de todos los materiales existentes) al final de la
+    # fecha recibida (date), o en el momento indicado (datetime). Retorna una lista de tuplas (id_material, stock) ordenada
+    # por id, o None si hubo un error. Los materiales que todavía no existían en esa fecha tienen stock 0.
+    sql = """
+        WITH materiales_consultados AS (
+            SELECT value AS id_material FROM json_each(:ids) WHERE :ids IS NOT NULL
+            UNION ALL
+            SELECT id FROM materiales WHERE :ids IS NULL
+        ),
+        ultimas_instantaneas AS (
+            SELECT c.id_material,
+                   (SELECT i.fecha FROM instantaneas_de_stock i WHERE i.id_material = c.id_material AND i.fecha <= :fecha
+                    ORDER BY i.fecha DESC LIMIT 1) AS fecha_instantanea
+            FROM materiales_consultados c
+        )
+        SELECT u.id_material,
+               COALESCE(i.stock, 0) + COALESCE((SELECT SUM(s.cantidad) FROM movimientos_de_stock s
+                                                WHERE s.id_material = u.id_material AND s.id > COALESCE(i.id_ultimo_movimiento, 0)
+                                                AND s.fecha <= :fecha), 0)
+        FROM ultimas_instantaneas u
+        LEFT JOIN instantaneas_de_stock i ON i.id_material = u.id_material AND i.fecha = u.fecha_instantanea
+        ORDER BY u.id_material
+        """
+    argumentos = {
+        "fecha": _fecha_de_consulta(fecha),
+        "ids": None if ids_materiales is None else json.dumps(list(ids_materiales))
+    }
+    return ejecutar_consulta_sql(conexion_bd, sql, argumentos)
+
+def movimientos_recuperar_movimientos(conexion_bd, desde, hasta, id_material=None):
+    # Obtiene los movimientos registrados entre las fechas indicadas, inclusive (id, id_material, fecha, tipo, cantidad,
+    # referencia), de todos los materiales o del indicado, ordenados por id, o None si hubo un error
+    sql = """
+        SELECT id, id_material, fecha, tipo, cantidad, referencia
+        FROM movimientos_de_stock
+        WHERE fecha >= :desde AND fecha <= :hasta AND (:id_material IS NULL OR id_material = :id_material)
+        ORDER BY id
+        """
+    desde = desde.isoformat(sep=" ", timespec="seconds") if isinstance(desde, datetime) else desde.isoformat()
+    return ejecutar_consulta_sql(conexion_bd, sql, {"desde": desde, "hasta": _fecha_de_consulta(hasta), "id_material": id_material})
+
+def _fecha_de_consulta(fecha):
+    # Texto comparable con la columna 'fecha' del libro: el momento indicado, o el final del día si se recibe una fecha
+    if isinstance(fecha, datetime):
+        return fecha.isoformat(sep=" ", timespec="seconds")
+    if isinstance(fecha, date):
+        return fecha.isoformat() + " 23:59:59"
+    return str(fecha)
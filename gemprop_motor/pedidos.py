@@ -0,0 +1,227 @@
+"""
+Controlador de pedidos
+
+Calcula si uno o varios productos pueden confeccionarse con el stock actual, descuenta el stock de los
+materiales usados y repone el stock de los materiales por debajo de su nivel de reposición mediante
+órdenes de compra (ver reposicion.py).
+
+Cada pedido confirmado queda registrado en las tablas 'pedidos' y 'lineas_de_pedido'. El historial se
+consulta por páginas con paginación por clave (keyset): cada página retorna la clave (fecha, id) de su
+último pedido, y la página siguiente comienza a continuación de esa clave en el índice, por lo que el
+costo de una página no depende de cuántas páginas la preceden ni de la cantidad total de pedidos.
+"""
+
+import json                         # Líneas de un pedido de varios productos
+from datetime import timedelta      # Filtro por fecha del historial
+import sqlite3                      # Gestión de errores accediendo a la base de datos
+
+from gemprop_motor.eventos import registrar_evento, ADVERTENCIA, ERROR
+from gemprop_motor.metricas import metricas_incrementar
+from gemprop_motor.sql import ejecutar_consulta_sql, ejecutar_sentencia_sql
+from gemprop_motor.catalogo import catalogo_recargar_registros
+from gemprop_motor.atp import atp_proyeccion, atp_memorizada, atp_cotizar_pedido, atp_comprometer, atp_descartar
+from gemprop_motor.reposicion import reposicion_emitir_ordenes, reposicion_recibir_ordenes
+from gemprop_motor.movimientos import movimientos_registrar_instantanea, MOVIMIENTOS_POR_INSTANTANEA
+from gemprop_motor.disponibilidad import disponibilidad_actualizar_materiales
+
+
+ESTADOS_DE_PEDIDO = ("confirmado", "entregado", "cancelado")
+TAMAÑO_DE_PAGINA = 50               # Pedidos por página del historial
+
+
+def pedidos_calcular_pedido(conexion_bd, id_producto):
+    # Calcula el pedido de una unidad del producto indicado. Ver pedidos_calcular_pedido_multiple()
+    return pedidos_calcular_pedido_multiple(conexion_bd, [(id_producto, 1)])
+
+def pedidos_calcular_pedido_multiple(conexion_bd, lineas_de_pedido):
+    # Calcula los materiales requeridos por un pedido de varios productos, cada uno con su cantidad de unidades.
+    # 'lineas_de_pedido' es una lista de tuplas (id_producto, cantidad); un mismo producto puede aparecer más de una vez.
+    # Retorna un diccionario con los materiales del pedido (id_material, descripcion_material, stock_actual, unidades_necesarias,
+    # demora_reposicion), si habrá demora, la demora (en días) hasta disponer de todos los materiales, el mayor tiempo de
+    # confección de sus productos y la fecha de entrega según los requerimientos 3.1 y 3.2, o None si hubo un error.
+    for id_producto, cantidad in lineas_de_pedido:
+        if not isinstance(cantidad, int) or cantidad <= 0:
+            registrar_evento("Cantidad inválida [{}] para el producto con id=[{}]", cantidad, id_producto, nivel=ADVERTENCIA)
+            return None
+
+    # La fecha de entrega se cotiza con la proyección ATP de la conexión (ver atp.py): las unidades de cada material se
+    # acumulan a partir de la explosión (memorizada) del BOM de cada producto, y un material faltante demora hasta la
+    # llegada de las órdenes de compra pendientes que lo cubren, o su demora de reposición si no alcanzan
+    atp = atp_proyeccion(conexion_bd)
+    if atp is None:
+        return None
+    cotizacion = atp_cotizar_pedido(atp, lineas_de_pedido)
+    if cotizacion is None:
+        return None
+    unidades_necesarias = cotizacion["unidades_necesarias"]
+
+    # El stock y la demora de todos los materiales requeridos se obtienen en una única consulta: los requerimientos se
+    # envían como un arreglo JSON (un solo parámetro, sin importar cuántos materiales tenga el pedido)
+    sql = """
+        WITH requerimientos AS (
+            SELECT json_extract(value, '$[0]') AS id_material, json_extract(value, '$[1]') AS unidades
+            FROM json_each(?)
+        )
+        SELECT m.id AS 'id_material', m.descripcion AS 'descripcion_material', m.stock_actual, r.unidades AS 'unidades_necesarias', m.demora_reposicion
+        FROM requerimientos r
+        INNER JOIN materiales m
+        ON m.id = r.id_material
+        ORDER BY m.id
+        """
+    registros = ejecutar_consulta_sql(conexion_bd, sql, (json.dumps(list(unidades_necesarias.items())),))
+    if registros is None:
+        return None
+
+    # Habrá una demora si falta stock de al menos un material; la confección comienza cuando se dispone de todos los
+    # materiales y los productos del pedido se confeccionan en paralelo
+    return {
+        "lineas": list(lineas_de_pedido),
+        "materiales": registros,
+        "demora_planificada": bool(cotizacion["materiales_faltantes"]),
+        "demora_maxima": cotizacion["dia_materiales"],
+        "tiempo_confeccion": cotizacion["tiempo_confeccion"],
+        "fecha_entrega": cotizacion["fecha_entrega"]
+    }
+
+def pedidos_confirmar_pedido(conexion_bd, pedido):
+    # Registra el pedido calculado con pedidos_calcular_pedido() en el historial y descuenta del stock las unidades de cada
+    # material usado, con un movimiento de consumo por material en el libro de stock (ver movimientos.py).
+    # El pedido, sus líneas y los descuentos se registran en una única transacción: o se aplica todo, o nada.
+    # El descuento es relativo al stock vigente al momento de confirmar (stock_actual - unidades), no al leído al calcular el pedido.
+    # Retorna True si se registró el pedido (cuyo id se agrega al diccionario con la clave "id_pedido") y se actualizó el stock
+    try:
+        cursor = conexion_bd.cursor()
+        cursor.execute("INSERT INTO pedidos(demora_maxima, tiempo_confeccion, fecha_entrega) VALUES (?, ?, ?)",
+                       (pedido["demora_maxima"], pedido["tiempo_confeccion"], pedido["fecha_entrega"].isoformat()))
+        id_pedido = cursor.lastrowid
+        cantidades_por_producto = {}
+        for id_producto, cantidad in pedido["lineas"]:
+            cantidades_por_producto[id_producto] = cantidades_por_producto.get(id_producto, 0) + cantidad
+        cursor.executemany("INSERT INTO lineas_de_pedido(id_pedido, id_producto, cantidad, fecha) SELECT id, ?, ?, fecha FROM pedidos WHERE id = ?",
+                           [(id_producto, cantidad, id_pedido) for id_producto, cantidad in cantidades_por_producto.items()])
+        cursor.executemany("INSERT INTO movimientos_de_stock(id_material, tipo, cantidad, referencia) VALUES (?, 'consumo', ?, ?)",
+                           [(material[0], -material[3], id_pedido) for material in pedido["materiales"]])
+        conexion_bd.commit()
+    except sqlite3.Error as err:
+        conexion_bd.rollback()
+        metricas_incrementar("gemprop_errores_de_base_de_datos_total")
+        metricas_incrementar("gemprop_pedidos_rechazados_total", motivo="error")
+        registrar_evento("Error registrando el pedido y actualizando el stock de sus materiales, no se modificó ningún material\nError: [{}]", err.args[0], nivel=ERROR)
+        return False
+
+    pedido["id_pedido"] = id_pedido
+    registrar_evento("Pedido registrado - id=[{}]", id_pedido)
+    metricas_incrementar("gemprop_pedidos_procesados_total")
+    if pedido["demora_planificada"]:
+        metricas_incrementar("gemprop_pedidos_demorados_total")
+    metricas_incrementar("gemprop_actualizaciones_de_stock_total", len(pedido["materiales"]), tipo="consumo")
+
+    catalogo_recargar_registros(conexion_bd, "materiales", [material[0] for material in pedido["materiales"]])
+    disponibilidad_actualizar_materiales(conexion_bd, [material[0] for material in pedido["materiales"]])
+    atp = atp_memorizada(conexion_bd)
+    if atp is not None and not all(atp_comprometer(atp, id_producto, cantidad) for id_producto, cantidad in pedido["lineas"]):
+        atp_descartar(conexion_bd)
+    for material in pedido["materiales"]:
+        registrar_evento("Stock de material actualizado - id=[{}] - stock anterior=[{}] - unidades usadas=[{}]", material[0], material[2], material[3])
+
+    return True
+
+def pedidos_procesar_pedido_multiple(conexion_bd, lineas_de_pedido, aceptar_demora=True):
+    # Calcula y confirma en una sola llamada un pedido de varios productos (ver pedidos_calcular_pedido_multiple()).
+    # El cálculo y el descuento de stock se hacen dentro de la misma transacción (BEGIN IMMEDIATE), por lo que ningún otro
+    # proceso puede modificar el stock entre la verificación de disponibilidad y la confirmación del pedido.
+    # Si el pedido tiene demora y 'aceptar_demora' es False, el pedido no se confirma.
+    # Retorna el diccionario del pedido con la clave adicional "confirmado", o None si hubo un error.
+    try:
+        conexion_bd.execute("BEGIN IMMEDIATE")
+    except sqlite3.Error as err:
+        metricas_incrementar("gemprop_errores_de_base_de_datos_total")
+        registrar_evento("No se pudo iniciar la transacción del pedido\nError: [{}]", err.args[0], nivel=ERROR)
+        return None
+
+    pedido = pedidos_calcular_pedido_multiple(conexion_bd, lineas_de_pedido)
+    if pedido is None or (pedido["demora_planificada"] and not aceptar_demora):
+        conexion_bd.rollback()
+        if pedido is not None:
+            pedido["confirmado"] = False
+            metricas_incrementar("gemprop_pedidos_rechazados_total", motivo="demora")
+        return pedido
+
+    pedido["confirmado"] = pedidos_confirmar_pedido(conexion_bd, pedido)     # El commit (o rollback) lo realiza esta función
+    return pedido
+
+def pedidos_actualizar_stock(conexion_bd, fecha=None):
+    # Reposición de stock a la fecha indicada (por defecto la actual): primero se reciben las órdenes de compra cuya fecha
+    # de entrega ya llegó, y luego se emiten órdenes para los materiales que siguen por debajo de su nivel de reposición.
+    # Retorna un diccionario con la cantidad de órdenes recibidas y emitidas, o None si hubo un error
+    ordenes_recibidas = reposicion_recibir_ordenes(conexion_bd, fecha)
+    if ordenes_recibidas is None:
+        return None
+    ordenes_emitidas = reposicion_emitir_ordenes(conexion_bd, fecha)
+    if ordenes_emitidas is None:
+        return None
+
+    # La reposición es el proceso periódico del motor: si se acumularon suficientes movimientos se registra una instantánea
+    movimientos_registrar_instantanea(conexion_bd, MOVIMIENTOS_POR_INSTANTANEA)
+
+    return {"ordenes_recibidas": ordenes_recibidas, "ordenes_emitidas": ordenes_emitidas}
+
+def pedidos_recuperar_historial(conexion_bd, desde=None, hasta=None, estado=None, id_producto=None, despues_de=None, tamaño_de_pagina=TAMAÑO_DE_PAGINA):
+    # Obtiene una página del historial de pedidos (id, fecha, estado, demora_maxima, tiempo_confeccion, fecha_entrega), del
+    # más reciente al más antiguo. Los filtros son opcionales: fechas 'desde' y 'hasta' (inclusive), estado y producto.
+    # 'despues_de' es la clave retornada con la página anterior (None para la primera página).
+    # Retorna una tupla (pedidos de la página, clave de la página siguiente o None si no hay más pedidos), o None si hubo un error.
+    # Con filtro por producto se recorre el índice de las líneas (que repiten la fecha del pedido); si no, el de los pedidos
+    if id_producto is None:
+        origen, fecha, id_pedido = "pedidos p", "p.fecha", "p.id"
+        condiciones = []
+    else:
+        origen, fecha, id_pedido = "lineas_de_pedido l INNER JOIN pedidos p ON p.id = l.id_pedido", "l.fecha", "l.id_pedido"
+        condiciones = ["l.id_producto = :id_producto"]
+    argumentos = {"tamaño_de_pagina": tamaño_de_pagina, "id_producto": id_producto}
+    if desde is not None:
+        condiciones.append(f"{fecha} >= :desde")
+        argumentos["desde"] = desde.isoformat()
+    if hasta is not None:
+        condiciones.append(f"{fecha} < :hasta")
+        argumentos["hasta"] = (hasta + timedelta(days=1)).isoformat()
+    if estado is not None:
+        condiciones.append("p.estado = :estado")
+        argumentos["estado"] = estado
+    if despues_de is not None:
+        condiciones.append(f"({fecha}, {id_pedido}) < (:fecha_clave, :id_clave)")
+        argumentos["fecha_clave"], argumentos["id_clave"] = despues_de
+
+    sql = f"""
+        SELECT p.id, p.fecha, p.estado, p.demora_maxima, p.tiempo_confeccion, p.fecha_entrega
+        FROM {origen}
+        {"WHERE " + " AND ".join(condiciones) if condiciones else ""}
+        ORDER BY {fecha} DESC, {id_pedido} DESC
+        LIMIT :tamaño_de_pagina
+        """
+    registros = ejecutar_consulta_sql(conexion_bd, sql, argumentos)
+    if registros is None:
+        return None
+
+    clave_siguiente = (registros[-1][1], registros[-1][0]) if len(registros) == tamaño_de_pagina else None
+    return registros, clave_siguiente
+
+def pedidos_recuperar_lineas(conexion_bd, id_pedido):
+    # Obtiene las líneas del pedido (id_producto, descripcion_producto, cantidad) ordenadas por producto, o None si hubo un error.
+    # La descripción es None si el producto fue eliminado después de registrarse el pedido.
+    sql = """
+        SELECT l.id_producto, p.descripcion, l.cantidad
+        FROM lineas_de_pedido l
+        LEFT JOIN productos p ON p.id = l.id_producto
+        WHERE l.id_pedido = ?
+        ORDER BY l.id_producto
+        """
+    return ejecutar_consulta_sql(conexion_bd, sql, (id_pedido,))
+
+def pedidos_cambiar_estado(conexion_bd, id_pedido, estado):
+    # Cambia el estado de un pedido registrado. Retorna True si se actualizó el pedido
+    if estado not in ESTADOS_DE_PEDIDO:
+        registrar_evento("Estado de pedido desconocido [{}]. Estados disponibles: {}", estado, ", ".join(ESTADOS_DE_PEDIDO), nivel=ADVERTENCIA)
+        return False
+
+    return bool(ejecutar_sentencia_sql(conexion_bd, "UPDATE pedidos SET estado = ? WHERE id = ?", (estado, id_pedido)))
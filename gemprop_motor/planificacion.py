@@ -0,0 +1,205 @@
+"""
+Planificación de requerimientos de materiales (MRP)
+
+A partir de una demanda de productos (cantidad a fabricar de cada producto) calcula, para todos los
+materiales a la vez:
+- el requerimiento bruto: unidades del material que consume la demanda, a todos los niveles del BOM,
+- el requerimiento neto: la parte del requerimiento bruto que no cubre el stock actual,
+- el faltante: la parte del requerimiento neto que tampoco cubren las órdenes de compra pendientes,
+- las compras sugeridas: para cada material cuya posición (stock actual + órdenes pendientes - requerimiento
+  bruto) queda por debajo de su nivel de reposición, el menor múltiplo de su cantidad de reposición que la
+  lleva a ese nivel (el mismo criterio que la emisión de órdenes, ver reposicion.py), con la fecha de
+  entrega que resulta de su demora de reposición.
+
+Las tablas se leen una única vez: los materiales por producto y los subproductos por producto se cargan
+como matrices dispersas en formato CSR (por fila: 'inicios' de cada producto, 'columnas' y 'valores'), y el
+stock, las órdenes pendientes y los datos de reposición como vectores alineados con los ids de los materiales.
+La explosión de la demanda es una sucesión de productos matriz-vector sobre la matriz de subproductos (uno
+por nivel del BOM) y los requerimientos son un producto matriz-vector sobre la matriz de materiales, por lo
+que el costo es O(asociaciones x niveles) sin consultas por producto.
+
+Requiere NumPy, que es una dependencia opcional del motor: si no está instalado, las funciones de este
+módulo registran el error y retornan None, y el resto del motor funciona normalmente. NumPy se importa
+recién en la primera planificación, por lo que importar el motor (la ventana o cualquier otro comando de
+la línea de comandos) no paga su costo de carga.
+
+Uso desde la línea de comandos (ver __main__.py):
+    python -m gemprop_motor planificar <base de datos> <archivo de demanda> [--fecha aaaa-mm-dd]
+"""
+
+from datetime import date           # Fecha de la planificación
+import time                         # Duración de la planificación
+
+from gemprop_motor.eventos import registrar_evento, ADVERTENCIA, ERROR
+from gemprop_motor.sql import ejecutar_consulta_sql
+from gemprop_motor.importacion import importar_leer_filas
+
+
+np = None                           # Módulo de NumPy, importado en la primera planificación (ver _importar_numpy)
+
+
+def planificacion_cargar(conexion_bd):
+    # Lee los materiales, las órdenes de compra pendientes y los BOM, y construye el modelo de la planificación.
+    # Retorna el diccionario del modelo, o None si hubo un error o NumPy no está instalado.
+    if not _importar_numpy():
+        return None
+
+    materiales = ejecutar_consulta_sql(conexion_bd, "SELECT id, COALESCE(stock_actual, 0), COALESCE(stock_reposicion, 0), COALESCE(demora_reposicion, 0), cantidad_reposicion FROM materiales ORDER BY id")
+    productos = ejecutar_consulta_sql(conexion_bd, "SELECT id FROM productos ORDER BY id")
+    pendientes = ejecutar_consulta_sql(conexion_bd, "SELECT id_material, SUM(cantidad) FROM ordenes_de_compra WHERE fecha_recepcion IS NULL GROUP BY id_material")
+    materiales_por_producto = ejecutar_consulta_sql(conexion_bd, "SELECT id_producto, id_material, COALESCE(cantidad_de_unidades, 0) FROM materiales_por_producto")
+    subproductos_por_producto = ejecutar_consulta_sql(conexion_bd, "SELECT id_producto, id_subproducto, COALESCE(cantidad_de_unidades, 0) FROM productos_por_producto")
+    if None in (materiales, productos, pendientes, materiales_por_producto, subproductos_por_producto):
+        return None
+
+    datos_materiales = np.array(materiales, dtype=np.int64).reshape(-1, 5)
+    ids_materiales = datos_materiales[:, 0]
+    ids_productos = np.array([registro[0] for registro in productos], dtype=np.int64)
+
+    pendiente = np.zeros(len(ids_materiales), dtype=np.int64)
+    if pendientes:
+        datos_pendientes = np.array(pendientes, dtype=np.int64)
+        pendiente[np.searchsorted(ids_materiales, datos_pendientes[:, 0])] = datos_pendientes[:, 1]
+
+    modelo = {
+        "ids_materiales": ids_materiales,
+        "ids_productos": ids_productos,
+        "stock_actual": datos_materiales[:, 1],
+        "stock_reposicion": datos_materiales[:, 2],
+        "demora_reposicion": datos_materiales[:, 3],
+        "cantidad_reposicion": datos_materiales[:, 4],
+        "pendiente": pendiente,
+        "materiales_por_producto": _matriz_dispersa(materiales_por_producto, ids_productos, ids_materiales),
+        "subproductos_por_producto": _matriz_dispersa(subproductos_por_producto, ids_productos, ids_productos)
+    }
+    registrar_evento("Modelo de planificación cargado: {} material(es), {} producto(s), {} asociación(es) de materiales, {} de subproductos",
+                     len(ids_materiales), len(ids_productos), len(materiales_por_producto), len(subproductos_por_producto))
+    return modelo
+
+def _importar_numpy():
+    # Importa NumPy la primera vez que se lo requiere. Retorna False, registrando el error, si no está instalado.
+    global np
+
+    if np is None:
+        try:
+            import numpy                # Matrices dispersas y cálculo vectorial de los requerimientos
+        except ImportError:
+            registrar_evento("La planificación de requerimientos requiere NumPy, que no está instalado", nivel=ERROR)
+            return False
+        np = numpy
+    return True
+
+def _matriz_dispersa(asociaciones, ids_filas, ids_columnas):
+    # Construye la matriz dispersa en formato CSR a partir de las tuplas (id de fila, id de columna, valor).
+    # Retorna el diccionario {"inicios", "columnas", "valores"}: los valores de la fila i están en [inicios[i], inicios[i + 1]).
+    datos = np.array(asociaciones, dtype=np.int64).reshape(-1, 3)
+    filas = np.searchsorted(ids_filas, datos[:, 0])
+    orden = np.argsort(filas, kind="stable")
+    inicios = np.zeros(len(ids_filas) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(filas, minlength=len(ids_filas)), out=inicios[1:])
+    return {
+        "inicios": inicios,
+        "columnas": np.searchsorted(ids_columnas, datos[orden, 1]),
+        "valores": datos[orden, 2].astype(np.float64)
+    }
+
+def _producto_transpuesto(matriz, vector, cantidad_de_columnas):
+    # Producto de la transpuesta de la matriz CSR por el vector: el valor de cada columna es la suma, sobre las filas,
+    # de vector[fila] x matriz[fila, columna]. Los valores son enteros, exactos en float64 mientras no superen 2**53.
+    por_valor = np.repeat(vector, np.diff(matriz["inicios"]))
+    return np.bincount(matriz["columnas"], weights=matriz["valores"] * por_valor, minlength=cantidad_de_columnas)
+
+def planificacion_calcular(modelo, demanda, fecha=None):
+    # Calcula los requerimientos de la demanda recibida ({id_producto: cantidad}) con las fechas de entrega de las compras
+    # a partir de la fecha indicada (por defecto la actual). Los productos de la demanda que no existen se ignoran.
+    # Retorna un diccionario con los faltantes [(id_material, bruto, stock_actual, pendiente, neto, faltante)] y las compras
+    # sugeridas [(id_material, cantidad, fecha_entrega)], ordenados por id de material, o None si NumPy no está instalado.
+    if not _importar_numpy():
+        return None
+    fecha = fecha or date.today()
+    ids_productos = modelo["ids_productos"]
+    cantidad_de_productos = len(ids_productos)
+    cantidad_de_materiales = len(modelo["ids_materiales"])
+
+    # Vector de la demanda, alineado con los ids de los productos
+    ids_demanda = np.fromiter(demanda.keys(), dtype=np.int64, count=len(demanda))
+    cantidades_demanda = np.fromiter(demanda.values(), dtype=np.float64, count=len(demanda))
+    existentes = np.isin(ids_demanda, ids_productos)
+    if not existentes.all():
+        registrar_evento("Se ignoran {} producto(s) de la demanda que no existen: {}", int((~existentes).sum()), ids_demanda[~existentes][:10].tolist(), nivel=ADVERTENCIA)
+    nivel = np.zeros(cantidad_de_productos, dtype=np.float64)
+    np.add.at(nivel, np.searchsorted(ids_productos, ids_demanda[existentes]), cantidades_demanda[existentes])
+
+    # Explosión por niveles: las unidades de cada nivel son los subproductos que requieren las del nivel anterior.
+    # Los BOM no tienen ciclos, por lo que la explosión termina en a lo sumo tantos niveles como productos.
+    total_por_producto = nivel.copy()
+    for _ in range(cantidad_de_productos):
+        nivel = _producto_transpuesto(modelo["subproductos_por_producto"], nivel, cantidad_de_productos)
+        if not nivel.any():
+            break
+        total_por_producto += nivel
+
+    # Requerimientos de los materiales y compras sugeridas
+    bruto = np.rint(_producto_transpuesto(modelo["materiales_por_producto"], total_por_producto, cantidad_de_materiales)).astype(np.int64)
+    stock_actual = np.maximum(modelo["stock_actual"], 0)
+    neto = np.maximum(bruto - stock_actual, 0)
+    faltante = np.maximum(neto - modelo["pendiente"], 0)
+    posicion = stock_actual + modelo["pendiente"] - bruto
+    cantidad_reposicion = modelo["cantidad_reposicion"]
+    a_comprar = np.maximum(modelo["stock_reposicion"] - posicion, 0)
+    compra = -(-a_comprar // cantidad_reposicion) * cantidad_reposicion        # Menor múltiplo de la cantidad de reposición
+    fechas_entrega = np.datetime64(fecha, "D") + modelo["demora_reposicion"].astype("timedelta64[D]")
+
+    con_faltante = np.flatnonzero(faltante)
+    con_compra = np.flatnonzero(compra)
+    ids_materiales = modelo["ids_materiales"]
+    return {
+        "fecha": fecha,
+        "productos_demandados": int(existentes.sum()),
+        "materiales_requeridos": int(np.count_nonzero(bruto)),
+        "faltantes": list(zip(ids_materiales[con_faltante].tolist(), bruto[con_faltante].tolist(), stock_actual[con_faltante].tolist(),
+                              modelo["pendiente"][con_faltante].tolist(), neto[con_faltante].tolist(), faltante[con_faltante].tolist())),
+        "compras_sugeridas": list(zip(ids_materiales[con_compra].tolist(), compra[con_compra].tolist(), fechas_entrega[con_compra].tolist()))
+    }
+
+def planificacion_ejecutar(conexion_bd, demanda, fecha=None):
+    # Carga el modelo y calcula los requerimientos de la demanda. Retorna el resultado de planificacion_calcular() con la
+    # duración de la planificación en segundos, o None si hubo un error.
+    inicio = time.perf_counter()
+    modelo = planificacion_cargar(conexion_bd)
+    if modelo is None:
+        return None
+    resultado = planificacion_calcular(modelo, demanda, fecha)
+    if resultado is None:
+        return None
+    resultado["segundos"] = time.perf_counter() - inicio
+
+    registrar_evento("Planificación de requerimientos: {} producto(s) demandado(s), {} material(es) requerido(s), {} con faltante, {} compra(s) sugerida(s) en {:.2f} s",
+                     resultado["productos_demandados"], resultado["materiales_requeridos"], len(resultado["faltantes"]), len(resultado["compras_sugeridas"]), resultado["segundos"])
+    return resultado
+
+def planificacion_leer_demanda(conexion_bd, ruta_archivo, formato=None):
+    # Lee la demanda de un archivo CSV o JSONL con las columnas producto (descripción) y cantidad; las cantidades de un mismo
+    # producto se suman. Las filas inválidas se informan y se ignoran. Retorna el diccionario {id_producto: cantidad}, o None si hubo un error.
+    productos = ejecutar_consulta_sql(conexion_bd, "SELECT descripcion, id FROM productos")
+    if productos is None:
+        return None
+    ids_productos = dict(productos)
+
+    demanda = {}
+    try:
+        for numero_de_fila, fila in importar_leer_filas(ruta_archivo, formato):
+            id_producto = ids_productos.get(str((fila or {}).get("producto") or "").strip())
+            try:
+                cantidad = int(str((fila or {}).get("cantidad")).strip())
+            except ValueError:
+                cantidad = 0
+            if id_producto is None or cantidad <= 0:
+                registrar_evento("Fila {} de la demanda ignorada: el producto debe existir y la cantidad debe ser un número entero mayor a cero", numero_de_fila, nivel=ADVERTENCIA)
+                continue
+            demanda[id_producto] = demanda.get(id_producto, 0) + cantidad
+    except (OSError, UnicodeDecodeError, ValueError) as err:
+        registrar_evento("Error leyendo el archivo de demanda [{}]\nError: [{}]", ruta_archivo, err, nivel=ERROR)
+        return None
+
+    return demanda
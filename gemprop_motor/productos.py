@@ -0,0 +1,189 @@
+"""
+Modelo de productos
+
+Funciones de alta, baja y consulta de la tabla 'productos' y de su relación con los
+materiales usados para confeccionarlos (tabla 'materiales_por_producto') y con los productos
+usados como subconjuntos (tabla 'productos_por_producto').
+Toda modificación del BOM de un producto descarta las explosiones memorizadas que dependen de él.
+Las consultas de productos se responden desde el catálogo en memoria.
+"""
+
+import sqlite3                      # Gestión de errores accediendo a la base de datos
+
+from gemprop_motor.eventos import registrar_evento, ADVERTENCIA, ERROR
+from gemprop_motor.metricas import metricas_incrementar
+from gemprop_motor.sql import ejecutar_consulta_sql, ejecutar_sentencia_sql
+from gemprop_motor.explosion import explosion_genera_ciclo, explosion_invalidar_producto
+from gemprop_motor.catalogo import catalogo_recuperar, catalogo_buscar, catalogo_buscar_por_texto, catalogo_buscar_id_por_descripcion, catalogo_guardar, catalogo_eliminar
+from gemprop_motor.atp import atp_recargar_registros
+
+
+def productos_insertar_registro_producto(conexion_bd, descripcion, tiempo_confeccion=0):
+
+    sql = "INSERT INTO productos(descripcion, tiempo_confeccion) VALUES (?, ?)"
+    datos = (descripcion, tiempo_confeccion)
+    filas_afectadas = ejecutar_sentencia_sql(conexion_bd, sql, datos)
+    if filas_afectadas is not None:
+        # Agregar el nuevo producto al catálogo en memoria (su id lo asigna la base de datos)
+        sql = "SELECT id, descripcion, tiempo_confeccion FROM productos WHERE descripcion = ?"
+        registros = ejecutar_consulta_sql(conexion_bd, sql, (descripcion,)) or []
+        catalogo_guardar(conexion_bd, "productos", registros)
+        atp_recargar_registros(conexion_bd, ids_productos=[registro[0] for registro in registros])
+
+    return filas_afectadas
+
+def productos_actualizar_tiempo_confeccion(conexion_bd, id_producto, tiempo_confeccion):
+    # Actualiza el tiempo de confección (en días) del producto cuyo ID coincide con el argumento id_producto
+    sql = "UPDATE productos SET tiempo_confeccion = ? WHERE id = ?"
+    if ejecutar_sentencia_sql(conexion_bd, sql, (tiempo_confeccion, id_producto)) is None:
+        return False
+
+    for registro in catalogo_buscar(conexion_bd, "productos", [id_producto]) or []:
+        catalogo_guardar(conexion_bd, "productos", [(registro[0], registro[1], tiempo_confeccion)])
+    atp_recargar_registros(conexion_bd, ids_productos=[id_producto])
+    return True
+
+def productos_eliminar_registro_producto(conexion_bd, id_producto):
+    # Elimina el producto y la relación con los materiales y subproductos que utiliza (si las hay), en una única transacción.
+    # Un producto usado como subconjunto de otro no puede eliminarse: la verificación se hace dentro de la misma transacción,
+    # por lo que otra conexión no puede asociarlo entre la verificación y la baja.
+    sql_usos = "SELECT COUNT(id_producto) FROM productos_por_producto WHERE id_subproducto = ?"
+    sentencias = [
+        "DELETE FROM materiales_por_producto WHERE id_producto = ?",
+        "DELETE FROM productos_por_producto WHERE id_producto = ?",
+        "DELETE FROM productos WHERE id = ?"
+    ]
+    try:
+        cursor = conexion_bd.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        usos = cursor.execute(sql_usos, (id_producto,)).fetchone()[0]
+        if usos == 0:
+            for sql in sentencias:
+                cursor.execute(sql, (id_producto,))
+            conexion_bd.commit()
+        else:
+            conexion_bd.rollback()
+    except sqlite3.Error as err:
+        conexion_bd.rollback()
+        metricas_incrementar("gemprop_errores_de_base_de_datos_total")
+        registrar_evento("Error eliminando el producto con id={}\nError: [{}]", id_producto, err.args[0], nivel=ERROR)
+        return False
+
+    if usos > 0:
+        registrar_evento("El producto con id=[{}] es subconjunto de otros productos y no puede eliminarse", id_producto, nivel=ADVERTENCIA)
+        return False
+
+    explosion_invalidar_producto(conexion_bd, id_producto)
+    catalogo_eliminar(conexion_bd, "productos", [id_producto])
+    atp_recargar_registros(conexion_bd, ids_productos=[id_producto])
+
+    return True
+
+def productos_recuperar_productos(conexion_bd):
+    # Lee todos los registros de la tabla de productos, ordenados por id: (id, descripcion, tiempo_confeccion)
+    return catalogo_recuperar(conexion_bd, "productos")
+
+def productos_buscar_producto(conexion_bd, id_producto):
+    # Obtiene una lista con el registro (id, descripcion, tiempo_confeccion) del producto cuyo ID coincide con el argumento id_producto
+    return catalogo_buscar(conexion_bd, "productos", [id_producto])
+
+def productos_buscar_por_texto(conexion_bd, texto, limite=20):
+    # Búsqueda incremental por descripción: obtiene hasta 'limite' productos con palabras que comienzan con las del texto
+    return catalogo_buscar_por_texto(conexion_bd, "productos", texto, limite)
+
+def productos_buscar_id_por_descripcion(conexion_bd, descripcion_producto):
+    # Obtiene el id único del producto cuya descripción coincide con la recibida, o None si no existe
+    id_producto = catalogo_buscar_id_por_descripcion(conexion_bd, "productos", descripcion_producto)
+    if id_producto is False:
+        return None
+
+    return id_producto
+
+def productos_existe_descripcion(conexion_bd, descripcion_producto):
+    # Verifica si existe un producto con la misma descripción (case sensitive)
+    # Retorna None si no pudo realizarse la consulta
+    id_producto = catalogo_buscar_id_por_descripcion(conexion_bd, "productos", descripcion_producto)
+    if id_producto is False:
+        return None
+
+    return id_producto is not None
+
+def productos_asociar_material_a_producto(conexion_bd, id_producto, id_material, cantidad_material):
+    # Asocia el material al producto. La clave primaria (id_producto, id_material) impide asociar dos veces el mismo material.
+    sql = "INSERT INTO materiales_por_producto(id_material, id_producto, cantidad_de_unidades) VALUES (?, ?, ?)"
+    datos = (id_material, id_producto, cantidad_material)
+    if ejecutar_sentencia_sql(conexion_bd, sql, datos) is None:
+        return False
+
+    explosion_invalidar_producto(conexion_bd, id_producto)
+    return True
+
+def productos_desasociar_material_del_producto(conexion_bd, id_producto, id_material):
+
+    sql = "DELETE FROM materiales_por_producto WHERE id_material = ? AND id_producto = ?"
+    datos = (id_material, id_producto)
+    if ejecutar_sentencia_sql(conexion_bd, sql, datos) is None:
+        return False
+
+    explosion_invalidar_producto(conexion_bd, id_producto)
+    return True
+
+def productos_recuperar_materiales_asociados(conexion_bd, id_producto):
+    # Obtiene la lista de materiales asociados al producto: (id_material, descripcion_material, cantidad_de_unidades)
+    sql = "SELECT materiales.id AS id_material, materiales.descripcion AS descripcion_material, materiales_por_producto.cantidad_de_unidades "\
+        "FROM materiales INNER JOIN materiales_por_producto "\
+        "ON materiales.id = materiales_por_producto.id_material "\
+        "WHERE materiales_por_producto.id_producto = ?"
+    registros = ejecutar_consulta_sql(conexion_bd, sql, (id_producto, ))
+    if registros is not None:
+        registrar_evento("Se recuperaron todos los registros de la tabla 'materiales_por_producto'")
+
+    return registros
+
+def productos_asociar_subproducto_a_producto(conexion_bd, id_producto, id_subproducto, cantidad_subproducto):
+    # Usa el producto 'id_subproducto' como componente de 'id_producto'. No se permiten relaciones que generen un ciclo
+    # (un producto que termine siendo componente de sí mismo a través de sus subproductos). La verificación y el alta se
+    # hacen en una única transacción, por lo que dos conexiones no pueden asociar A a B y B a A al mismo tiempo.
+    sql = "INSERT INTO productos_por_producto(id_producto, id_subproducto, cantidad_de_unidades) VALUES (?, ?, ?)"
+    datos = (id_producto, id_subproducto, cantidad_subproducto)
+    try:
+        cursor = conexion_bd.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        genera_ciclo = explosion_genera_ciclo(conexion_bd, id_producto, id_subproducto)
+        if genera_ciclo is False:
+            cursor.execute(sql, datos)
+            conexion_bd.commit()
+        else:
+            conexion_bd.rollback()
+    except sqlite3.Error as err:
+        conexion_bd.rollback()
+        metricas_incrementar("gemprop_errores_de_base_de_datos_total")
+        registrar_evento("Error asociando el subproducto con id={} al producto con id={}\nError: [{}]", id_subproducto, id_producto, err.args[0], nivel=ERROR)
+        return False
+
+    if genera_ciclo is None:
+        return False
+    if genera_ciclo:
+        registrar_evento("El producto con id=[{}] no puede ser componente del producto con id=[{}] porque generaría un ciclo", id_subproducto, id_producto, nivel=ADVERTENCIA)
+        return False
+
+    explosion_invalidar_producto(conexion_bd, id_producto)
+    return True
+
+def productos_desasociar_subproducto_del_producto(conexion_bd, id_producto, id_subproducto):
+
+    sql = "DELETE FROM productos_por_producto WHERE id_producto = ? AND id_subproducto = ?"
+    datos = (id_producto, id_subproducto)
+    if ejecutar_sentencia_sql(conexion_bd, sql, datos) is None:
+        return False
+
+    explosion_invalidar_producto(conexion_bd, id_producto)
+    return True
+
+def productos_recuperar_subproductos_asociados(conexion_bd, id_producto):
+    # Obtiene la lista de productos usados como subconjuntos del producto: (id_subproducto, descripcion_subproducto, cantidad_de_unidades)
+    sql = "SELECT productos.id AS id_subproducto, productos.descripcion AS descripcion_subproducto, productos_por_producto.cantidad_de_unidades "\
+        "FROM productos INNER JOIN productos_por_producto "\
+        "ON productos.id = productos_por_producto.id_subproducto "\
+        "WHERE productos_por_producto.id_producto = ?"
+    return ejecutar_consulta_sql(conexion_bd, sql, (id_producto, ))
@@ -0,0 +1,222 @@
+"""
+Medición del rendimiento de las operaciones del motor
+
+Mide cada operación del modelo y de los controladores de la aplicación (ver OPERACIONES) sobre bases de
+datos sintéticas de distintos tamaños (ver generador.py). Para cada operación se registra:
+- la latencia de la primera ejecución (con las memorias del catálogo y de las explosiones vacías), y las
+  latencias p50 y p99 y las operaciones por segundo de las ejecuciones siguientes,
+- la memoria pico de Python durante las primeras ejecuciones, medida con tracemalloc en una conexión
+  nueva y en una pasada aparte, para que el rastreo de memoria no altere las latencias,
+- la cantidad promedio de sentencias SQL ejecutadas por operación, incluidas las que ejecutan los triggers.
+
+Las operaciones de escritura (pedidos, reposición, ajustes de stock) se miden después de las de lectura,
+sobre una copia de la base generada, que se conserva sin modificar para las mediciones siguientes. El
+resultado se guarda como JSON junto con las versiones de Python y de SQLite, de forma que dos mediciones
+pueden compararse con rendimiento_comparar().
+
+Uso desde la línea de comandos (ver __main__.py):
+    python -m gemprop_motor medir <resultados.json> [--tamaños 1000x200,20000x4000] [--repeticiones N] [--comparar <anterior.json>]
+"""
+
+from datetime import date, datetime, timedelta  # Fechas de la reposición y de la medición
+import json                         # Resultados de la medición
+import os                           # Rutas de las bases de datos sintéticas
+import platform                     # Entorno de la medición
+import random                       # Elección reproducible de los registros de cada operación
+import shutil                       # Copia de trabajo de la base de datos sintética
+import sqlite3                      # Versión de SQLite
+import tempfile                     # Directorio de las bases de datos sintéticas
+import time                         # Latencia de las operaciones
+import tracemalloc                  # Memoria pico de las operaciones
+
+from gemprop_motor.eventos import registrar_evento, ERROR
+from gemprop_motor.sql import abrir_base_de_datos
+from gemprop_motor.catalogo import catalogo_descartar
+from gemprop_motor.explosion import explosion_de_materiales, explosion_recuperar_materiales, explosion_descartar
+from gemprop_motor.disponibilidad import disponibilidad_recuperar_productos, disponibilidad_descartar
+from gemprop_motor.materiales import materiales_recuperar_materiales, materiales_buscar_por_texto, materiales_buscar_material, materiales_actualizar_registro_material
+from gemprop_motor.productos import productos_recuperar_productos, productos_recuperar_materiales_asociados, productos_recuperar_subproductos_asociados
+from gemprop_motor.pedidos import pedidos_calcular_pedido_multiple, pedidos_procesar_pedido_multiple, pedidos_actualizar_stock, pedidos_recuperar_historial
+from gemprop_motor.generador import generar_base_de_datos
+
+
+TAMAÑOS = ((1000, 200), (20000, 4000), (100000, 20000))    # (materiales, productos) de las bases medidas por defecto
+REPETICIONES = 100                  # Ejecuciones de cada operación en la medición de latencias
+REPETICIONES_DE_MEMORIA = 3         # Ejecuciones de cada operación en la medición de memoria
+
+
+def _mostrar_materiales_asociados(contexto):
+    # Lo que lee productos_mostrar_materiales_asociados() de la aplicación al seleccionar un producto
+    id_producto = contexto["aleatorio"].choice(contexto["ids_productos"])
+    productos_recuperar_materiales_asociados(contexto["conexion_bd"], id_producto)
+    for id_subproducto, descripcion, cantidad in productos_recuperar_subproductos_asociados(contexto["conexion_bd"], id_producto) or []:
+        explosion_recuperar_materiales(contexto["conexion_bd"], id_subproducto)
+
+def _texto_buscado(contexto):
+    # Lo que escribe el usuario en el combobox de materiales: el comienzo de la descripción de un material generado
+    return f"Material {contexto['aleatorio'].choice(contexto['ids_materiales']):07d}"[:-2]
+
+def _actualizar_stock(contexto):
+    # Reposición de un día distinto en cada ejecución, para que se reciban las órdenes emitidas en las anteriores
+    contexto["dias_de_reposicion"] += 1
+    return pedidos_actualizar_stock(contexto["conexion_bd"], date.today() + timedelta(days=contexto["dias_de_reposicion"]))
+
+def _ajustar_stock(contexto):
+    # Lo que ejecuta materiales_actualizar_material() de la aplicación al corregir el stock de un material
+    registro = materiales_buscar_material(contexto["conexion_bd"], contexto["aleatorio"].choice(contexto["ids_materiales"]))[0]
+    return materiales_actualizar_registro_material(contexto["conexion_bd"], registro[0], registro[1], contexto["aleatorio"].randint(0, 500), registro[3], registro[4], registro[5])
+
+# Operaciones medidas, en orden de ejecución: nombre -> (función que recibe el contexto de la medición, repeticiones máximas o None)
+OPERACIONES = {
+    "materiales_recuperar_materiales": (lambda contexto: materiales_recuperar_materiales(contexto["conexion_bd"]), None),
+    "materiales_buscar_por_texto": (lambda contexto: materiales_buscar_por_texto(contexto["conexion_bd"], _texto_buscado(contexto)), None),
+    "productos_recuperar_productos": (lambda contexto: productos_recuperar_productos(contexto["conexion_bd"]), None),
+    "productos_mostrar_materiales_asociados": (_mostrar_materiales_asociados, None),
+    "explosion_de_materiales": (lambda contexto: explosion_de_materiales(contexto["conexion_bd"], contexto["aleatorio"].choice(contexto["ids_productos"])), None),
+    "pedidos_calcular_pedido": (lambda contexto: pedidos_calcular_pedido_multiple(contexto["conexion_bd"], [(contexto["aleatorio"].choice(contexto["ids_productos"]), contexto["aleatorio"].randint(1, 5))]), None),
+    "disponibilidad_recuperar_productos": (lambda contexto: disponibilidad_recuperar_productos(contexto["conexion_bd"]), None),
+    "pedidos_procesar_pedido": (lambda contexto: pedidos_procesar_pedido_multiple(contexto["conexion_bd"], [(contexto["aleatorio"].choice(contexto["ids_productos"]), contexto["aleatorio"].randint(1, 5))]), None),
+    "pedidos_recuperar_historial": (lambda contexto: pedidos_recuperar_historial(contexto["conexion_bd"]), None),
+    "materiales_actualizar_registro_material": (_ajustar_stock, None),
+    "pedidos_actualizar_stock": (_actualizar_stock, 10)
+}
+
+
+def rendimiento_medir(ruta_base_de_datos, repeticiones=REPETICIONES, operaciones=None, semilla=0):
+    # Mide las operaciones indicadas (por defecto todas) sobre la base de datos, que es modificada por las operaciones de escritura.
+    # Retorna un diccionario {operación: métricas}, o None si la base de datos no pudo abrirse.
+    resultados = {}
+    for nombre in operaciones or OPERACIONES:
+        funcion, repeticiones_maximas = OPERACIONES[nombre]
+        repeticiones_de_la_operacion = min(repeticiones, repeticiones_maximas or repeticiones)
+
+        # Latencias y sentencias SQL, en una conexión nueva (la primera ejecución carga el catálogo y las explosiones)
+        contexto = _crear_contexto(ruta_base_de_datos, semilla)
+        if contexto is None:
+            return None
+        sentencias = 0
+        def contar_sentencia(sentencia):
+            nonlocal sentencias
+            sentencias += 1
+        contexto["conexion_bd"].set_trace_callback(contar_sentencia)
+        latencias = []
+        for _ in range(repeticiones_de_la_operacion + 1):
+            inicio = time.perf_counter()
+            funcion(contexto)
+            latencias.append(time.perf_counter() - inicio)
+        contexto["conexion_bd"].set_trace_callback(None)
+        _cerrar_contexto(contexto)
+
+        # Memoria pico, en otra conexión nueva
+        contexto = _crear_contexto(ruta_base_de_datos, semilla + 1)
+        if contexto is None:
+            return None
+        memoria_pico = 0
+        tracemalloc.start()
+        try:
+            for _ in range(REPETICIONES_DE_MEMORIA):
+                tracemalloc.reset_peak()
+                memoria_inicial = tracemalloc.get_traced_memory()[0]
+                funcion(contexto)
+                memoria_pico = max(memoria_pico, tracemalloc.get_traced_memory()[1] - memoria_inicial)
+        finally:
+            tracemalloc.stop()
+        _cerrar_contexto(contexto)
+
+        siguientes = sorted(latencias[1:])
+        resultados[nombre] = {
+            "repeticiones": repeticiones_de_la_operacion,
+            "primera_ms": latencias[0] * 1000,
+            "p50_ms": siguientes[len(siguientes) // 2] * 1000,
+            "p99_ms": siguientes[min(len(siguientes) - 1, int(len(siguientes) * 0.99))] * 1000,
+            "operaciones_por_segundo": len(siguientes) / max(sum(siguientes), 1e-9),
+            "memoria_pico_kib": memoria_pico / 1024,
+            "sentencias_sql": sentencias / len(latencias)
+        }
+        registrar_evento("Rendimiento de {}: p50={:.3f} ms, p99={:.3f} ms, {:.1f} sentencia(s) SQL por operación", nombre,
+                         resultados[nombre]["p50_ms"], resultados[nombre]["p99_ms"], resultados[nombre]["sentencias_sql"])
+
+    return resultados
+
+def _crear_contexto(ruta_base_de_datos, semilla):
+    # Abre una conexión nueva y lee los ids de los materiales y de los productos entre los que se eligen los de cada operación
+    conexion_bd = abrir_base_de_datos(ruta_base_de_datos)
+    if conexion_bd is None:
+        return None
+    return {
+        "conexion_bd": conexion_bd,
+        "aleatorio": random.Random(semilla),
+        "ids_materiales": [registro[0] for registro in conexion_bd.execute("SELECT id FROM materiales")],
+        "ids_productos": [registro[0] for registro in conexion_bd.execute("SELECT id FROM productos")],
+        "dias_de_reposicion": 0
+    }
+
+def _cerrar_contexto(contexto):
+    # Cierra la conexión y descarta las memorias del motor asociadas a ella
+    conexion_bd = contexto["conexion_bd"]
+    catalogo_descartar(conexion_bd)
+    explosion_descartar(conexion_bd)
+    disponibilidad_descartar(conexion_bd)
+    conexion_bd.close()
+
+def rendimiento_ejecutar(ruta_resultados, tamaños=TAMAÑOS, repeticiones=REPETICIONES, directorio=None, semilla=0, operaciones=None):
+    # Genera (o reutiliza, si ya existen en 'directorio') las bases de datos sintéticas de cada tamaño, mide las operaciones
+    # sobre una copia de cada una y guarda los resultados en el archivo JSON indicado. Retorna los resultados, o None si hubo un error.
+    directorio = directorio or os.path.join(tempfile.gettempdir(), "gemprop_rendimiento")
+    os.makedirs(directorio, exist_ok=True)
+    resultados = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "plataforma": platform.platform(),
+        "semilla": semilla,
+        "repeticiones": repeticiones,
+        "tamaños": []
+    }
+
+    for materiales, productos in tamaños:
+        ruta_generada = os.path.join(directorio, f"sintetica_{materiales}x{productos}_semilla{semilla}.db")
+        if not os.path.exists(ruta_generada) and generar_base_de_datos(ruta_generada, materiales, productos, semilla=semilla) is None:
+            return None
+        ruta_de_trabajo = os.path.join(directorio, "medicion.db")
+        shutil.copyfile(ruta_generada, ruta_de_trabajo)
+        operaciones_medidas = rendimiento_medir(ruta_de_trabajo, repeticiones, operaciones, semilla)
+        os.remove(ruta_de_trabajo)
+        if operaciones_medidas is None:
+            return None
+        resultados["tamaños"].append({"materiales": materiales, "productos": productos, "operaciones": operaciones_medidas})
+
+    try:
+        with open(ruta_resultados, "w", encoding="utf-8") as archivo:
+            json.dump(resultados, archivo, ensure_ascii=False, indent=2)
+    except OSError as err:
+        registrar_evento("No se pudieron guardar los resultados de la medición en [{}]\nError: [{}]", ruta_resultados, err, nivel=ERROR)
+        return None
+
+    return resultados
+
+def rendimiento_comparar(resultados_anteriores, resultados_nuevos):
+    # Compara dos mediciones (diccionarios o rutas de archivos JSON). Retorna una lista de tuplas (materiales, productos, operación,
+    # p50 anterior, p50 nuevo, variación en %) de las operaciones medidas en ambas con el mismo tamaño, o None si hubo un error.
+    try:
+        if isinstance(resultados_anteriores, str):
+            with open(resultados_anteriores, encoding="utf-8") as archivo:
+                resultados_anteriores = json.load(archivo)
+        if isinstance(resultados_nuevos, str):
+            with open(resultados_nuevos, encoding="utf-8") as archivo:
+                resultados_nuevos = json.load(archivo)
+    except (OSError, ValueError) as err:
+        registrar_evento("No se pudieron leer los resultados a comparar\nError: [{}]", err, nivel=ERROR)
+        return None
+
+    anteriores = {(tamaño["materiales"], tamaño["productos"]): tamaño["operaciones"] for tamaño in resultados_anteriores["tamaños"]}
+    comparacion = []
+    for tamaño in resultados_nuevos["tamaños"]:
+        operaciones_anteriores = anteriores.get((tamaño["materiales"], tamaño["productos"]), {})
+        for nombre, metricas in tamaño["operaciones"].items():
+            if nombre in operaciones_anteriores:
+                p50_anterior = operaciones_anteriores[nombre]["p50_ms"]
+                variacion = (metricas["p50_ms"] - p50_anterior) / p50_anterior * 100 if p50_anterior else 0.0
+                comparacion.append((tamaño["materiales"], tamaño["productos"], nombre, p50_anterior, metricas["p50_ms"], variacion))
+
+    return comparacion
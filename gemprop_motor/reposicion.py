@@ -0,0 +1,154 @@
+"""
+Reposición de materiales mediante órdenes de compra
+
+Implementa el requerimiento 1.5: cada material tiene una cantidad de reposición, que es la cantidad
+de unidades que se solicitan al proveedor en cada pedido de material. La reposición tiene dos pasos:
+- Emisión: para cada material cuyo stock actual es inferior a su nivel de reposición se emite una orden
+  de compra, salvo que las órdenes pendientes de recibir ya cubran ese nivel. La cantidad pedida es el
+  menor múltiplo de la cantidad de reposición que lleva el stock (más lo pendiente) al nivel de reposición,
+  y la fecha de entrega es la fecha de emisión más la demora de reposición del material.
+- Recepción: las órdenes cuya fecha de entrega ya llegó se dan por recibidas y su cantidad ingresa al stock
+  como un movimiento de recepción del libro de stock (ver movimientos.py).
+
+Los materiales a reponer se obtienen de la cola de reposición, que los triggers de la tabla 'materiales'
+mantienen al modificarse el stock (ver MIGRACION_6): contiene solo los materiales con stock inferior al
+nivel de reposición, por lo que consultarla o procesarla cuesta O(materiales en la cola). Las órdenes
+pendientes se obtienen de los índices parciales sobre las órdenes sin fecha de recepción, por lo que
+ninguno de los dos pasos recorre las tablas completas.
+
+Emitir órdenes es idempotente: un material de la cola cuyo faltante ya está cubierto por órdenes pendientes
+no vuelve a pedirse, por lo que la emisión puede repetirse (o ejecutarse desde dos procesos) sin duplicar
+pedidos. Las fechas se guardan como texto ISO (aaaa-mm-dd), que se ordena igual que las fechas.
+
+Ambos pasos registran sus movimientos en la proyección ATP memorizada de la conexión (ver atp.py): una orden
+emitida ingresa el día de su fecha de entrega, y una orden recibida deja de ingresar ese día y pasa al stock
+del día 0.
+"""
+
+from datetime import date           # Fechas de emisión, entrega y recepción
+import json                         # Lista de ids enviada como un único parámetro de consulta
+import sqlite3                      # Gestión de errores accediendo a la base de datos
+
+from gemprop_motor.eventos import registrar_evento, ERROR
+from gemprop_motor.metricas import metricas_incrementar
+from gemprop_motor.sql import ejecutar_consulta_sql
+from gemprop_motor.catalogo import catalogo_recargar_registros
+from gemprop_motor.disponibilidad import disponibilidad_actualizar_materiales
+from gemprop_motor.atp import atp_memorizada, atp_registrar_movimiento, atp_descartar
+
+
+CANTIDAD_REPOSICION_PREDETERMINADA = 10     # Cantidad de reposición de los materiales que no la indican (ver MIGRACION_5)
+
+
+def reposicion_emitir_ordenes(conexion_bd, fecha=None):
+    # Emite una orden de compra por cada material de la cola que debe reponerse, con la fecha indicada (por defecto la actual).
+    # La verificación del stock y de las órdenes pendientes y el alta de las órdenes se hacen en una única sentencia (y por
+    # lo tanto en una única transacción de escritura), por lo que dos emisiones simultáneas no pueden pedir dos veces el
+    # mismo faltante, y un pedido confirmado al mismo tiempo se tiene en cuenta en esta emisión o en la siguiente.
+    # Retorna la cantidad de órdenes emitidas, o None si hubo un error.
+    fecha = (fecha or date.today()).isoformat()
+    sql = """
+        INSERT INTO ordenes_de_compra(id_material, cantidad, fecha_emision, fecha_entrega)
+        SELECT id, ((stock_reposicion - posicion + cantidad_reposicion - 1) / cantidad_reposicion) * cantidad_reposicion,
+               :fecha, date(:fecha, '+' || demora_reposicion || ' days')
+        FROM (
+            SELECT m.id, m.stock_reposicion, m.cantidad_reposicion, m.demora_reposicion,
+                   m.stock_actual + COALESCE((SELECT SUM(o.cantidad) FROM ordenes_de_compra o
+                                              WHERE o.id_material = m.id AND o.fecha_recepcion IS NULL), 0) AS posicion
+            FROM cola_de_reposicion c
+            INNER JOIN materiales m ON m.id = c.id_material
+        )
+        WHERE posicion < stock_reposicion
+        """
+    # Las órdenes emitidas son las de id mayor al último existente antes de emitir, leídas en la misma transacción
+    sql_emitidas = "SELECT id_material, cantidad, fecha_entrega FROM ordenes_de_compra WHERE id > ?"
+    try:
+        cursor = conexion_bd.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        ultima_orden = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM ordenes_de_compra").fetchone()[0]
+        cursor.execute(sql, {"fecha": fecha})
+        ordenes = cursor.execute(sql_emitidas, (ultima_orden,)).fetchall()
+        conexion_bd.commit()
+    except sqlite3.Error as err:
+        conexion_bd.rollback()
+        metricas_incrementar("gemprop_errores_de_base_de_datos_total")
+        registrar_evento("Error emitiendo las órdenes de compra, no se emitió ninguna orden\nError: [{}]", err.args[0], nivel=ERROR)
+        return None
+
+    if ordenes:
+        atp = atp_memorizada(conexion_bd)
+        if atp is not None:
+            for id_material, cantidad, fecha_entrega in ordenes:
+                if not atp_registrar_movimiento(atp, id_material, (date.fromisoformat(fecha_entrega) - atp["fecha_base"]).days, cantidad):
+                    atp_descartar(conexion_bd)
+                    break
+        registrar_evento("Se emitieron {} orden(es) de compra de reposición", len(ordenes))
+    return len(ordenes)
+
+def reposicion_recibir_ordenes(conexion_bd, fecha=None, ids_ordenes=None):
+    # Recibe las órdenes pendientes cuya fecha de entrega es anterior o igual a la fecha indicada (por defecto la actual),
+    # o bien las órdenes pendientes cuyos ids se reciben, sin importar su fecha de entrega. El stock de los materiales y
+    # la fecha de recepción de las órdenes se actualizan en una única transacción.
+    # Retorna la cantidad de órdenes recibidas, o None si hubo un error.
+    fecha = (fecha or date.today()).isoformat()
+    if ids_ordenes is None:
+        sql = "SELECT id, id_material, cantidad, fecha_entrega FROM ordenes_de_compra WHERE fecha_recepcion IS NULL AND fecha_entrega <= ?"
+        argumentos = (fecha,)
+    else:
+        sql = "SELECT id, id_material, cantidad, fecha_entrega FROM ordenes_de_compra WHERE fecha_recepcion IS NULL AND id IN (SELECT value FROM json_each(?))"
+        argumentos = (json.dumps(list(ids_ordenes)),)
+
+    try:
+        cursor = conexion_bd.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        ordenes = cursor.execute(sql, argumentos).fetchall()
+        cursor.executemany("INSERT INTO movimientos_de_stock(id_material, tipo, cantidad, referencia) VALUES (?, 'recepcion', ?, ?)",
+                           [(id_material, cantidad, id_orden) for id_orden, id_material, cantidad, fecha_entrega in ordenes])
+        cursor.executemany("UPDATE ordenes_de_compra SET fecha_recepcion = ? WHERE id = ?", [(fecha, id_orden) for id_orden, id_material, cantidad, fecha_entrega in ordenes])
+        conexion_bd.commit()
+    except sqlite3.Error as err:
+        conexion_bd.rollback()
+        metricas_incrementar("gemprop_errores_de_base_de_datos_total")
+        registrar_evento("Error recibiendo las órdenes de compra, no se modificó el stock de ningún material\nError: [{}]", err.args[0], nivel=ERROR)
+        return None
+
+    if ordenes:
+        ids_materiales = {id_material for id_orden, id_material, cantidad, fecha_entrega in ordenes}
+        catalogo_recargar_registros(conexion_bd, "materiales", ids_materiales)
+        disponibilidad_actualizar_materiales(conexion_bd, ids_materiales)
+        atp = atp_memorizada(conexion_bd)
+        if atp is not None:
+            # La orden deja de ingresar el día de su entrega (el día 0 si estaba atrasada) e ingresa al stock actual
+            for id_orden, id_material, cantidad, fecha_entrega in ordenes:
+                if not (atp_registrar_movimiento(atp, id_material, (date.fromisoformat(fecha_entrega) - atp["fecha_base"]).days, -cantidad)
+                        and atp_registrar_movimiento(atp, id_material, 0, cantidad)):
+                    atp_descartar(conexion_bd)
+                    break
+        registrar_evento("Se recibieron {} orden(es) de compra de reposición", len(ordenes))
+        metricas_incrementar("gemprop_actualizaciones_de_stock_total", len(ordenes), tipo="recepcion")
+    return len(ordenes)
+
+def reposicion_recuperar_cola(conexion_bd):
+    # Obtiene los materiales de la cola de reposición (id_material, descripcion, stock_actual, stock_reposicion, cantidad
+    # pendiente de recibir, fecha de alta en la cola), ordenados por fecha de alta, o None si hubo un error
+    sql = """
+        SELECT m.id, m.descripcion, m.stock_actual, m.stock_reposicion,
+               COALESCE((SELECT SUM(o.cantidad) FROM ordenes_de_compra o WHERE o.id_material = m.id AND o.fecha_recepcion IS NULL), 0),
+               c.fecha_alta
+        FROM cola_de_reposicion c
+        INNER JOIN materiales m ON m.id = c.id_material
+        ORDER BY c.fecha_alta, m.id
+        """
+    return ejecutar_consulta_sql(conexion_bd, sql)
+
+def reposicion_recuperar_ordenes_pendientes(conexion_bd):
+    # Obtiene las órdenes de compra pendientes de recibir (id, id_material, descripcion_material, cantidad, fecha_emision,
+    # fecha_entrega), ordenadas por fecha de entrega, o None si hubo un error
+    sql = """
+        SELECT o.id, o.id_material, m.descripcion, o.cantidad, o.fecha_emision, o.fecha_entrega
+        FROM ordenes_de_compra o
+        INNER JOIN materiales m ON m.id = o.id_material
+        WHERE o.fecha_recepcion IS NULL
+        ORDER BY o.fecha_entrega, o.id
+        """
+    return ejecutar_consulta_sql(conexion_bd, sql)
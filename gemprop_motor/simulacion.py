@@ -0,0 +1,185 @@
+"""
+Simulación de escenarios de pedidos ("qué pasaría si")
+
+Antes de aceptar un conjunto grande de pedidos se puede simular qué pedidos se atrasan, y cuántos días,
+si se aceptan en una secuencia dada. Un escenario es una secuencia de pedidos (día, id_producto, cantidad),
+donde el día se cuenta desde la fecha base de la simulación (0 = hoy). La simulación es de eventos
+discretos y avanza de un evento al siguiente (la llegada de un pedido o de una orden de compra):
+- los pedidos se atienden en el orden de la secuencia: un pedido no comienza antes que el anterior,
+- un pedido consume los materiales de su explosión (ver explosion.py) el primer día en que hay stock de
+  todos ellos, y se entrega luego de su tiempo de confección,
+- si falta un material, se emite una orden de compra que lleva su posición (stock + órdenes pendientes) a
+  lo que requiere el pedido, y el pedido espera la llegada de las órdenes,
+- luego de cada consumo se aplica la reposición diaria (ver reposicion.py): si la posición de un material
+  queda por debajo de su nivel de reposición se emite una orden por múltiplos de su cantidad de reposición,
+  que llega luego de su demora de reposición. Las órdenes pendientes en la base de datos llegan en su
+  fecha de entrega.
+El atraso de un pedido es la diferencia entre su día de entrega y el que tendría sin esperar materiales
+(el día del pedido más su tiempo de confección).
+
+La simulación nunca modifica la base de datos: el stock de cada escenario se lleva en memoria como
+diferencias sobre el del modelo. Para evaluar muchos escenarios independientes en paralelo se copia la
+base de datos a un archivo de instantánea con la API de backup de SQLite (una copia consistente que no
+bloquea a los demás usuarios), y cada proceso de un ProcessPoolExecutor la abre en modo de solo lectura
+con memoria mapeada: todos los procesos comparten las mismas páginas del archivo en la caché del sistema
+operativo, y cada uno carga el modelo una única vez para todos los escenarios que simula.
+"""
+
+from datetime import date           # Fecha base de la simulación
+import heapq                        # Llegadas de las órdenes de compra, ordenadas por día
+import os                           # Ruta de la instantánea
+import sqlite3                      # Copia de la base de datos a la instantánea
+import tempfile                     # Directorio de la instantánea
+
+from gemprop_motor.eventos import registrar_evento, ERROR
+from gemprop_motor.metricas import metricas_incrementar
+from gemprop_motor.sql import abrir_base_de_datos, ejecutar_consulta_sql
+from gemprop_motor.explosion import explosion_de_materiales
+
+
+# Modelo de la simulación de cada proceso del ProcessPoolExecutor (ver _inicializar_proceso)
+modelo_del_proceso = None
+
+
+def simulacion_crear_instantanea(conexion_bd, ruta_instantanea):
+    # Copia la base de datos en el archivo indicado, sin bloquear a las demás conexiones.
+    # Retorna True si la instantánea fue creada, o False si hubo un error.
+    try:
+        destino = sqlite3.connect(ruta_instantanea)
+        try:
+            conexion_bd.backup(destino)
+            destino.execute("PRAGMA journal_mode = DELETE")     # La instantánea se abre solo para lectura, sin archivos de WAL
+        finally:
+            destino.close()
+    except sqlite3.Error as err:
+        metricas_incrementar("gemprop_errores_de_base_de_datos_total")
+        registrar_evento("No se pudo crear la instantánea de la base de datos [{}]\nError: [{}]", ruta_instantanea, err.args[0], nivel=ERROR)
+        return False
+
+    return True
+
+def simulacion_cargar(conexion_bd, fecha_base=None):
+    # Lee el stock y los datos de reposición de los materiales, los tiempos de confección y las órdenes de compra pendientes.
+    # Retorna el diccionario del modelo, o None si hubo un error.
+    fecha_base = fecha_base or date.today()
+    materiales = ejecutar_consulta_sql(conexion_bd, "SELECT id, COALESCE(stock_actual, 0), COALESCE(stock_reposicion, 0), COALESCE(demora_reposicion, 0), cantidad_reposicion FROM materiales")
+    productos = ejecutar_consulta_sql(conexion_bd, "SELECT id, COALESCE(tiempo_confeccion, 0) FROM productos")
+    sql = "SELECT id_material, cantidad, MAX(CAST(julianday(fecha_entrega) - julianday(?) AS integer), 0) FROM ordenes_de_compra WHERE fecha_recepcion IS NULL"
+    ordenes = ejecutar_consulta_sql(conexion_bd, sql, (fecha_base.isoformat(),))
+    if materiales is None or productos is None or ordenes is None:
+        return None
+
+    return {
+        "conexion_bd": conexion_bd,
+        "fecha_base": fecha_base,
+        "materiales": {registro[0]: registro[1:] for registro in materiales},    # id -> (stock, nivel, demora, cantidad de reposición)
+        "tiempos_de_confeccion": dict(productos),
+        "llegadas": [(dia, id_material, cantidad) for id_material, cantidad, dia in ordenes]
+    }
+
+def simulacion_simular(modelo, pedidos):
+    # Simula la secuencia de pedidos [(día, id_producto, cantidad)] sobre el modelo, sin modificarlo.
+    # Retorna un diccionario con el resultado de cada pedido [(posición, id_producto, cantidad, día del pedido, día comprometido,
+    # día de entrega, días de atraso)], la cantidad de pedidos atrasados, el total de días de atraso y las órdenes de compra
+    # emitidas, o None si hubo un error.
+    materiales = modelo["materiales"]
+    stock = {}                          # Stock de los materiales que cambiaron en el escenario
+    pendiente = {}                      # Unidades pendientes de recibir de los materiales que tienen órdenes de compra
+    llegadas = list(modelo["llegadas"])
+    heapq.heapify(llegadas)
+    for dia_llegada, id_material, cantidad in llegadas:
+        pendiente[id_material] = pendiente.get(id_material, 0) + cantidad
+    ordenes_emitidas = 0
+
+    def recibir(dia):
+        while llegadas and llegadas[0][0] <= dia:
+            dia_llegada, id_material, cantidad = heapq.heappop(llegadas)
+            stock[id_material] = stock.get(id_material, materiales[id_material][0]) + cantidad
+            pendiente[id_material] -= cantidad
+
+    def reponer(id_material, dia, unidades_requeridas):
+        # Emite una orden si la posición del material no alcanza las unidades requeridas o su nivel de reposición
+        nonlocal ordenes_emitidas
+        stock_inicial, stock_reposicion, demora_reposicion, cantidad_reposicion = materiales[id_material]
+        posicion = stock.get(id_material, stock_inicial) + pendiente.get(id_material, 0)
+        objetivo = max(unidades_requeridas, stock_reposicion)
+        if posicion < objetivo:
+            cantidad = -(-(objetivo - posicion) // cantidad_reposicion) * cantidad_reposicion
+            heapq.heappush(llegadas, (dia + demora_reposicion, id_material, cantidad))
+            pendiente[id_material] = pendiente.get(id_material, 0) + cantidad
+            ordenes_emitidas += 1
+
+    resultados = []
+    dia = 0
+    for posicion_pedido, (dia_pedido, id_producto, cantidad) in enumerate(pedidos):
+        explosion = explosion_de_materiales(modelo["conexion_bd"], id_producto)
+        if explosion is None:
+            return None
+        requeridas = {id_material: unidades * cantidad for id_material, unidades in explosion.items()}
+
+        # El pedido espera hasta que haya stock de todos sus materiales
+        dia = max(dia, dia_pedido)
+        while True:
+            recibir(dia)
+            faltantes = [id_material for id_material, unidades in requeridas.items() if stock.get(id_material, materiales[id_material][0]) < unidades]
+            if not faltantes:
+                break
+            for id_material in faltantes:
+                reponer(id_material, dia, requeridas[id_material])
+            dia = max(dia, llegadas[0][0])
+
+        for id_material, unidades in requeridas.items():
+            stock[id_material] = stock.get(id_material, materiales[id_material][0]) - unidades
+            reponer(id_material, dia, 0)
+
+        tiempo_confeccion = modelo["tiempos_de_confeccion"].get(id_producto, 0)
+        dia_comprometido = dia_pedido + tiempo_confeccion
+        dia_entrega = dia + tiempo_confeccion
+        resultados.append((posicion_pedido, id_producto, cantidad, dia_pedido, dia_comprometido, dia_entrega, dia_entrega - dia_comprometido))
+
+    atrasos = [resultado[6] for resultado in resultados if resultado[6] > 0]
+    return {
+        "fecha_base": modelo["fecha_base"],
+        "pedidos": resultados,
+        "atrasados": len(atrasos),
+        "dias_de_atraso": sum(atrasos),
+        "ordenes_de_compra": ordenes_emitidas
+    }
+
+def simulacion_simular_escenarios(conexion_bd, escenarios, procesos=None, fecha_base=None):
+    # Simula cada escenario (una secuencia de pedidos, ver simulacion_simular) en paralelo, con 'procesos' procesos (por defecto
+    # uno por núcleo). Retorna la lista de resultados en el orden de los escenarios, o None si hubo un error.
+    # multiprocessing se importa recién aquí: importar el motor no paga su costo de carga
+    from concurrent.futures import ProcessPoolExecutor     # Escenarios en paralelo, uno por proceso
+    from concurrent.futures.process import BrokenProcessPool
+
+    escenarios = list(escenarios)
+    with tempfile.TemporaryDirectory(prefix="gemprop_simulacion_") as directorio:
+        ruta_instantanea = os.path.join(directorio, "instantanea.db")
+        if not simulacion_crear_instantanea(conexion_bd, ruta_instantanea):
+            return None
+
+        try:
+            with ProcessPoolExecutor(max_workers=procesos, initializer=_inicializar_proceso, initargs=(ruta_instantanea, fecha_base)) as ejecutor:
+                resultados = list(ejecutor.map(_simular_en_proceso, escenarios))
+        except (OSError, BrokenProcessPool) as err:
+            registrar_evento("Error simulando los escenarios en paralelo\nError: [{}]", err, nivel=ERROR)
+            return None
+
+    if None in resultados:
+        return None
+    registrar_evento("Se simularon {} escenario(s) de pedidos", len(resultados))
+    return resultados
+
+def _inicializar_proceso(ruta_instantanea, fecha_base):
+    # Abre la instantánea en modo de solo lectura con memoria mapeada y carga el modelo que usarán todos los escenarios del proceso
+    global modelo_del_proceso
+
+    conexion_bd = abrir_base_de_datos(ruta_instantanea, "concurrente", solo_lectura=True)
+    modelo_del_proceso = None if conexion_bd is None else simulacion_cargar(conexion_bd, fecha_base)
+
+def _simular_en_proceso(pedidos):
+    # Simula el escenario con el modelo del proceso (ver _inicializar_proceso). Retorna None si el modelo no pudo cargarse.
+    if modelo_del_proceso is None:
+        return None
+    return simulacion_simular(modelo_del_proceso, pedidos)
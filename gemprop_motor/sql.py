@@ -0,0 +1,256 @@
+"""
+Acceso a la base de datos SQLite
+
+Todas las consultas y sentencias del motor pasan por las funciones de este módulo.
+Ninguna de ellas depende de tkinter: los errores se registran y se informan al invocante
+retornando None. El rastreo de cada consulta ejecutada solo se registra si está habilitado
+(ver eventos.configurar_registro), y su duración y filas solo se miden si está habilitada la
+instrumentación (ver instrumentacion.instrumentacion_configurar).
+
+Las conexiones se configuran según un perfil (ver PERFILES_DE_CONEXION), que se elige al iniciar la
+aplicación junto con el nombre de la base de datos.
+"""
+
+import sqlite3                      # Objetos de manejo de la base de datos
+import sys                          # Función invocante de las consultas iteradas
+import time                         # Duración de las consultas instrumentadas
+
+from gemprop_motor import eventos, instrumentacion, metricas
+from gemprop_motor.eventos import registrar_evento, ERROR
+
+
+# Perfiles de conexión: pragmas que se aplican a cada conexión y cantidad de conexiones de solo lectura que
+# usa el trabajador de base de datos para ejecutar consultas en paralelo con el escritor.
+PERFILES_DE_CONEXION = {
+    # Valores por defecto de SQLite: journal de rollback y sincronización completa. Un escritor bloquea a los lectores
+    # mientras confirma sus cambios, por lo que las consultas se ejecutan en la misma conexión que las sentencias.
+    "predeterminado": {
+        "pragmas": [],
+        "lectores": 0
+    },
+    # Write-ahead log: los lectores no bloquean al escritor ni el escritor a los lectores, por lo que varias instancias
+    # de GEMPROP pueden compartir la base de datos. Con WAL, synchronous=NORMAL no pone en riesgo la integridad de la
+    # base ante una falla del sistema operativo (a lo sumo se pierden las últimas transacciones confirmadas).
+    "concurrente": {
+        "pragmas": [
+            ("journal_mode", "WAL"),            # Persistente: queda registrado en el archivo de la base de datos
+            ("synchronous", "NORMAL"),
+            ("cache_size", -16000),             # Valor negativo: KiB de caché de páginas por conexión (16 MiB)
+            ("mmap_size", 256 * 1024 * 1024),   # Lectura de las páginas por memoria mapeada, sin copiarlas
+            ("temp_store", "MEMORY"),           # Tablas e índices temporales (ORDER BY, DISTINCT) en memoria
+            ("busy_timeout", 5000)              # Milisegundos de espera ante un bloqueo antes de informar un error
+        ],
+        "lectores": 4
+    }
+}
+
+class Conexion(sqlite3.Connection):
+    # Conexión de SQLite que admite referencias débiles (sqlite3.Connection no las admite): las memorias por conexión
+    # del motor (catálogo, explosiones y disponibilidad) la usan como clave de un WeakKeyDictionary, por lo que se
+    # liberan junto con la conexión
+    pass
+
+def abrir_base_de_datos(nombre_base_de_datos, perfil="predeterminado", solo_lectura=False, entre_hilos=False):
+    # Abre (o crea) la base de datos indicada y le aplica los pragmas del perfil. Retorna la conexión, o None si no pudo abrirse.
+    # Una conexión de 'solo_lectura' no crea la base de datos ni puede modificarla. Una conexión 'entre_hilos' puede
+    # usarse desde un hilo distinto al que la abrió, siempre que nunca la usen dos hilos al mismo tiempo.
+    # SQLite solo verifica las foreign keys si se habilitan en cada conexión.
+    if perfil not in PERFILES_DE_CONEXION:
+        registrar_evento("Perfil de conexión desconocido [{}]. Perfiles disponibles: {}", perfil, ", ".join(PERFILES_DE_CONEXION), nivel=ERROR)
+        return None
+
+    try:
+        if solo_lectura:
+            import pathlib          # URI de las conexiones de solo lectura; se importa solo si se abren
+            uri = pathlib.Path(nombre_base_de_datos).absolute().as_uri() + "?mode=ro"
+            conexion_bd = sqlite3.connect(uri, uri=True, check_same_thread=not entre_hilos, factory=Conexion)
+        else:
+            conexion_bd = sqlite3.connect(nombre_base_de_datos, check_same_thread=not entre_hilos, factory=Conexion)
+        conexion_bd.execute("PRAGMA foreign_keys = ON")
+        for pragma, valor in PERFILES_DE_CONEXION[perfil]["pragmas"]:
+            if solo_lectura and pragma == "journal_mode":      # Solo el escritor puede cambiar el modo del journal
+                continue
+            conexion_bd.execute(f"PRAGMA {pragma} = {valor}")
+        registrar_evento("Se abrió la base de datos [{}] con el perfil '{}'{}", nombre_base_de_datos, perfil, " (solo lectura)" if solo_lectura else "")
+        return conexion_bd
+    except sqlite3.Error as err:
+        metricas.metricas_incrementar("gemprop_errores_de_base_de_datos_total")
+        registrar_evento("No se puede abrir la base de datos [{}]\nError: [{}]", nombre_base_de_datos, err.args[0], nivel=ERROR)
+
+    return None
+
+def ejecutar_consulta_sql(conexion_bd, consulta_sql, argumentos=None):
+    # IMPORTANTE: el argumento 'argumentos' es una tupla (aún si tiene un único argumento) con los valores a reemplazar en la consulta.
+    #             Si 'argumentos' == None (o no es provisto), entonces se ejecuta una consulta sin argumentos (ej. SELECT * from <tabla>)
+
+    # Esta función retorna un array conteniendo todos los registros recuperados de la consulta, o None si hubo un error en la consulta
+
+    try:
+        instrumentada = instrumentacion.instrumentacion_activa
+        if instrumentada:
+            inicio = time.perf_counter()
+        cursor = conexion_bd.cursor()
+        consulta = None
+        if argumentos is None:
+            consulta = cursor.execute(consulta_sql)
+        else:
+            consulta = cursor.execute(consulta_sql, argumentos)
+        registros = consulta.fetchall()
+        if instrumentada:
+            instrumentacion.instrumentacion_registrar(conexion_bd, consulta_sql, argumentos, time.perf_counter() - inicio, len(registros))
+        if eventos.rastreo_sql_activo:
+            registrar_evento("Se ejecutó correctamente la siguiente consulta: {}", consulta_sql, nivel=eventos.DEPURACION)
+        return registros
+    except sqlite3.Error as err:
+        metricas.metricas_incrementar("gemprop_errores_de_base_de_datos_total")
+        registrar_evento("Error ejecutando la siguiente consulta SQL: [{}]\nError: [{}]", consulta_sql, err.args[0], nivel=ERROR)
+    
+    return None
+
+def iterar_consulta_sql(conexion_bd, consulta_sql, argumentos=None, tamaño_de_bloque=1000):
+    # Ejecuta la consulta y retorna un generador que entrega sus registros de a uno, leyéndolos del cursor en bloques
+    # con fetchmany(), de forma que nunca se materializa el resultado completo. Retorna None si la consulta no pudo ejecutarse.
+    # Un error durante la lectura de los bloques se registra y se propaga como sqlite3.Error al que itera el generador.
+    # Con la instrumentación habilitada, la duración medida es la de la ejecución y la lectura de los bloques, sin el
+    # tiempo que el invocante procesa los registros, y se registra al terminar la iteración.
+    instrumentada = instrumentacion.instrumentacion_activa
+    if instrumentada:
+        invocante = sys._getframe(1).f_code.co_name
+        inicio = time.perf_counter()
+    try:
+        cursor = conexion_bd.cursor()
+        if argumentos is None:
+            cursor.execute(consulta_sql)
+        else:
+            cursor.execute(consulta_sql, argumentos)
+        if instrumentada:
+            segundos = time.perf_counter() - inicio
+        if eventos.rastreo_sql_activo:
+            registrar_evento("Se ejecutó correctamente la siguiente consulta: {}", consulta_sql, nivel=eventos.DEPURACION)
+    except sqlite3.Error as err:
+        metricas.metricas_incrementar("gemprop_errores_de_base_de_datos_total")
+        registrar_evento("Error ejecutando la siguiente consulta SQL: [{}]\nError: [{}]", consulta_sql, err.args[0], nivel=ERROR)
+        return None
+
+    def registros():
+        nonlocal segundos
+        filas = 0
+        try:
+            while True:
+                if instrumentada:
+                    inicio_bloque = time.perf_counter()
+                    bloque = cursor.fetchmany(tamaño_de_bloque)
+                    segundos += time.perf_counter() - inicio_bloque
+                    filas += len(bloque)
+                else:
+                    bloque = cursor.fetchmany(tamaño_de_bloque)
+                if not bloque:
+                    break
+                yield from bloque
+            if instrumentada:
+                instrumentacion.instrumentacion_registrar(conexion_bd, consulta_sql, argumentos, segundos, filas, invocante)
+        except sqlite3.Error as err:
+            metricas.metricas_incrementar("gemprop_errores_de_base_de_datos_total")
+            registrar_evento("Error leyendo los registros de la siguiente consulta SQL: [{}]\nError: [{}]", consulta_sql, err.args[0], nivel=ERROR)
+            raise
+        finally:
+            cursor.close()
+
+    return registros()
+
+def ejecutar_sentencia_sql(conexion_bd, sentencia_sql, argumentos=None):
+    # Esta función ejecuta cualquier sentencia SQL recibida que requiera un commit(), por ejemplo un INSERT, UPDATE o DELETE.
+    # Si 'argumentos' == None (o no es provisto) se intenta ejecutar solamente la sentencia SQL recibida, cuyos parámetros si los tiene debe enstar hardcodeados (por ejemplo DELETE FROM materiales WHERE id = 5)
+
+    try:
+        instrumentada = instrumentacion.instrumentacion_activa
+        if instrumentada:
+            inicio = time.perf_counter()
+        cursor = conexion_bd.cursor()
+        if argumentos is None:
+            cursor.execute(sentencia_sql)
+        else:
+            cursor.execute(sentencia_sql, argumentos)
+        conexion_bd.commit()
+
+        filas_afectadas = cursor.rowcount
+        if instrumentada:
+            instrumentacion.instrumentacion_registrar(conexion_bd, sentencia_sql, argumentos, time.perf_counter() - inicio, filas_afectadas)
+        if eventos.rastreo_sql_activo:
+            registrar_evento("Se ejecutó la siguiente sentencia: [{}].\nSe modificaron {} fila(s).", sentencia_sql, filas_afectadas, nivel=eventos.DEPURACION)
+        return filas_afectadas
+    except sqlite3.Error as err:
+        metricas.metricas_incrementar("gemprop_errores_de_base_de_datos_total")
+        registrar_evento("Error ejecutando la siguiente sentencia SQL: [{}]\nError: [{}]", sentencia_sql, err.args[0], nivel=ERROR)
+    
+    return None
+
+def ejecutar_sentencia_multiple_sql(conexion_bd, sentencia_sql, lista_de_argumentos):
+    # Ejecuta la misma sentencia SQL una vez por cada tupla de 'lista_de_argumentos' (executemany), dentro de una única
+    # transacción y con un solo commit(). Si alguna ejecución falla se deshacen todas (rollback), de forma que la base de
+    # datos nunca queda con una parte de las modificaciones aplicadas.
+
+    # Esta función retorna la cantidad total de filas afectadas, o None si hubo un error y se deshizo la transacción
+
+    try:
+        instrumentada = instrumentacion.instrumentacion_activa
+        if instrumentada:
+            inicio = time.perf_counter()
+        cursor = conexion_bd.cursor()
+        cursor.executemany(sentencia_sql, lista_de_argumentos)
+        conexion_bd.commit()
+
+        filas_afectadas = cursor.rowcount
+        if instrumentada:
+            # Sin argumentos: si la sentencia tiene parámetros, una ejecución lenta se registra sin plan
+            instrumentacion.instrumentacion_registrar(conexion_bd, sentencia_sql, None, time.perf_counter() - inicio, filas_afectadas)
+        if eventos.rastreo_sql_activo:
+            registrar_evento("Se ejecutó la siguiente sentencia en una única transacción: [{}].\nSe modificaron {} fila(s).", sentencia_sql, filas_afectadas, nivel=eventos.DEPURACION)
+        return filas_afectadas
+    except sqlite3.Error as err:
+        conexion_bd.rollback()
+        metricas.metricas_incrementar("gemprop_errores_de_base_de_datos_total")
+        registrar_evento("Error ejecutando la siguiente sentencia SQL, se deshicieron todos los cambios: [{}]\nError: [{}]", sentencia_sql, err.args[0], nivel=ERROR)
+
+    return None
+
+def cambios_externos(conexion_bd, sincronizacion):
+    # Retorna los registros que otras conexiones (de este u otro proceso) modificaron desde la última vez que la memoria
+    # dueña de 'sincronizacion' hizo esta verificación, según el registro de cambios (ver la migración 9 en esquema.py):
+    # un diccionario {tabla: {ids}}, vacío o None si no hubo cambios, o False si no pueden determinarse y la memoria debe
+    # descartarse completa. 'sincronizacion' es un diccionario que la memoria guarda junto con sus datos, con la última
+    # 'PRAGMA data_version' y el último cambio vistos; la primera verificación solo los registra, por lo que debe hacerse
+    # antes de cargar la memoria. 'PRAGMA data_version' no cambia con los commits de la propia conexión, por lo que las
+    # memorias deben actualizar por su cuenta los cambios hechos a través del motor.
+    # En una base sin registro de cambios (anterior a la versión 9 del esquema) todo cambio externo retorna False.
+    try:
+        version_actual = conexion_bd.execute("PRAGMA data_version").fetchone()[0]
+        if "version" not in sincronizacion:
+            registrados = conexion_bd.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'registro_de_cambios'").fetchone()
+            sincronizacion["ultimo_cambio"] = conexion_bd.execute("SELECT COALESCE(MAX(id), 0) FROM registro_de_cambios").fetchone()[0] if registrados else None
+            sincronizacion["version"] = version_actual
+            return None
+        if sincronizacion["version"] == version_actual:
+            return None
+        sincronizacion["version"] = version_actual
+        if sincronizacion["ultimo_cambio"] is None:
+            return False
+        registros = conexion_bd.execute("SELECT id, tabla, id_registro FROM registro_de_cambios WHERE id > ? ORDER BY id", (sincronizacion["ultimo_cambio"],)).fetchall()
+    except sqlite3.Error as err:
+        metricas.metricas_incrementar("gemprop_errores_de_base_de_datos_total")
+        registrar_evento("No se pudieron leer los cambios de otras conexiones\nError: [{}]", err.args[0], nivel=ERROR)
+        sincronizacion.clear()
+        return False
+
+    if not registros:
+        return {}
+    primer_cambio = registros[0][0]
+    ultimo_cambio = sincronizacion["ultimo_cambio"]
+    sincronizacion["ultimo_cambio"] = registros[-1][0]
+    if primer_cambio != ultimo_cambio + 1:      # Los cambios intermedios ya fueron depurados
+        return False
+
+    cambios = {}
+    for id_cambio, tabla, id_registro in registros:
+        cambios.setdefault(tabla, set()).add(id_registro)
+    return cambios
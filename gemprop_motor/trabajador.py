@@ -0,0 +1,236 @@
+"""
+Trabajador de base de datos en segundo plano
+
+Un hilo dedicado abre su propia conexión a la base de datos y ejecuta, en orden, los trabajos que
+recibe por una cola. Un trabajo es una función del motor (o cualquier función que reciba la conexión
+como primer argumento) junto con sus argumentos. El resultado no se entrega desde el hilo del
+trabajador: se agrega a una cola de resultados que el cliente vacía desde su propio hilo con
+trabajador_entregar_resultados(), por ejemplo desde un 'after' periódico de tkinter. De esta forma
+una base de datos bloqueada o un disco lento nunca detienen el ciclo de eventos de la ventana.
+
+Cada vez que se despierta, el trabajador toma todos los trabajos pendientes como un lote:
+- los trabajos con la misma clave de agrupamiento se ejecutan una sola vez (el último encolado) y su
+  resultado se entrega a todos ellos. Las lecturas se agrupan por función y argumentos; una escritura
+  solo se agrupa si se le asigna una clave en forma explícita (por ejemplo una reposición de stock
+  pedida varias veces seguidas).
+- las lecturas consecutivas se ejecutan juntas. Si el perfil de conexión define lectores, el trabajador
+  mantiene un grupo de conexiones de solo lectura y las lecturas consecutivas se ejecutan en paralelo,
+  una por conexión; si no, se ejecutan en la conexión del escritor dentro de una misma transacción de
+  lectura, por lo que ven una misma versión de la base de datos y adquieren el bloqueo una sola vez.
+  En ambos casos las escrituras se ejecutan de a una, en la conexión del escritor, y una lectura
+  nunca comienza antes de que termine la escritura encolada antes que ella.
+
+Las funciones de preparación que recibe crear_trabajador() se ejecutan en segundo plano en cada conexión
+que atiende lecturas, antes de su primera lectura (por ejemplo, para construir los índices de búsqueda
+en la misma conexión que luego responde las búsquedas).
+"""
+
+import queue                        # Colas de trabajos y de resultados
+import sqlite3                      # Gestión de errores accediendo a la base de datos
+import threading                    # Hilo del trabajador
+import time                         # Duración de los trabajos, si las métricas están habilitadas
+import traceback                    # Detalle de las excepciones de los trabajos
+
+from gemprop_motor import metricas
+from gemprop_motor.eventos import registrar_evento, ERROR
+from gemprop_motor.sql import abrir_base_de_datos, PERFILES_DE_CONEXION
+
+
+def crear_trabajador(nombre_base_de_datos, perfil="predeterminado", preparar_lecturas=()):
+    # Crea el trabajador e inicia su hilo, que abre su propia conexión (la del escritor) a la base de datos indicada,
+    # junto con las conexiones de solo lectura que indique el perfil. 'preparar_lecturas' son funciones que reciben una
+    # conexión y se ejecutan en cada conexión que atiende lecturas antes de su primera lectura.
+    # Retorna el diccionario del trabajador, o None si no pudo abrirse la base de datos.
+    cantidad_de_lectores = PERFILES_DE_CONEXION[perfil]["lectores"]
+    trabajador = {
+        "nombre_base_de_datos": nombre_base_de_datos,
+        "perfil": perfil,
+        "preparar_escritor": preparar_lecturas if cantidad_de_lectores == 0 else (),
+        "trabajos": queue.Queue(),
+        "resultados": queue.Queue(),
+        "pendientes": 0,            # Trabajos encolados cuyo resultado todavía no se entregó
+        "conexion_bd": None,
+        "lectores": None,           # Conexiones de solo lectura libres (si el perfil define lectores)
+        "ejecutor_lectores": None,
+        "hilo": None
+    }
+    conexion_abierta = threading.Event()
+    trabajador["hilo"] = threading.Thread(target=_atender_trabajos, args=(trabajador, conexion_abierta), name="gemprop-base-de-datos", daemon=True)
+    trabajador["hilo"].start()
+
+    conexion_abierta.wait()
+    if trabajador["conexion_bd"] is None:
+        return None
+
+    if cantidad_de_lectores > 0:
+        trabajador["lectores"] = queue.Queue()
+        conexiones_lectores = []
+        for _ in range(cantidad_de_lectores):
+            conexion_lector = abrir_base_de_datos(nombre_base_de_datos, perfil, solo_lectura=True, entre_hilos=True)
+            if conexion_lector is None:
+                for conexion in conexiones_lectores:
+                    conexion.close()
+                trabajador_detener(trabajador)
+                return None
+            conexiones_lectores.append(conexion_lector)
+        from concurrent.futures import ThreadPoolExecutor     # Hilos de los lectores; se importa solo si el perfil los define
+        trabajador["ejecutor_lectores"] = ThreadPoolExecutor(max_workers=cantidad_de_lectores, thread_name_prefix="gemprop-lector")
+        # Cada lector se agrega al grupo recién después de prepararse: las lecturas encoladas mientras tanto lo esperan
+        for conexion_lector in conexiones_lectores:
+            trabajador["ejecutor_lectores"].submit(_preparar_lector, trabajador, conexion_lector, preparar_lecturas)
+    return trabajador
+
+def trabajador_encolar(trabajador, funcion, *argumentos, al_terminar=None, lectura=False, clave=None):
+    # Encola la ejecución de funcion(conexion_bd, *argumentos) en el hilo del trabajador.
+    # 'al_terminar' recibe el resultado de la función (None si lanzó una excepción) y se invoca desde trabajador_entregar_resultados().
+    # 'lectura' indica que la función no modifica la base de datos; 'clave' permite agrupar escrituras equivalentes.
+    if clave is None and lectura:
+        try:
+            clave = (funcion, argumentos)
+            hash(clave)
+        except TypeError:       # Argumentos mutables (por ejemplo una lista): la lectura no se agrupa
+            clave = None
+    trabajador["pendientes"] += 1
+    trabajador["trabajos"].put((funcion, argumentos, al_terminar, lectura, clave))
+
+def trabajador_entregar_resultados(trabajador):
+    # Invoca el 'al_terminar' de los trabajos ya ejecutados. Debe llamarse desde el hilo del cliente (el de tkinter).
+    # Retorna la cantidad de trabajos que siguen pendientes.
+    while True:
+        try:
+            al_terminar, resultado = trabajador["resultados"].get_nowait()
+        except queue.Empty:
+            break
+        trabajador["pendientes"] -= 1
+        if al_terminar is not None:
+            al_terminar(resultado)
+
+    return trabajador["pendientes"]
+
+def trabajador_detener(trabajador):
+    # Ejecuta los trabajos ya encolados, cierra las conexiones del trabajador y espera a que finalicen sus hilos
+    trabajador["trabajos"].put(None)
+    trabajador["hilo"].join()
+    if trabajador["ejecutor_lectores"] is not None:
+        trabajador["ejecutor_lectores"].shutdown()
+    if trabajador["lectores"] is not None:
+        while not trabajador["lectores"].empty():
+            trabajador["lectores"].get_nowait().close()
+
+def _atender_trabajos(trabajador, conexion_abierta):
+    # Ciclo del hilo del trabajador: abre la conexión y ejecuta los lotes de trabajos hasta recibir None
+    trabajador["conexion_bd"] = abrir_base_de_datos(trabajador["nombre_base_de_datos"], trabajador["perfil"])
+    conexion_abierta.set()
+    if trabajador["conexion_bd"] is None:
+        return
+    for funcion in trabajador["preparar_escritor"]:
+        _ejecutar_trabajo(trabajador["conexion_bd"], funcion, ())
+
+    finalizar = False
+    while not finalizar:
+        lote = [trabajador["trabajos"].get()]
+        while True:
+            try:
+                lote.append(trabajador["trabajos"].get_nowait())
+            except queue.Empty:
+                break
+        if None in lote:
+            finalizar = True
+            lote = [trabajo for trabajo in lote if trabajo is not None]
+        _ejecutar_lote(trabajador, lote)
+
+    trabajador["conexion_bd"].close()
+
+def _ejecutar_lote(trabajador, lote):
+    # Los trabajos con la misma clave se ejecutan una sola vez, en la posición del último de ellos, y su resultado se
+    # entrega a todos. Las lecturas consecutivas se ejecutan juntas (ver _ejecutar_lecturas).
+    ultimo_por_clave = {}
+    destinatarios_por_clave = {}
+    for posicion, (funcion, argumentos, al_terminar, lectura, clave) in enumerate(lote):
+        if clave is not None:
+            ultimo_por_clave[clave] = posicion
+            destinatarios_por_clave.setdefault(clave, []).append(al_terminar)
+
+    lecturas = []           # Lecturas consecutivas pendientes de ejecutar: (funcion, argumentos, destinatarios)
+    for posicion, (funcion, argumentos, al_terminar, lectura, clave) in enumerate(lote):
+        if clave is None:
+            destinatarios = [al_terminar]
+        elif ultimo_por_clave[clave] == posicion:
+            destinatarios = destinatarios_por_clave[clave]
+        else:
+            continue
+
+        if lectura:
+            lecturas.append((funcion, argumentos, destinatarios))
+            continue
+        if lecturas:
+            _ejecutar_lecturas(trabajador, lecturas)
+            lecturas = []
+        _entregar(trabajador, destinatarios, _ejecutar_trabajo(trabajador["conexion_bd"], funcion, argumentos))
+
+    if lecturas:
+        _ejecutar_lecturas(trabajador, lecturas)
+
+def _ejecutar_lecturas(trabajador, lecturas):
+    # Ejecuta un grupo de lecturas consecutivas: en paralelo en las conexiones de solo lectura si las hay, o si no
+    # en la conexión del escritor, dentro de una única transacción de lectura
+    if trabajador["ejecutor_lectores"] is not None:
+        futuros = [trabajador["ejecutor_lectores"].submit(_ejecutar_en_lector, trabajador, funcion, argumentos) for funcion, argumentos, destinatarios in lecturas]
+        for futuro, (funcion, argumentos, destinatarios) in zip(futuros, lecturas):
+            _entregar(trabajador, destinatarios, futuro.result())
+        return
+
+    conexion_bd = trabajador["conexion_bd"]
+    en_transaccion = not conexion_bd.in_transaction and _iniciar_transaccion_de_lectura(conexion_bd)
+    for funcion, argumentos, destinatarios in lecturas:
+        _entregar(trabajador, destinatarios, _ejecutar_trabajo(conexion_bd, funcion, argumentos))
+    if en_transaccion:
+        conexion_bd.commit()
+
+def _preparar_lector(trabajador, conexion_lector, preparar_lecturas):
+    # Ejecuta las funciones de preparación en una conexión de solo lectura y la agrega al grupo de lectores libres
+    try:
+        for funcion in preparar_lecturas:
+            _ejecutar_trabajo(conexion_lector, funcion, ())
+    finally:
+        trabajador["lectores"].put(conexion_lector)
+
+def _ejecutar_en_lector(trabajador, funcion, argumentos):
+    # Toma una conexión de solo lectura libre, ejecuta la lectura y devuelve la conexión al grupo
+    conexion_lector = trabajador["lectores"].get()
+    try:
+        return _ejecutar_trabajo(conexion_lector, funcion, argumentos)
+    finally:
+        trabajador["lectores"].put(conexion_lector)
+
+def _entregar(trabajador, destinatarios, resultado):
+    # Deja el resultado de un trabajo en la cola de resultados, una vez por cada destinatario
+    for destinatario in destinatarios:
+        trabajador["resultados"].put((destinatario, resultado))
+
+def _iniciar_transaccion_de_lectura(conexion_bd):
+    # Abre una transacción diferida: el bloqueo de lectura se adquiere con la primera consulta y se mantiene hasta el commit()
+    try:
+        conexion_bd.execute("BEGIN")
+        return True
+    except sqlite3.Error as err:
+        metricas.metricas_incrementar("gemprop_errores_de_base_de_datos_total")
+        registrar_evento("No se pudo iniciar la transacción de lectura del trabajador\nError: [{}]", err.args[0], nivel=ERROR)
+
+    return False
+
+def _ejecutar_trabajo(conexion_bd, funcion, argumentos):
+    # Ejecuta un trabajo. Una excepción no debe detener al trabajador: se registra y el resultado del trabajo es None.
+    # Si las métricas están habilitadas, la duración del trabajo se registra en el histograma de acciones.
+    medir = metricas.metricas_activas
+    if medir:
+        inicio = time.perf_counter()
+    try:
+        return funcion(conexion_bd, *argumentos)
+    except Exception:
+        registrar_evento("Error ejecutando el trabajo [{}] en segundo plano\n{}", getattr(funcion, "__name__", funcion), traceback.format_exc(), nivel=ERROR)
+    finally:
+        if medir:
+            metricas.metricas_observar("gemprop_acciones_duracion_segundos", time.perf_counter() - inicio, funcion=getattr(funcion, "__name__", str(funcion)))
+
+    return None
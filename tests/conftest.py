@@ -0,0 +1,44 @@
+"""
+Bases de datos compartidas por las pruebas del motor de GEMPROP
+
+Las pruebas se ejecutan sobre copias de base_demo/gemprop_demo.db o sobre bases sintéticas pequeñas
+creadas con el generador (ver generador.py), siempre en el directorio temporal de cada prueba, por lo
+que nunca modifican la base de demostración.
+
+Uso, desde el directorio del proyecto:
+    python -m pytest -q
+"""
+
+import pathlib                      # Ubicación de la base de demostración
+import shutil                       # Copia de la base de demostración
+
+import pytest
+
+import gemprop_motor as motor
+
+
+BASE_DEMO = pathlib.Path(__file__).resolve().parent.parent / "base_demo" / "gemprop_demo.db"
+
+
+@pytest.fixture
+def ruta_base_demo(tmp_path):
+    # Ruta de una copia de la base de demostración, con la versión 0 del esquema (anterior al versionado)
+    ruta = tmp_path / "gemprop_demo.db"
+    shutil.copyfile(BASE_DEMO, ruta)
+    return str(ruta)
+
+@pytest.fixture
+def ruta_base_generada(tmp_path):
+    # Ruta de una base sintética pequeña con BOM de tres niveles y stock escaso, para que haya pedidos con y sin demora
+    ruta = str(tmp_path / "generada.db")
+    resumen = motor.generar_base_de_datos(ruta, materiales=60, productos=20, materiales_por_producto=4, subproductos_por_producto=1,
+                                          niveles=3, distribucion_stock="escasa", stock_maximo=40, semilla=7)
+    assert resumen is not None
+    return ruta
+
+@pytest.fixture
+def conexion_bd(ruta_base_generada):
+    # Conexión a la base sintética, que se cierra al terminar la prueba
+    conexion_bd = motor.abrir_base_de_datos(ruta_base_generada)
+    yield conexion_bd
+    conexion_bd.close()
@@ -0,0 +1,57 @@
+"""
+Pruebas de la proyección ATP memorizada (ver atp.py)
+
+Las escrituras del motor actualizan la proyección memorizada de su conexión en el momento, sin volver a
+cargarla. Después de pedidos confirmados, emisiones y recepciones de órdenes de compra y ajustes manuales,
+debe coincidir con una proyección cargada de nuevo de la base de datos, y cotizar lo mismo.
+"""
+
+from datetime import date, timedelta
+
+import gemprop_motor as motor
+
+
+def resumir(atp):
+    # Movimientos netos de cada material por día (sin los días cuyos movimientos se compensaron) y tiempos de confección
+    materiales = {
+        id_material: (proyeccion["demora_reposicion"], {dia: movimiento for dia, movimiento in zip(proyeccion["dias"], proyeccion["movimientos"]) if dia == 0 or movimiento != 0})
+        for id_material, proyeccion in atp["materiales"].items()
+    }
+    return materiales, atp["tiempos_de_confeccion"]
+
+def verificar_proyeccion(conexion_bd, atp):
+    # La proyección memorizada sigue siendo la misma y coincide con una cargada de nuevo
+    assert motor.atp_proyeccion(conexion_bd) is atp
+    cargada = motor.atp_cargar(conexion_bd, atp["fecha_base"])
+    assert resumir(atp) == resumir(cargada)
+    for id_producto in atp["tiempos_de_confeccion"]:
+        assert motor.atp_cotizar(atp, id_producto, 3) == motor.atp_cotizar(cargada, id_producto, 3)
+
+def test_proyeccion_memorizada_coincide_con_la_cargada(conexion_bd):
+    atp = motor.atp_proyeccion(conexion_bd)
+    ids_productos = [registro[0] for registro in motor.productos_recuperar_productos(conexion_bd)]
+
+    # Pedidos confirmados, con y sin demora
+    for id_producto in ids_productos[:6]:
+        assert motor.pedidos_procesar_pedido_multiple(conexion_bd, [(id_producto, 2)])["confirmado"]
+    verificar_proyeccion(conexion_bd, atp)
+
+    # Órdenes de compra emitidas, que ingresan en la proyección el día de su entrega, y luego recibidas
+    hoy = date.today()
+    assert motor.pedidos_actualizar_stock(conexion_bd, hoy)["ordenes_emitidas"] > 0
+    assert any(len(proyeccion["dias"]) > 1 for proyeccion in atp["materiales"].values())
+    verificar_proyeccion(conexion_bd, atp)
+    assert motor.pedidos_actualizar_stock(conexion_bd, hoy + timedelta(days=60))["ordenes_recibidas"] > 0
+    verificar_proyeccion(conexion_bd, atp)
+
+    # Ajustes manuales del stock y de la demora de reposición, y del tiempo de confección
+    for registro in motor.materiales_buscar_materiales(conexion_bd, [1, 2, 3, 4]):
+        id_material, descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion = registro
+        assert motor.materiales_actualizar_registro_material(conexion_bd, id_material, descripcion, stock_actual + 11, stock_reposicion, demora_reposicion + 3, cantidad_reposicion)
+    assert motor.productos_actualizar_tiempo_confeccion(conexion_bd, ids_productos[0], 9)
+    verificar_proyeccion(conexion_bd, atp)
+
+    # Más pedidos sobre la proyección ya ajustada
+    for id_producto in ids_productos[6:12]:
+        assert motor.pedidos_procesar_pedido_multiple(conexion_bd, [(id_producto, 3)])["confirmado"]
+    verificar_proyeccion(conexion_bd, atp)
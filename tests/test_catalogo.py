@@ -0,0 +1,54 @@
+"""
+Pruebas de la sincronización del catálogo en memoria con otras conexiones (ver catalogo.py)
+
+Cuando otra conexión modifica materiales o productos, el catálogo de una conexión debe reflejar los
+cambios en su próxima lectura ('PRAGMA data_version' y registro de cambios, ver sql.cambios_externos)
+volviendo a leer solo los registros modificados, sin recargar el catálogo completo.
+"""
+
+import gemprop_motor as motor
+from gemprop_motor import catalogo
+
+
+def test_catalogo_refleja_los_cambios_de_otra_conexion(conexion_bd, ruta_base_generada):
+    # Catálogos e índices de búsqueda cargados en la primera conexión
+    assert motor.catalogo_preparar_busqueda(conexion_bd)
+    tablas = catalogo.catalogos_por_conexion[conexion_bd]["tablas"]
+    catalogo_materiales, catalogo_productos = tablas["materiales"], tablas["productos"]
+    indice_materiales = catalogo_materiales["indice_de_palabras"]
+    cantidad_de_materiales = len(motor.materiales_recuperar_materiales(conexion_bd))
+
+    otra_conexion = motor.abrir_base_de_datos(ruta_base_generada)
+    try:
+        # Actualización, alta y baja de materiales, y actualización y alta de productos desde la otra conexión
+        id_material, descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion = motor.materiales_buscar_material(otra_conexion, 1)[0]
+        assert motor.materiales_actualizar_registro_material(otra_conexion, id_material, "Tornillo renombrado", stock_actual + 5, stock_reposicion, demora_reposicion, cantidad_reposicion)
+        assert motor.materiales_insertar_registro_material(otra_conexion, "Arandela agregada", 3, 1, 2, 10)
+        id_agregado = motor.materiales_buscar_id_por_descripcion(otra_conexion, "Arandela agregada")
+        id_eliminado = otra_conexion.execute("SELECT MAX(id) FROM materiales WHERE id <> ? AND id NOT IN (SELECT id_material FROM materiales_por_producto)", (id_agregado,)).fetchone()[0]
+        assert id_eliminado in catalogo_materiales["registros"]
+        assert motor.materiales_eliminar_registro_material(otra_conexion, id_eliminado)
+        id_producto = motor.productos_recuperar_productos(otra_conexion)[0][0]
+        assert motor.productos_actualizar_tiempo_confeccion(otra_conexion, id_producto, 12)
+        assert motor.productos_insertar_registro_producto(otra_conexion, "Gabinete agregado", 4) is not None
+    finally:
+        otra_conexion.close()
+
+    # La primera conexión ve los cambios en su próxima lectura
+    assert motor.materiales_buscar_material(conexion_bd, id_material)[0] == (id_material, "Tornillo renombrado", stock_actual + 5, stock_reposicion, demora_reposicion, cantidad_reposicion)
+    assert motor.materiales_buscar_material(conexion_bd, id_eliminado) == []
+    assert motor.materiales_buscar_id_por_descripcion(conexion_bd, "Arandela agregada") == id_agregado
+    assert len(motor.materiales_recuperar_materiales(conexion_bd)) == cantidad_de_materiales
+    assert motor.productos_buscar_producto(conexion_bd, id_producto)[0][2] == 12
+
+    # Las búsquedas por texto usan el índice actualizado
+    assert [registro[0] for registro in motor.materiales_buscar_por_texto(conexion_bd, "tornillo ren")] == [id_material]
+    assert motor.materiales_buscar_por_texto(conexion_bd, descripcion) == []
+    assert [registro[0] for registro in motor.materiales_buscar_por_texto(conexion_bd, "arandela")] == [id_agregado]
+    assert [registro[1] for registro in motor.productos_buscar_por_texto(conexion_bd, "gabinete")] == ["Gabinete agregado"]
+
+    # Los catálogos y el índice de materiales no se volvieron a cargar: se actualizaron los registros modificados
+    tablas = catalogo.catalogos_por_conexion[conexion_bd]["tablas"]
+    assert tablas["materiales"] is catalogo_materiales
+    assert tablas["productos"] is catalogo_productos
+    assert catalogo_materiales["indice_de_palabras"] is indice_materiales
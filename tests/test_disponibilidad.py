@@ -0,0 +1,72 @@
+"""
+Pruebas de la cantidad fabricable memorizada (ver disponibilidad.py)
+
+Después de pedidos, recepciones de órdenes de compra, cambios del BOM y cambios de otra conexión, la
+cantidad fabricable de cada producto debe coincidir con la que resulta de la explosión de sus materiales
+y del stock leído de la base de datos en una conexión nueva, sin memorias previas.
+"""
+
+from datetime import date, timedelta
+
+import gemprop_motor as motor
+
+
+def verificar_disponibilidad(conexion_bd, ruta_base):
+    conexion_nueva = motor.abrir_base_de_datos(ruta_base)
+    try:
+        stock = dict(conexion_nueva.execute("SELECT id, stock_actual FROM materiales"))
+        esperados = []
+        for id_producto, descripcion, tiempo_confeccion in conexion_nueva.execute("SELECT id, descripcion, tiempo_confeccion FROM productos ORDER BY id").fetchall():
+            explosion = motor.explosion_de_materiales(conexion_nueva, id_producto)
+            cantidades = [max(stock[id_material], 0) // unidades for id_material, unidades in explosion.items() if unidades > 0]
+            esperados.append((id_producto, descripcion, tiempo_confeccion, min(cantidades) if cantidades else None))
+    finally:
+        conexion_nueva.close()
+
+    assert motor.disponibilidad_recuperar_productos(conexion_bd) == esperados
+    return esperados
+
+def test_disponibilidad_coincide_con_la_explosion_y_el_stock(conexion_bd, ruta_base_generada):
+    # Stock apenas superior al nivel de reposición, para que haya productos fabricables y los pedidos generen reposiciones
+    for registro in motor.materiales_recuperar_materiales(conexion_bd):
+        id_material, descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion = registro
+        assert motor.materiales_actualizar_registro_material(conexion_bd, id_material, descripcion, stock_reposicion + id_material % 7, stock_reposicion, demora_reposicion, cantidad_reposicion)
+    anterior = verificar_disponibilidad(conexion_bd, ruta_base_generada)
+    assert any(esperado[3] for esperado in anterior)
+    ids_productos = [registro[0] for registro in motor.productos_recuperar_productos(conexion_bd)]
+
+    # Pedido confirmado
+    assert motor.pedidos_procesar_pedido_multiple(conexion_bd, [(ids_productos[0], 2), (ids_productos[1], 1)])["confirmado"]
+    posterior = verificar_disponibilidad(conexion_bd, ruta_base_generada)
+    assert posterior != anterior
+
+    # Emisión y recepción de órdenes de compra
+    hoy = date.today()
+    assert motor.pedidos_actualizar_stock(conexion_bd, hoy)["ordenes_emitidas"] > 0
+    assert motor.pedidos_actualizar_stock(conexion_bd, hoy + timedelta(days=60))["ordenes_recibidas"] > 0
+    anterior, posterior = posterior, verificar_disponibilidad(conexion_bd, ruta_base_generada)
+    assert posterior != anterior
+
+    # Cambio del BOM de un subproducto, que modifica también la cantidad fabricable de los productos que lo usan
+    subproductos = {fila[0] for fila in conexion_bd.execute("SELECT id_subproducto FROM productos_por_producto WHERE id_subproducto IN (SELECT id_producto FROM materiales_por_producto)")}
+    id_subproducto = min(id_producto for id_producto, descripcion, tiempo_confeccion, cantidad in posterior if cantidad and id_producto in subproductos)
+    id_material = conexion_bd.execute("SELECT MIN(id_material) FROM materiales_por_producto WHERE id_producto = ?", (id_subproducto,)).fetchone()[0]
+    assert motor.productos_desasociar_material_del_producto(conexion_bd, id_subproducto, id_material)
+    assert motor.productos_asociar_material_a_producto(conexion_bd, id_subproducto, id_material, 1000)
+    anterior, posterior = posterior, verificar_disponibilidad(conexion_bd, ruta_base_generada)
+    assert posterior != anterior
+
+    # Cambios de stock desde otra conexión, y luego del BOM
+    otra_conexion = motor.abrir_base_de_datos(ruta_base_generada)
+    try:
+        for registro in motor.materiales_recuperar_materiales(otra_conexion):
+            id_otro_material, descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion = registro
+            assert motor.materiales_actualizar_registro_material(otra_conexion, id_otro_material, descripcion, stock_actual + 50, stock_reposicion, demora_reposicion, cantidad_reposicion)
+        anterior, posterior = posterior, verificar_disponibilidad(conexion_bd, ruta_base_generada)
+        assert posterior != anterior
+
+        assert motor.productos_desasociar_material_del_producto(otra_conexion, id_subproducto, id_material)
+        anterior, posterior = posterior, verificar_disponibilidad(conexion_bd, ruta_base_generada)
+        assert posterior != anterior
+    finally:
+        otra_conexion.close()
@@ -0,0 +1,114 @@
+"""
+Pruebas de las migraciones del esquema (ver esquema.py)
+"""
+
+import sqlite3
+
+import gemprop_motor as motor
+
+
+# Tablas de la versión 0 del esquema, tal como las creaba la aplicación antes de versionarlo
+TABLAS_VERSION_0 = [
+    "CREATE TABLE materiales (id integer PRIMARY KEY, descripcion text, stock_actual integer, stock_reposicion integer, demora_reposicion integer)",
+    "CREATE TABLE productos (id integer PRIMARY KEY, descripcion text)",
+    "CREATE TABLE materiales_por_producto (id_material integer, id_producto integer, cantidad_de_unidades integer)"
+]
+
+
+def leer_tablas(ruta):
+    # Contenido de las tablas de la versión 0 de la base indicada, leído sin pasar por el motor
+    conexion_bd = sqlite3.connect(ruta)
+    tablas = {
+        "materiales": conexion_bd.execute("SELECT id, descripcion, stock_actual, stock_reposicion, demora_reposicion FROM materiales ORDER BY id").fetchall(),
+        "productos": conexion_bd.execute("SELECT id, descripcion FROM productos ORDER BY id").fetchall(),
+        "materiales_por_producto": conexion_bd.execute("SELECT id_producto, id_material, cantidad_de_unidades FROM materiales_por_producto").fetchall()
+    }
+    conexion_bd.close()
+    return tablas
+
+def test_migrar_base_demo_a_la_ultima_version(ruta_base_demo):
+    anteriores = leer_tablas(ruta_base_demo)
+    conexion_bd = motor.abrir_base_de_datos(ruta_base_demo)
+    assert motor.obtener_version_esquema(conexion_bd) == 0
+
+    assert motor.actualizar_esquema(conexion_bd)
+    assert motor.obtener_version_esquema(conexion_bd) == motor.VERSION_ESQUEMA
+    assert conexion_bd.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    assert conexion_bd.execute("PRAGMA foreign_key_check").fetchall() == []
+
+    # Los materiales y productos se conservan con sus ids, y toman los valores por defecto de las columnas nuevas
+    materiales = conexion_bd.execute("SELECT id, descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion FROM materiales ORDER BY id").fetchall()
+    assert [material[:5] for material in materiales] == anteriores["materiales"]
+    assert {material[5] for material in materiales} == {motor.CANTIDAD_REPOSICION_PREDETERMINADA}
+    productos = conexion_bd.execute("SELECT id, descripcion, tiempo_confeccion FROM productos ORDER BY id").fetchall()
+    assert productos == [producto + (0,) for producto in anteriores["productos"]]
+
+    # Las asociaciones repetidas se unifican con la mayor cantidad y se descartan las de materiales o productos inexistentes
+    ids_materiales = {material[0] for material in anteriores["materiales"]}
+    ids_productos = {producto[0] for producto in anteriores["productos"]}
+    esperadas = {}
+    for id_producto, id_material, cantidad in anteriores["materiales_por_producto"]:
+        if id_producto in ids_productos and id_material in ids_materiales:
+            esperadas[(id_producto, id_material)] = max(cantidad, esperadas.get((id_producto, id_material), cantidad))
+    asociaciones = conexion_bd.execute("SELECT id_producto, id_material, cantidad_de_unidades FROM materiales_por_producto").fetchall()
+    assert {(id_producto, id_material): cantidad for id_producto, id_material, cantidad in asociaciones} == esperadas
+
+    # La cola de reposición y las instantáneas iniciales del libro de stock se crean a partir de los materiales existentes
+    cola = {fila[0] for fila in conexion_bd.execute("SELECT id_material FROM cola_de_reposicion")}
+    assert cola == {material[0] for material in materiales if material[2] < material[3]}
+    instantaneas = conexion_bd.execute("SELECT id_material, stock FROM instantaneas_de_stock ORDER BY id_material").fetchall()
+    assert instantaneas == [(material[0], material[2]) for material in materiales]
+    assert conexion_bd.execute("SELECT COUNT(*) FROM registro_de_cambios").fetchone()[0] == 0
+
+    # Una base actualizada no vuelve a migrarse
+    assert motor.actualizar_esquema(conexion_bd)
+    assert motor.obtener_version_esquema(conexion_bd) == motor.VERSION_ESQUEMA
+    conexion_bd.close()
+
+def test_migrar_descripciones_repetidas(tmp_path):
+    # Las bases anteriores al versionado admitían descripciones repetidas, que no deben impedir crear los índices únicos
+    ruta = str(tmp_path / "repetidas.db")
+    conexion_bd = sqlite3.connect(ruta)
+    for sentencia in TABLAS_VERSION_0:
+        conexion_bd.execute(sentencia)
+    conexion_bd.executemany("INSERT INTO materiales VALUES (?, ?, ?, ?, ?)",
+                            [(1, "Tornillo", 10, 2, 1), (2, "Tornillo", 5, 2, 1), (3, "Tornillo (id 2)", 5, 2, 1), (4, "Tuerca", 8, 2, 1)])
+    conexion_bd.executemany("INSERT INTO productos VALUES (?, ?)", [(1, "Mesa"), (2, "Mesa"), (3, "Silla")])
+    conexion_bd.executemany("INSERT INTO materiales_por_producto VALUES (?, ?, ?)", [(1, 1, 4), (2, 2, 6), (2, 2, 3), (4, 3, 2), (99, 3, 1)])
+    conexion_bd.commit()
+    conexion_bd.close()
+
+    conexion_bd = motor.abrir_base_de_datos(ruta)
+    assert motor.actualizar_esquema(conexion_bd)
+    assert motor.obtener_version_esquema(conexion_bd) == motor.VERSION_ESQUEMA
+
+    # Se conserva la descripción del registro de menor id y los demás se renombran con su id, sin repetir una descripción existente
+    assert conexion_bd.execute("SELECT id, descripcion FROM materiales ORDER BY id").fetchall() == [
+        (1, "Tornillo"), (2, "Tornillo (id 2-2)"), (3, "Tornillo (id 2)"), (4, "Tuerca")
+    ]
+    assert conexion_bd.execute("SELECT id, descripcion FROM productos ORDER BY id").fetchall() == [(1, "Mesa"), (2, "Mesa (id 2)"), (3, "Silla")]
+
+    # Los ids no cambian, por lo que el BOM sigue apuntando a los mismos registros
+    assert conexion_bd.execute("SELECT id_producto, id_material, cantidad_de_unidades FROM materiales_por_producto ORDER BY id_producto, id_material").fetchall() == [
+        (1, 1, 4), (2, 2, 6), (3, 4, 2)
+    ]
+    assert motor.materiales_existe_descripcion(conexion_bd, "Tornillo")
+    conexion_bd.close()
+
+def test_crear_base_nueva(tmp_path):
+    conexion_bd = motor.abrir_base_de_datos(str(tmp_path / "nueva.db"))
+    assert motor.actualizar_esquema(conexion_bd)
+    assert motor.obtener_version_esquema(conexion_bd) == motor.VERSION_ESQUEMA
+    assert motor.materiales_insertar_registro_material(conexion_bd, "Tornillo", 0, 5, 2, 10)
+    assert motor.reposicion_recuperar_cola(conexion_bd)[0][0] == motor.materiales_buscar_id_por_descripcion(conexion_bd, "Tornillo")
+    conexion_bd.close()
+
+def test_version_posterior_no_se_modifica(tmp_path):
+    ruta = str(tmp_path / "posterior.db")
+    conexion_bd = motor.abrir_base_de_datos(ruta)
+    conexion_bd.execute(f"PRAGMA user_version = {motor.VERSION_ESQUEMA + 1}")
+
+    assert not motor.actualizar_esquema(conexion_bd)
+    assert motor.obtener_version_esquema(conexion_bd) == motor.VERSION_ESQUEMA + 1
+    assert conexion_bd.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0
+    conexion_bd.close()
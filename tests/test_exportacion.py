@@ -0,0 +1,59 @@
+"""
+Pruebas de ida y vuelta entre la exportación y la importación (ver exportacion.py e importacion.py)
+
+Los reportes de materiales y de materiales por producto exportados de una base deben poder importarse en
+una base nueva (con los mismos productos) y volver a exportarse sin diferencias.
+"""
+
+import pytest
+
+import gemprop_motor as motor
+
+
+def leer_archivo(ruta):
+    with open(ruta, encoding="utf-8") as archivo:
+        return archivo.read()
+
+@pytest.mark.parametrize("formato", ["csv", "jsonl"])
+def test_exportar_importar_y_volver_a_exportar(conexion_bd, tmp_path, formato):
+    ruta_materiales = str(tmp_path / f"materiales.{formato}")
+    ruta_bom = str(tmp_path / f"bom.{formato}")
+    cantidad_de_materiales = motor.exportar_reporte(conexion_bd, "materiales", ruta_materiales)
+    cantidad_de_asociaciones = motor.exportar_reporte(conexion_bd, "bom", ruta_bom)
+    assert cantidad_de_materiales == conexion_bd.execute("SELECT COUNT(*) FROM materiales").fetchone()[0]
+    assert cantidad_de_asociaciones == conexion_bd.execute("SELECT COUNT(*) FROM materiales_por_producto").fetchone()[0]
+
+    # Base nueva con los mismos productos (la importación no da de alta productos)
+    conexion_nueva = motor.abrir_base_de_datos(str(tmp_path / "importada.db"))
+    assert motor.actualizar_esquema(conexion_nueva)
+    for id_producto, descripcion, tiempo_confeccion in motor.productos_recuperar_productos(conexion_bd):
+        assert motor.productos_insertar_registro_producto(conexion_nueva, descripcion, tiempo_confeccion) is not None
+
+    # La columna id de los materiales se ignora al importar: los ids los asigna la base nueva, en el orden del archivo
+    resumen = motor.importar_materiales(conexion_nueva, ruta_materiales, tamaño_de_lote=7)
+    assert (resumen["importadas"], resumen["rechazadas"]) == (cantidad_de_materiales, 0)
+    resumen = motor.importar_materiales_por_producto(conexion_nueva, ruta_bom, tamaño_de_lote=7)
+    assert (resumen["importadas"], resumen["rechazadas"]) == (cantidad_de_asociaciones, 0)
+
+    for reporte, ruta in (("materiales", ruta_materiales), ("bom", ruta_bom)):
+        ruta_reexportada = str(tmp_path / f"{reporte}_reexportado.{formato}")
+        assert motor.exportar_reporte(conexion_nueva, reporte, ruta_reexportada) is not None
+        assert leer_archivo(ruta_reexportada) == leer_archivo(ruta)
+
+    # Los materiales asociados a cada producto coinciden con los de la base original
+    for id_producto, descripcion, tiempo_confeccion in motor.productos_recuperar_productos(conexion_bd):
+        id_importado = motor.productos_buscar_id_por_descripcion(conexion_nueva, descripcion)
+        assert [registro[1:] for registro in motor.productos_recuperar_materiales_asociados(conexion_nueva, id_importado)] == \
+            [registro[1:] for registro in motor.productos_recuperar_materiales_asociados(conexion_bd, id_producto)]
+    conexion_nueva.close()
+
+def test_importar_dos_veces_rechaza_los_materiales_existentes(conexion_bd, tmp_path):
+    ruta_materiales = str(tmp_path / "materiales.csv")
+    ruta_rechazos = str(tmp_path / "rechazos.csv")
+    cantidad_de_materiales = motor.exportar_reporte(conexion_bd, "materiales", ruta_materiales)
+    anteriores = motor.materiales_recuperar_materiales(conexion_bd)
+
+    resumen = motor.importar_materiales(conexion_bd, ruta_materiales, ruta_rechazos=ruta_rechazos)
+    assert (resumen["importadas"], resumen["rechazadas"]) == (0, cantidad_de_materiales)
+    assert motor.materiales_recuperar_materiales(conexion_bd) == anteriores
+    assert len(leer_archivo(ruta_rechazos).splitlines()) == cantidad_de_materiales + 1
@@ -0,0 +1,36 @@
+"""
+Pruebas de los errores del generador de bases de datos sintéticas (ver generador.py)
+
+Parámetros inválidos no deben crear la base de datos, y una generación que falla no debe dejar una base
+incompleta que luego se reutilice (ver rendimiento.py).
+"""
+
+import os
+
+import gemprop_motor as motor
+from gemprop_motor import generador
+
+
+def test_stock_maximo_debe_ser_mayor_a_cero(tmp_path):
+    ruta = str(tmp_path / "sin_stock.db")
+    for stock_maximo in (0, -5):
+        assert motor.generar_base_de_datos(ruta, materiales=10, productos=5, distribucion_stock="escasa", stock_maximo=stock_maximo) is None
+        assert not os.path.exists(ruta)
+
+def test_generacion_fallida_elimina_la_base(tmp_path, monkeypatch):
+    ruta = str(tmp_path / "fallida.db")
+    ejecutar = generador.ejecutar_sentencia_multiple_sql
+
+    # El alta de los subproductos falla, después de dar de alta materiales, productos y BOM
+    def ejecutar_con_error(conexion_bd, sentencia, registros):
+        if "productos_por_producto" in sentencia:
+            return None
+        return ejecutar(conexion_bd, sentencia, registros)
+
+    monkeypatch.setattr(generador, "ejecutar_sentencia_multiple_sql", ejecutar_con_error)
+    assert motor.generar_base_de_datos(ruta, materiales=10, productos=6, niveles=2) is None
+    assert os.listdir(tmp_path) == []
+
+    # Sin el error, la misma ruta puede generarse
+    monkeypatch.setattr(generador, "ejecutar_sentencia_multiple_sql", ejecutar)
+    assert motor.generar_base_de_datos(ruta, materiales=10, productos=6, niveles=2)["materiales"] == 10
@@ -0,0 +1,39 @@
+"""
+Pruebas de la habilitación de las métricas (ver metricas.py)
+
+Habilitar las métricas más de una vez (por ejemplo desde la vista y desde el servidor de métricas) no
+debe registrar dos veces cada sentencia SQL, y deshabilitarlas debe deshabilitar la instrumentación que
+habilitaron.
+"""
+
+import gemprop_motor as motor
+from gemprop_motor import instrumentacion, metricas
+
+
+def test_habilitar_dos_veces_observa_cada_sentencia_una_vez(conexion_bd):
+    assert not instrumentacion.instrumentacion_activa
+    motor.metricas_reiniciar()
+    try:
+        motor.metricas_habilitar()
+        motor.metricas_habilitar()
+        assert instrumentacion.observadores.count(metricas._observar_sentencia) == 1
+
+        motor.ejecutar_consulta_sql(conexion_bd, "SELECT COUNT(*) FROM materiales")
+        cantidades = [histograma[2] for (nombre, etiquetas), histograma in metricas.histogramas.items() if nombre == "gemprop_sql_duracion_segundos"]
+        assert cantidades == [1]
+    finally:
+        motor.metricas_habilitar(False)
+        motor.metricas_reiniciar()
+
+    assert not instrumentacion.instrumentacion_activa
+    assert metricas._observar_sentencia not in instrumentacion.observadores
+
+def test_deshabilitar_conserva_la_instrumentacion_previa():
+    # La instrumentación habilitada antes que las métricas sigue habilitada al deshabilitarlas
+    motor.instrumentacion_configurar(activa=True)
+    try:
+        motor.metricas_habilitar()
+        motor.metricas_habilitar(False)
+        assert instrumentacion.instrumentacion_activa
+    finally:
+        motor.instrumentacion_configurar(activa=False)
@@ -0,0 +1,70 @@
+"""
+Pruebas de la cola de reposición y del libro de movimientos de stock (ver reposicion.py y movimientos.py)
+
+Después de cada operación que modifica el stock, la cola mantenida por triggers debe contener exactamente
+los materiales con stock inferior a su nivel de reposición, y el stock de cada material debe coincidir
+con la suma de sus movimientos y con el que reconstruye el libro a partir de las instantáneas.
+"""
+
+from datetime import date, timedelta
+import sqlite3
+
+import pytest
+
+import gemprop_motor as motor
+
+
+def verificar_cola_y_libro(conexion_bd):
+    materiales = conexion_bd.execute("SELECT id, stock_actual, stock_reposicion FROM materiales ORDER BY id").fetchall()
+    bajo_nivel = {id_material for id_material, stock, nivel in materiales if stock < nivel}
+    assert {fila[0] for fila in conexion_bd.execute("SELECT id_material FROM cola_de_reposicion")} == bajo_nivel
+    assert {registro[0] for registro in motor.reposicion_recuperar_cola(conexion_bd)} == bajo_nivel
+
+    libro = dict(conexion_bd.execute("SELECT id_material, SUM(cantidad) FROM movimientos_de_stock GROUP BY id_material"))
+    assert {id_material: stock for id_material, stock, nivel in materiales} == {id_material: libro.get(id_material, 0) for id_material, stock, nivel in materiales}
+    assert motor.movimientos_stock_a_la_fecha(conexion_bd, date.today() + timedelta(days=1)) == [(id_material, stock) for id_material, stock, nivel in materiales]
+
+def test_cola_y_libro_coinciden_con_el_stock(conexion_bd):
+    verificar_cola_y_libro(conexion_bd)
+    ids_productos = [registro[0] for registro in motor.productos_recuperar_productos(conexion_bd)]
+
+    # Pedidos confirmados, con y sin demora
+    for id_producto in ids_productos[:5]:
+        assert motor.pedidos_procesar_pedido_multiple(conexion_bd, [(id_producto, 3)])["confirmado"]
+    verificar_cola_y_libro(conexion_bd)
+
+    # Emisión de órdenes de compra, y recepción de todas ellas (con una nueva emisión) cuando llega su fecha de entrega
+    hoy = date.today()
+    reposicion = motor.pedidos_actualizar_stock(conexion_bd, hoy)
+    assert reposicion["ordenes_emitidas"] > 0
+    verificar_cola_y_libro(conexion_bd)
+    reposicion = motor.pedidos_actualizar_stock(conexion_bd, hoy + timedelta(days=60))
+    assert reposicion["ordenes_recibidas"] > 0
+    assert conexion_bd.execute("SELECT COUNT(*) FROM ordenes_de_compra WHERE fecha_recepcion IS NULL AND fecha_emision = ?", (hoy.isoformat(),)).fetchone()[0] == 0
+    verificar_cola_y_libro(conexion_bd)
+
+    # Ajustes manuales del stock y del nivel de reposición
+    for registro in motor.materiales_buscar_materiales(conexion_bd, [1, 2, 3]):
+        id_material, descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion = registro
+        assert motor.materiales_actualizar_registro_material(conexion_bd, id_material, descripcion, stock_actual + 7, stock_actual + 20, demora_reposicion, cantidad_reposicion)
+    verificar_cola_y_libro(conexion_bd)
+
+    # Alta y baja de un material por debajo de su nivel de reposición
+    assert motor.materiales_insertar_registro_material(conexion_bd, "Material de prueba", 2, 5, 1, 10)
+    verificar_cola_y_libro(conexion_bd)
+    assert motor.materiales_eliminar_registro_material(conexion_bd, motor.materiales_buscar_id_por_descripcion(conexion_bd, "Material de prueba"))
+    verificar_cola_y_libro(conexion_bd)
+
+    # Más pedidos después de una instantánea: el stock se reconstruye desde ella
+    assert motor.movimientos_registrar_instantanea(conexion_bd) is not None
+    for id_producto in ids_productos[5:10]:
+        assert motor.pedidos_procesar_pedido_multiple(conexion_bd, [(id_producto, 2)])["confirmado"]
+    verificar_cola_y_libro(conexion_bd)
+
+def test_libro_no_admite_modificaciones(conexion_bd):
+    with pytest.raises(sqlite3.IntegrityError):
+        conexion_bd.execute("UPDATE movimientos_de_stock SET cantidad = cantidad + 1")
+    with pytest.raises(sqlite3.IntegrityError):
+        conexion_bd.execute("DELETE FROM movimientos_de_stock")
+    conexion_bd.rollback()
+    verificar_cola_y_libro(conexion_bd)
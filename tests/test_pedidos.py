@@ -0,0 +1,89 @@
+"""
+Pruebas de la confirmación atómica de pedidos (ver pedidos.py)
+"""
+
+import gemprop_motor as motor
+
+
+def leer_estado(conexion_bd):
+    # Stock de los materiales, pedidos, líneas y movimientos de consumo, leídos sin pasar por las memorias del motor
+    return {
+        "stock": dict(conexion_bd.execute("SELECT id, stock_actual FROM materiales")),
+        "pedidos": conexion_bd.execute("SELECT COUNT(*) FROM pedidos").fetchone()[0],
+        "lineas": conexion_bd.execute("SELECT COUNT(*) FROM lineas_de_pedido").fetchone()[0],
+        "consumos": conexion_bd.execute("SELECT COUNT(*) FROM movimientos_de_stock WHERE tipo = 'consumo'").fetchone()[0]
+    }
+
+def productos_con_materiales(conexion_bd, cantidad):
+    # Ids de los primeros productos cuya explosión tiene al menos dos materiales
+    ids_productos = [registro[0] for registro in motor.productos_recuperar_productos(conexion_bd)]
+    explosiones = motor.explosion_de_productos(conexion_bd, ids_productos)
+    return [id_producto for id_producto in ids_productos if len(explosiones[id_producto]) >= 2][:cantidad]
+
+def test_confirmar_pedido_descuenta_la_explosion(conexion_bd):
+    id_producto, id_otro_producto = productos_con_materiales(conexion_bd, 2)
+    lineas = [(id_producto, 2), (id_otro_producto, 1), (id_producto, 1)]
+    anterior = leer_estado(conexion_bd)
+
+    pedido = motor.pedidos_calcular_pedido_multiple(conexion_bd, lineas)
+    assert pedido is not None
+    assert motor.pedidos_confirmar_pedido(conexion_bd, pedido)
+
+    # Cada material se descuenta una vez, con las unidades de la explosión de todas las líneas del pedido
+    requeridas = {}
+    for id_linea, cantidad in lineas:
+        for id_material, unidades in motor.explosion_de_materiales(conexion_bd, id_linea).items():
+            requeridas[id_material] = requeridas.get(id_material, 0) + unidades * cantidad
+    posterior = leer_estado(conexion_bd)
+    assert {material[0]: material[3] for material in pedido["materiales"]} == requeridas
+    assert posterior["stock"] == {id_material: stock - requeridas.get(id_material, 0) for id_material, stock in anterior["stock"].items()}
+    consumos = conexion_bd.execute("SELECT id_material, cantidad FROM movimientos_de_stock WHERE tipo = 'consumo' AND referencia = ?", (pedido["id_pedido"],)).fetchall()
+    assert dict(consumos) == {id_material: -unidades for id_material, unidades in requeridas.items()}
+
+    # El pedido queda en el historial con una línea por producto, y el catálogo en memoria refleja el stock confirmado
+    assert sorted((registro[0], registro[2]) for registro in motor.pedidos_recuperar_lineas(conexion_bd, pedido["id_pedido"])) == sorted([(id_producto, 3), (id_otro_producto, 1)])
+    assert {registro[0]: registro[2] for registro in motor.materiales_buscar_materiales(conexion_bd, list(requeridas))} == {
+        id_material: posterior["stock"][id_material] for id_material in requeridas
+    }
+
+def test_confirmar_pedido_con_error_no_modifica_nada(conexion_bd):
+    id_producto = productos_con_materiales(conexion_bd, 1)[0]
+    pedido = motor.pedidos_calcular_pedido_multiple(conexion_bd, [(id_producto, 1)])
+    anterior = leer_estado(conexion_bd)
+
+    # El consumo del último material del pedido falla: los pedidos, las líneas y los consumos anteriores se deshacen
+    id_material_con_error = pedido["materiales"][-1][0]
+    conexion_bd.execute(f"""
+        CREATE TEMP TRIGGER consumo_con_error BEFORE INSERT ON movimientos_de_stock
+        WHEN NEW.tipo = 'consumo' AND NEW.id_material = {id_material_con_error}
+        BEGIN
+            SELECT RAISE(ABORT, 'Error simulado');
+        END""")
+    assert not motor.pedidos_confirmar_pedido(conexion_bd, pedido)
+    assert not conexion_bd.in_transaction
+    assert leer_estado(conexion_bd) == anterior
+    assert "id_pedido" not in pedido
+    ids_materiales = [material[0] for material in pedido["materiales"]]
+    assert {registro[0]: registro[2] for registro in motor.materiales_buscar_materiales(conexion_bd, ids_materiales)} == {
+        id_material: anterior["stock"][id_material] for id_material in ids_materiales
+    }
+
+    # Sin el error, el mismo pedido se confirma
+    conexion_bd.execute("DROP TRIGGER consumo_con_error")
+    assert motor.pedidos_confirmar_pedido(conexion_bd, pedido)
+    assert leer_estado(conexion_bd)["pedidos"] == anterior["pedidos"] + 1
+
+def test_procesar_pedido_con_demora_no_aceptada(conexion_bd):
+    id_producto = productos_con_materiales(conexion_bd, 1)[0]
+    anterior = leer_estado(conexion_bd)
+
+    # Un pedido mayor que el stock de cualquier material tiene demora, y sin aceptarla no se confirma
+    pedido = motor.pedidos_procesar_pedido_multiple(conexion_bd, [(id_producto, 1000)], aceptar_demora=False)
+    assert pedido["demora_planificada"]
+    assert not pedido["confirmado"]
+    assert not conexion_bd.in_transaction
+    assert leer_estado(conexion_bd) == anterior
+
+    pedido = motor.pedidos_procesar_pedido_multiple(conexion_bd, [(id_producto, 1000)])
+    assert pedido["confirmado"]
+    assert leer_estado(conexion_bd)["pedidos"] == anterior["pedidos"] + 1
@@ -0,0 +1,56 @@
+"""
+Pruebas de la planificación de requerimientos de materiales (ver planificacion.py)
+
+Los requerimientos que calcula la planificación con matrices dispersas deben coincidir con los que
+resultan de sumar la explosión memorizada de cada producto (ver explosion.py).
+"""
+
+from datetime import date, timedelta
+
+import pytest
+
+import gemprop_motor as motor
+
+
+pytest.importorskip("numpy")
+
+
+def test_planificacion_coincide_con_la_explosion(conexion_bd):
+    # Órdenes de compra pendientes para los materiales de la cola de reposición
+    assert motor.pedidos_actualizar_stock(conexion_bd)["ordenes_emitidas"] > 0
+
+    ids_productos = [registro[0] for registro in motor.productos_recuperar_productos(conexion_bd)]
+    demanda = {id_producto: 1 + posicion % 4 for posicion, id_producto in enumerate(ids_productos) if posicion % 3 != 1}
+    fecha = date(2030, 1, 1)
+    resultado = motor.planificacion_ejecutar(conexion_bd, demanda, fecha)
+    assert resultado is not None
+    assert resultado["productos_demandados"] == len(demanda)
+
+    bruto = {}
+    for id_producto, cantidad in demanda.items():
+        for id_material, unidades in motor.explosion_de_materiales(conexion_bd, id_producto).items():
+            bruto[id_material] = bruto.get(id_material, 0) + unidades * cantidad
+    assert resultado["materiales_requeridos"] == len(bruto)
+
+    pendiente = dict(conexion_bd.execute("SELECT id_material, SUM(cantidad) FROM ordenes_de_compra WHERE fecha_recepcion IS NULL GROUP BY id_material"))
+    faltantes = []
+    compras = []
+    for id_material, descripcion, stock_actual, stock_reposicion, demora_reposicion, cantidad_reposicion in motor.materiales_recuperar_materiales(conexion_bd):
+        requerido = bruto.get(id_material, 0)
+        stock_actual = max(stock_actual, 0)
+        neto = max(requerido - stock_actual, 0)
+        faltante = max(neto - pendiente.get(id_material, 0), 0)
+        if faltante > 0:
+            faltantes.append((id_material, requerido, stock_actual, pendiente.get(id_material, 0), neto, faltante))
+        a_comprar = stock_reposicion - (stock_actual + pendiente.get(id_material, 0) - requerido)
+        if a_comprar > 0:
+            compras.append((id_material, -(-a_comprar // cantidad_reposicion) * cantidad_reposicion, fecha + timedelta(days=demora_reposicion)))
+    assert faltantes
+    assert resultado["faltantes"] == faltantes
+    assert resultado["compras_sugeridas"] == compras
+
+def test_planificacion_ignora_productos_inexistentes(conexion_bd):
+    id_producto = motor.productos_recuperar_productos(conexion_bd)[0][0]
+    resultado = motor.planificacion_ejecutar(conexion_bd, {id_producto: 2, 999999: 5})
+    assert resultado["productos_demandados"] == 1
+    assert resultado["materiales_requeridos"] == len(motor.explosion_de_materiales(conexion_bd, id_producto))
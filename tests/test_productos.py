@@ -0,0 +1,72 @@
+"""
+Pruebas de la baja de productos y de la asociación de subproductos (ver productos.py)
+
+La verificación y las modificaciones se ejecutan en una única transacción: un error o una verificación
+que no se cumple no deben dejar cambios parciales en el BOM.
+"""
+
+import gemprop_motor as motor
+
+
+def leer_bom(conexion_bd):
+    # Relaciones del BOM y productos, leídos sin pasar por las memorias del motor
+    return {
+        "productos": conexion_bd.execute("SELECT id FROM productos ORDER BY id").fetchall(),
+        "materiales": conexion_bd.execute("SELECT id_producto, id_material, cantidad_de_unidades FROM materiales_por_producto ORDER BY id_producto, id_material").fetchall(),
+        "subproductos": conexion_bd.execute("SELECT id_producto, id_subproducto, cantidad_de_unidades FROM productos_por_producto ORDER BY id_producto, id_subproducto").fetchall()
+    }
+
+def producto_con_subproducto(conexion_bd):
+    # Un producto con materiales propios que usa un subproducto, y ese subproducto
+    return conexion_bd.execute("""
+        SELECT id_producto, id_subproducto FROM productos_por_producto
+        WHERE id_producto IN (SELECT id_producto FROM materiales_por_producto)
+        ORDER BY id_producto LIMIT 1""").fetchone()
+
+def test_eliminar_producto_con_error_no_modifica_nada(conexion_bd):
+    id_producto, id_subproducto = producto_con_subproducto(conexion_bd)
+    anterior = leer_bom(conexion_bd)
+
+    # Un subproducto de otro producto no puede eliminarse
+    assert not motor.productos_eliminar_registro_producto(conexion_bd, id_subproducto)
+    assert not conexion_bd.in_transaction
+    assert leer_bom(conexion_bd) == anterior
+
+    # La baja del producto falla después de borrar sus relaciones: las relaciones se restauran
+    conexion_bd.execute(f"""
+        CREATE TEMP TRIGGER baja_con_error BEFORE DELETE ON productos
+        WHEN OLD.id = {id_producto}
+        BEGIN
+            SELECT RAISE(ABORT, 'Error simulado');
+        END""")
+    assert not motor.productos_eliminar_registro_producto(conexion_bd, id_producto)
+    assert not conexion_bd.in_transaction
+    assert leer_bom(conexion_bd) == anterior
+    assert motor.productos_buscar_producto(conexion_bd, id_producto)
+
+    # Sin el error, el producto se elimina junto con sus relaciones
+    conexion_bd.execute("DROP TRIGGER baja_con_error")
+    assert motor.productos_eliminar_registro_producto(conexion_bd, id_producto)
+    posterior = leer_bom(conexion_bd)
+    assert (id_producto,) not in posterior["productos"]
+    assert all(relacion[0] != id_producto for relacion in posterior["materiales"])
+    assert all(relacion[0] != id_producto for relacion in posterior["subproductos"])
+    assert motor.productos_buscar_producto(conexion_bd, id_producto) == []
+
+def test_asociar_subproducto_rechaza_ciclos(conexion_bd):
+    id_producto, id_subproducto = producto_con_subproducto(conexion_bd)
+    anterior = leer_bom(conexion_bd)
+
+    for id_componente, id_compuesto in ((id_producto, id_subproducto), (id_producto, id_producto)):
+        assert not motor.productos_asociar_subproducto_a_producto(conexion_bd, id_compuesto, id_componente, 1)
+        assert not conexion_bd.in_transaction
+    assert leer_bom(conexion_bd) == anterior
+
+    # Un producto que no usa al otro en ningún nivel puede asociarse, y la explosión memorizada se actualiza
+    ids_productos = [registro[0] for registro in motor.productos_recuperar_productos(conexion_bd)]
+    explosiones = motor.explosion_de_productos(conexion_bd, ids_productos)
+    assert motor.productos_insertar_registro_producto(conexion_bd, "Producto de prueba") is not None
+    id_nuevo = motor.productos_buscar_id_por_descripcion(conexion_bd, "Producto de prueba")
+    assert motor.productos_asociar_subproducto_a_producto(conexion_bd, id_nuevo, id_producto, 2)
+    assert motor.explosion_de_materiales(conexion_bd, id_nuevo) == {id_material: unidades * 2 for id_material, unidades in explosiones[id_producto].items()}
+    assert not motor.productos_asociar_subproducto_a_producto(conexion_bd, id_producto, id_nuevo, 1)
@@ -0,0 +1,51 @@
+"""
+Pruebas de la simulación de escenarios de pedidos (ver simulacion.py)
+
+Un pedido aislado debe esperar exactamente a los materiales de su explosión (ver explosion.py) que no
+tienen stock suficiente, lo mismo que cotiza la proyección ATP para ese pedido (ver atp.py), y la
+simulación en paralelo debe dar los mismos resultados que la simulación en el proceso actual.
+"""
+
+from datetime import date
+
+import gemprop_motor as motor
+
+
+def test_pedido_aislado_coincide_con_la_explosion(conexion_bd):
+    modelo = motor.simulacion_cargar(conexion_bd, date.today())
+    assert modelo["llegadas"] == []
+    ids_productos = [registro[0] for registro in motor.productos_recuperar_productos(conexion_bd)]
+
+    demorados = 0
+    for id_producto in ids_productos:
+        for cantidad in (1, 5):
+            # Sin órdenes pendientes, el pedido espera la mayor demora de reposición de los materiales que no alcanzan
+            explosion = motor.explosion_de_materiales(conexion_bd, id_producto)
+            faltantes = [id_material for id_material, unidades in explosion.items() if modelo["materiales"][id_material][0] < unidades * cantidad]
+            espera = max((modelo["materiales"][id_material][2] for id_material in faltantes), default=0)
+            demorados += espera > 0
+
+            resultado = motor.simulacion_simular(modelo, [(0, id_producto, cantidad)])
+            tiempo_confeccion = modelo["tiempos_de_confeccion"][id_producto]
+            assert resultado["pedidos"] == [(0, id_producto, cantidad, 0, tiempo_confeccion, espera + tiempo_confeccion, espera)]
+
+            pedido = motor.pedidos_calcular_pedido_multiple(conexion_bd, [(id_producto, cantidad)])
+            assert pedido["demora_planificada"] == bool(faltantes)
+            assert pedido["demora_maxima"] == espera
+            assert {material[0]: material[3] for material in pedido["materiales"]} == {id_material: unidades * cantidad for id_material, unidades in explosion.items()}
+    assert demorados > 0
+
+    # La simulación no modifica el modelo
+    assert motor.simulacion_cargar(conexion_bd, date.today())["materiales"] == modelo["materiales"]
+
+def test_simulacion_en_paralelo_coincide_con_la_secuencial(conexion_bd):
+    ids_productos = [registro[0] for registro in motor.productos_recuperar_productos(conexion_bd)]
+    escenarios = [
+        [(dia, ids_productos[(semilla * 7 + dia) % len(ids_productos)], 1 + (semilla + dia) % 3) for dia in range(0, 12, 2)]
+        for semilla in range(4)
+    ]
+    fecha_base = date.today()
+    modelo = motor.simulacion_cargar(conexion_bd, fecha_base)
+
+    resultados = motor.simulacion_simular_escenarios(conexion_bd, escenarios, procesos=2, fecha_base=fecha_base)
+    assert resultados == [motor.simulacion_simular(modelo, escenario) for escenario in escenarios]
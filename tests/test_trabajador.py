@@ -0,0 +1,40 @@
+"""
+Pruebas del trabajador de base de datos en segundo plano (ver trabajador.py)
+
+Las funciones de preparación deben ejecutarse en cada conexión que atiende lecturas antes de su primera
+lectura, de forma que las búsquedas por texto encuentren el índice de palabras ya construido en la misma
+conexión que las responde.
+"""
+
+import time
+
+import pytest
+
+import gemprop_motor as motor
+from gemprop_motor import catalogo
+
+
+def esperar_resultados(trabajador):
+    # Entrega los resultados de los trabajos encolados hasta que no quede ninguno pendiente
+    while motor.trabajador_entregar_resultados(trabajador) > 0:
+        time.sleep(0.01)
+
+@pytest.mark.parametrize("perfil", ["predeterminado", "concurrente"])
+def test_busquedas_en_conexiones_preparadas(ruta_base_generada, perfil):
+    trabajador = motor.crear_trabajador(ruta_base_generada, perfil, preparar_lecturas=[motor.catalogo_preparar_busqueda])
+    assert trabajador is not None
+
+    resultados = []
+    for texto in ("", "mat", "material 00000", "ma"):
+        motor.trabajador_encolar(trabajador, motor.materiales_buscar_por_texto, texto, 5, al_terminar=resultados.append, lectura=True)
+    esperar_resultados(trabajador)
+    assert [len(registros) for registros in resultados] == [5, 5, 5, 5]
+
+    # Todas las conexiones que atienden lecturas tienen los índices de materiales y productos construidos
+    conexiones = [trabajador["conexion_bd"]] if trabajador["lectores"] is None else list(trabajador["lectores"].queue)
+    assert len(conexiones) == max(motor.PERFILES_DE_CONEXION[perfil]["lectores"], 1)
+    for conexion in conexiones:
+        tablas = catalogo.catalogos_por_conexion[conexion]["tablas"]
+        assert tablas["materiales"]["indice_de_palabras"] is not None
+        assert tablas["productos"]["indice_de_palabras"] is not None
+    motor.trabajador_detener(trabajador)